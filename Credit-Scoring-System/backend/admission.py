@@ -0,0 +1,171 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# ADMISSION CONTROL: TÍNH TOÁN GIỚI HẠN + TỪ CHỐI SỚM KHI QUÁ TẢI
+# Route /predict chạy async; phần tốn CPU (feature, LightGBM, SHAP) được đẩy sang ComputeExecutor
+# với số thread cố định. Hàng đợi phía trước có độ sâu tối đa và mỗi request có deadline:
+# - hàng đợi đầy -> Overloaded("queue_full") -> 429 ngay lập tức
+# - đến lượt tính mà đã quá deadline -> Overloaded("deadline") -> 503, không tốn CPU cho request
+#   mà client có lẽ đã bỏ đi
+# Cả hai kèm Retry-After ước lượng từ độ dài hàng đợi và thời gian tính trung bình.
+# Nhờ vậy khi quá tải, request được nhận vẫn có độ trễ bị chặn (≈ deadline + thời gian tính).
+
+# Giới hạn Retry-After (giây)
+RETRY_AFTER_MIN = 1
+RETRY_AFTER_MAX = 30
+
+class Overloaded(Exception):
+    """Request bị từ chối do quá tải. reason: "queue_full" (429) hoặc "deadline" (503)."""
+
+    STATUS_CODES = {"queue_full": 429, "deadline": 503}
+
+    def __init__(self, reason, retry_after=RETRY_AFTER_MIN):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self):
+        return self.STATUS_CODES[self.reason]
+
+def estimate_retry_after(backlog, service_seconds, workers):
+    """Số giây (làm tròn lên) để xử lý hết `backlog` tác vụ với `workers` luồng tính."""
+    seconds = backlog * service_seconds / max(1, workers)
+    return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(seconds))))
+
+class ComputeExecutor:
+    """
+    Thread pool cho tác vụ tốn CPU, có hàng đợi giới hạn và deadline cho từng tác vụ.
+
+    max_workers: số tác vụ tính song song (LightGBM/NumPy nhả GIL khi tính).
+    max_queue: số tác vụ tối đa đang chờ (0 = không giới hạn).
+    """
+
+    # Hệ số làm mượt trung bình thời gian tính (EWMA) để ước lượng Retry-After
+    SERVICE_SMOOTHING = 0.2
+
+    def __init__(self, max_workers=2, max_queue=256, name="scoring"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        # Future của các tác vụ chưa xong (chờ + đang tính), bỏ ra khi Future xong hoặc bị hủy
+        # -> số tác vụ chờ = len(_tasks) - _running, không bị lệch dần như 1 bộ đếm tăng/giảm ở 2 nơi
+        self._tasks = set()
+        self._running = 0
+        self._service_seconds = 0.0
+
+        # Thống kê
+        self.completed = 0
+        self.rejected = {reason: 0 for reason in Overloaded.STATUS_CODES}
+
+    def queued(self):
+        """Số tác vụ đang chờ."""
+        return max(0, len(self._tasks) - self._running)
+
+    def running(self):
+        """Số tác vụ đang tính."""
+        return self._running
+
+    def retry_after(self, backlog=None):
+        backlog = len(self._tasks) if backlog is None else backlog
+        return estimate_retry_after(backlog + 1, self._service_seconds, self.max_workers)
+
+    def reject(self, reason, backlog=None):
+        """Ghi nhận và trả về Overloaded (để raise) cho 1 request bị từ chối."""
+        with self._lock:
+            self.rejected[reason] += 1
+        return Overloaded(reason, self.retry_after(backlog))
+
+    def submit(self, fn, *args, deadline=None, kind="predict", bounded=True):
+        """
+        Đưa fn(*args) vào hàng đợi, trả về concurrent.futures.Future.
+        deadline: mốc time.monotonic(); đến lượt mà đã quá mốc thì Future nhận Overloaded("deadline").
+        bounded=False: bỏ qua giới hạn hàng đợi (tác vụ nội bộ đã tự giới hạn, VD micro-batch).
+        """
+        with self._lock:
+            if bounded and self.max_queue and self.queued() >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise Overloaded("queue_full", self.retry_after())
+            future = self._executor.submit(self._call, fn, args, time.monotonic(), deadline, kind)
+            self._tasks.add(future)
+        # Gọi cả khi Future bị hủy trước khi chạy (client ngắt kết nối / timeout -> asyncio.wrap_future hủy
+        # Future, _call không bao giờ chạy) -> chỗ trong hàng đợi luôn được trả lại
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._tasks.discard(future)
+
+    async def run(self, fn, *args, deadline=None, kind="predict"):
+        """Như submit nhưng await được từ route async."""
+        return await asyncio.wrap_future(self.submit(fn, *args, deadline=deadline, kind=kind))
+
+    def _call(self, fn, args, enqueued, deadline, kind):
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+        try:
+            metrics.QUEUE_WAIT_SECONDS.observe(started - enqueued, kind)
+            if deadline is not None and started > deadline:
+                raise self.reject("deadline")
+            result = fn(*args)
+            elapsed = time.monotonic() - started
+            metrics.COMPUTE_SECONDS.observe(elapsed, kind)
+            self._service_seconds += self.SERVICE_SMOOTHING * (elapsed - self._service_seconds)
+            self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued(),
+            "running": self._running,
+            "completed": self.completed,
+            "rejected": dict(self.rejected),
+            "avg_compute_ms": 1000 * self._service_seconds,
+        }
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI từ chối sớm: khi hàng đợi đã đầy, request POST vào `paths` nhận 429 ngay,
+    trước khi đọc body / parse JSON / validate -> khi quá tải, request bị từ chối gần như không tốn CPU
+    và event loop còn sức phục vụ request được nhận. check() trả về Overloaded (từ chối) hoặc None.
+    """
+
+    def __init__(self, app, check, paths):
+        self.app = app
+        self.check = check
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            exc = self.check()
+            if exc is not None:
+                metrics.SHED_REQUESTS.inc(scope["path"], exc.reason)
+                # Đọc bỏ body (không parse) để giữ được kết nối keep-alive
+                message = {"more_body": True}
+                while message.get("more_body") and message.get("type") != "http.disconnect":
+                    message = await receive()
+                body = json.dumps(
+                    {"detail": "Hệ thống đang quá tải: hàng đợi đã đầy.", "reason": exc.reason}, ensure_ascii=False
+                ).encode()
+                await send({
+                    "type": "http.response.start", "status": exc.status_code,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"retry-after", str(exc.retry_after).encode())],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,190 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+import metrics
+from admission import Overloaded
+
+# Các mốc (bucket) kích thước batch để thống kê phân bố
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+def _resolve(future, result=None, exception=None):
+    """
+    Trả kết quả cho 1 Future. Future đã bị hủy (client ngắt kết nối -> awaiter asyncio bị hủy) hoặc đã có
+    kết quả thì bỏ qua, để 1 Future lỗi không làm các request còn lại trong batch bị treo.
+    """
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+class MicroBatcher:
+    """
+    Gom các request /predict đồng thời thành một batch để chấm điểm bằng 1 lần gọi model.
+
+    - Mỗi request gọi submit() và nhận về một Future chứa kết quả của riêng nó.
+    - Một thread nền lấy request đầu tiên trong hàng đợi, chờ thêm tối đa max_wait_ms
+      (hoặc đến khi đủ max_batch_size) rồi gọi process_batch(items) -> list kết quả.
+    - Thích ứng theo tải: khi hệ thống rảnh (batch trước chỉ có 1 request và hàng đợi trống)
+      thì chấm ngay, không chờ, để request lẻ không bị cộng thêm độ trễ.
+    - executor (admission.ComputeExecutor): batch được chấm trong executor, tối đa max_workers batch
+      cùng lúc; khi mọi luồng tính đều bận, request tiếp tục dồn vào batch sau -> batch lớn dần theo tải.
+    - max_queue: hàng đợi đầy -> submit() ném Overloaded("queue_full"); request quá deadline khi
+      đến lượt -> Future nhận Overloaded("deadline") và không được chấm.
+    """
+
+    def __init__(self, process_batch, max_batch_size=64, max_wait_ms=2.0, executor=None, max_queue=0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_queue = max_queue
+        self._slots = threading.Semaphore(executor.max_workers) if executor is not None else None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_batch_size = 0
+
+        # Thống kê
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def submit(self, item, deadline=None):
+        """Đưa 1 request vào hàng đợi, trả về Future của request đó. deadline: mốc time.monotonic()."""
+        depth = self._queue.qsize()
+        if self.max_queue and depth >= self.max_queue:
+            raise self._reject("queue_full", depth)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.monotonic(), deadline))
+        depth += 1
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def _ensure_worker(self):
+        # Khởi động thread nền ở lần submit đầu tiên (an toàn khi fork nhiều worker)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        # Chỉ chờ gom thêm khi đang có tải đồng thời
+        if self._last_batch_size > 1 or not self._queue.empty():
+            deadline = first[2] + self.max_wait
+        else:
+            deadline = first[2]
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _reject(self, reason, depth):
+        # Ước lượng Retry-After theo số batch còn phải chấm
+        if self.executor is not None:
+            return self.executor.reject(reason, math.ceil(depth / self.max_batch_size))
+        return Overloaded(reason)
+
+    def _run(self):
+        while True:
+            if self._slots is not None:
+                # Chỉ gom batch mới khi có luồng tính rảnh
+                self._slots.acquire()
+            batch = self._collect()
+            started = time.monotonic()
+            self._record(batch, started)
+            batch = self._drop_expired(batch, started)
+            if self.executor is None:
+                self._process(batch)
+            elif not batch:
+                self._slots.release()
+            else:
+                future = self.executor.submit(self._process, batch, kind="micro_batch", bounded=False)
+                future.add_done_callback(lambda _: self._slots.release())
+
+    def _drop_expired(self, batch, started):
+        alive = []
+        for entry in batch:
+            deadline = entry[3]
+            if entry[1].cancelled():
+                continue
+            if deadline is not None and started > deadline:
+                _resolve(entry[1], exception=self._reject("deadline", self._queue.qsize()))
+            else:
+                alive.append(entry)
+        return alive
+
+    def _process(self, batch):
+        # Bỏ request đã bị hủy trong lúc chờ; request còn lại chuyển sang RUNNING (không hủy được nữa)
+        batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        items = [item for item, _, _, _ in batch]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            for _, future, _, _ in batch:
+                _resolve(future, exception=e)
+            return
+        for (_, future, _, _), result in zip(batch, results):
+            _resolve(future, result)
+
+    def _record(self, batch, started):
+        size = len(batch)
+        self._last_batch_size = size
+        waits = [started - enqueued for _, _, enqueued, _ in batch]
+        for wait in waits:
+            metrics.QUEUE_WAIT_SECONDS.observe(wait, "predict")
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+            for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+                if size <= bound:
+                    self._batch_size_counts[i] += 1
+                    break
+            else:
+                self._batch_size_counts[-1] += 1
+
+    def queue_depth(self):
+        """Số request đang chờ trong hàng đợi."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Số liệu hàng đợi: độ sâu, kích thước batch và thời gian chờ gom batch."""
+        with self._lock:
+            labels = [f"<={b}" for b in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(zip(labels, self._batch_size_counts)),
+                "avg_wait_ms": 1000 * self._wait_total / self._items if self._items else 0.0,
+                "max_wait_ms_observed": 1000 * self._wait_max,
+            }
@@ -0,0 +1,171 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_CORE_DIR = os.path.join(BASE_DIR, '../model_core')
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(1, MODEL_CORE_DIR)
+
+import pandas as pd
+
+# CHẤM ĐIỂM HÀNG LOẠT (OFFLINE) CẢ DANH MỤC HỒ SƠ TỪ FILE CSV/PARQUET
+# Cùng HARD RULES, feature engineering, model và FINAL_THRESHOLD/thang điểm như /predict
+# (dùng chung scoring.score_applications). File đầu vào được đọc theo từng chunk cố định,
+# nên RAM không phụ thuộc kích thước file. Các chunk được chấm song song trên nhiều tiến trình.
+#
+# VD: python bulk_score.py portfolio.parquet scored.parquet --workers 8 --explain top3 --keep-columns SK_ID_CURR
+
+from scoring import EXPLAIN_NONE, EXPLAIN_TOP3, INPUT_FIELDS, score_applications
+
+# Artifact native (model_core/artifact.py) nếu đã xuất, không thì cặp joblib .pkl
+ARTIFACT_PATH = os.path.join(MODEL_CORE_DIR, 'lgbm_credit_model_v3.artifact')
+MODEL_PATH = ARTIFACT_PATH if os.path.exists(ARTIFACT_PATH) else os.path.join(MODEL_CORE_DIR, 'lgbm_credit_model_v3.pkl')
+META_PATH = os.path.join(MODEL_CORE_DIR, 'model_metadata_v3.pkl')
+
+DEFAULT_CHUNK_SIZE = 50_000
+# Dấu phân cách các lý do trong cột "reasons"
+REASON_SEPARATOR = " | "
+
+# Model của từng tiến trình worker (tải 1 lần trong initializer)
+_worker = {}
+
+def read_chunks(path, chunk_size, columns):
+    """Đọc file CSV/Parquet theo từng chunk -> DataFrame (chỉ các cột cần)."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        # round_trip: đọc số thực chính xác như JSON của /predict (parser mặc định có thể lệch bit cuối)
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size, float_precision='round_trip')
+
+def init_worker(model_path, meta_path, engine, threads):
+    # Giới hạn thread OpenMP của LightGBM trước khi load model để các worker không tranh core
+    if threads:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    from model_loader import load_model, make_explainer
+    model, _, pipeline, predictor = load_model(model_path, meta_path, engine)
+    _worker.update(model=model, pipeline=pipeline, predictor=predictor, make_explainer=make_explainer)
+
+def _explainer():
+    if 'explainer' not in _worker:
+        _worker['explainer'] = _worker['make_explainer'](_worker['model'])
+    return _worker['explainer']
+
+def score_chunk(chunk, explain, keep_columns):
+    """Chấm 1 chunk (DataFrame) -> DataFrame kết quả (giữ nguyên thứ tự dòng)."""
+    columns = {field: chunk[field].to_numpy() for field in INPUT_FIELDS}
+    results = score_applications(columns, _worker['predictor'], _explainer, _worker['pipeline'], explain=explain)
+
+    out = chunk[keep_columns].reset_index(drop=True) if keep_columns else pd.DataFrame(index=range(len(chunk)))
+    out['status'] = [r['status'] for r in results]
+    out['probability'] = [r['probability'] for r in results]
+    out['credit_score'] = [r['credit_score'] for r in results]
+    out['message'] = [r['message'] for r in results]
+    out['reasons'] = [REASON_SEPARATOR.join(r['reasons']) if 'reasons' in r else None for r in results]
+    return out
+
+def scored_chunks(chunks, explain, keep_columns, workers, pool):
+    """Generator: chấm lần lượt (workers=1) hoặc song song, giữ tối đa 2 chunk/worker đang xử lý."""
+    if pool is None:
+        for chunk in chunks:
+            yield score_chunk(chunk, explain, keep_columns)
+        return
+    in_flight = deque()
+    for chunk in chunks:
+        in_flight.append(pool.apply_async(score_chunk, (chunk, explain, keep_columns)))
+        if len(in_flight) >= 2 * workers:
+            yield in_flight.popleft().get()
+    while in_flight:
+        yield in_flight.popleft().get()
+
+class OutputWriter:
+    """Ghi kết quả theo từng chunk ra CSV (append) hoặc Parquet (ParquetWriter)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._first = True
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                schema = table.schema
+                # Cột message/reasons có thể toàn None ở chunk đầu -> cố định kiểu string
+                for name in ('message', 'reasons'):
+                    schema = schema.set(schema.get_field_index(name), pa.field(name, pa.string()))
+                self._writer = pq.ParquetWriter(self.path, schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            df.to_csv(self.path, mode='w' if self._first else 'a', header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def bulk_score(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, explain=EXPLAIN_NONE,
+               keep_columns=(), engine="lightgbm", model_path=MODEL_PATH, meta_path=META_PATH):
+    """Chấm cả file, trả về (số dòng, số giây)."""
+    keep_columns = [c for c in keep_columns if c not in INPUT_FIELDS] if keep_columns else []
+    chunks = read_chunks(input_path, chunk_size, INPUT_FIELDS + keep_columns)
+    writer = OutputWriter(output_path)
+    # Mỗi worker 1 thread OpenMP; chạy 1 tiến trình thì để LightGBM dùng tất cả core
+    threads = 1 if workers > 1 else None
+
+    pool = None
+    if workers > 1:
+        # spawn: không fork tiến trình đã khởi tạo OpenMP/pyarrow
+        pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=init_worker, initargs=(model_path, meta_path, engine, threads)
+        )
+    else:
+        init_worker(model_path, meta_path, engine, threads)
+
+    start = time.perf_counter()
+    rows = 0
+    try:
+        for out in scored_chunks(chunks, explain, keep_columns, workers, pool):
+            writer.write(out)
+            rows += len(out)
+            elapsed = time.perf_counter() - start
+            print(f"   {rows:,} dòng | {elapsed:.1f}s | {rows / elapsed:,.0f} dòng/s")
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return rows, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chấm điểm tín dụng hàng loạt từ file CSV/Parquet.")
+    parser.add_argument('input', help="File đầu vào (.csv hoặc .parquet) có các cột của CreditApplication")
+    parser.add_argument('output', help="File kết quả (.csv hoặc .parquet)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Số dòng mỗi chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình chấm song song")
+    parser.add_argument('--explain', choices=[EXPLAIN_NONE, EXPLAIN_TOP3], default=EXPLAIN_NONE,
+                        help="top3: thêm 3 lý do SHAP vào cột reasons")
+    parser.add_argument('--keep-columns', default='', help="Các cột giữ lại từ file đầu vào, VD: SK_ID_CURR")
+    parser.add_argument('--engine', choices=['lightgbm', 'numpy'], default=os.getenv("INFERENCE_ENGINE", "lightgbm"))
+    parser.add_argument('--model', default=MODEL_PATH, help="File .artifact hoặc .pkl của joblib")
+    parser.add_argument('--meta', default=META_PATH, help="Metadata .pkl (bỏ qua khi --model là .artifact)")
+    args = parser.parse_args(argv)
+
+    keep_columns = [c.strip() for c in args.keep_columns.split(',') if c.strip()]
+    print(f"Chấm {args.input} -> {args.output} ({args.workers} worker, chunk {args.chunk_size:,}, explain={args.explain})")
+    rows, seconds = bulk_score(
+        args.input, args.output, args.chunk_size, args.workers, args.explain,
+        keep_columns, args.engine, args.model, args.meta
+    )
+    print(f"Xong: {rows:,} dòng trong {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} dòng/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_CORE_DIR = os.path.join(BASE_DIR, '../model_core')
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(1, MODEL_CORE_DIR)
+
+import numpy as np
+
+# BÁO CÁO GIẢI THÍCH TOÀN CỤC (OFFLINE) TRÊN CẢ DANH MỤC HỒ SƠ
+# Cùng HARD RULES, feature engineering, model, FINAL_THRESHOLD và explainer (EXPLAIN_BACKEND) như /predict.
+# File đầu vào được đọc theo từng chunk (giống bulk_score.py), các chunk được tính SHAP song song trên nhiều
+# tiến trình. Mỗi chunk chỉ trả về các tổng cộng dồn được (không giữ ma trận SHAP của cả danh mục):
+# - mean |SHAP| và mean SHAP của từng feature (toàn bộ và theo quyết định APPROVE/REJECT)
+# - đường phụ thuộc theo bin của từng feature: mean SHAP, độ lệch chuẩn SHAP, xác suất vỡ nợ trung bình
+#   (VD rủi ro theo Gánh nặng nợ / Thu nhập hay EXT_SOURCE_2)
+# - tần suất lý do (top 3 của get_top_reasons) theo quyết định và thứ hạng
+# Bin của feature số = phân vị trên hồ sơ qua luật của chunk đầu tiên; feature category = từng category.
+#
+# VD: python explain_report.py portfolio.parquet report.json --workers 8
+
+from bulk_score import MODEL_PATH, META_PATH, DEFAULT_CHUNK_SIZE, read_chunks
+from scoring import (
+    FINAL_THRESHOLD, INPUT_FIELDS, RULE_NAMES, RULE_PASS, FEATURE_NAME_MAP, REASON_TOP_K,
+    check_hard_rules, positive_class_base, positive_class_shap, serving_columns, top_reason_indices,
+)
+
+N_BINS = 20
+DECISIONS = ("APPROVE", "REJECT")
+
+# Model/explainer của từng tiến trình worker (tải 1 lần trong initializer)
+_worker = {}
+
+def init_worker(model_path, meta_path, engine, explain_backend, threads):
+    # Giới hạn thread OpenMP của LightGBM trước khi load model để các worker không tranh core
+    if threads:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    from model_loader import load_model, make_explainer
+    model, _, pipeline, predictor = load_model(model_path, meta_path, engine)
+    _worker.update(pipeline=pipeline, predictor=predictor, explainer=make_explainer(model, explain_backend))
+
+def bin_edges(X, cat_features, features, n_bins=N_BINS):
+    """
+    Bin của từng feature: feature category -> None (mỗi mã category 1 bin),
+    feature số -> ngưỡng phân vị (không trùng) trên ma trận mẫu X.
+    """
+    edges = []
+    for j, name in enumerate(features):
+        values = X[:, j][~np.isnan(X[:, j])]
+        if name in cat_features or len(values) == 0:
+            edges.append(None)
+        else:
+            edges.append(np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])))
+    return edges
+
+def bin_counts(edges, categories, features):
+    """Số bin của từng feature (bin cuối = giá trị thiếu)."""
+    return [len(categories.get(name, ())) + 1 if e is None else len(e) + 2 for name, e in zip(features, edges)]
+
+def bin_index(values, edges, n_bins):
+    """Chỉ số bin của từng giá trị (mã category hoặc bin phân vị), NaN -> bin cuối."""
+    missing = np.isnan(values)
+    if edges is None:
+        index = np.where(missing, 0, values).astype(np.int64)
+        # Mã category lạ (không có trong từ điển) cũng được tính vào bin thiếu, giống FeaturePipeline
+        missing |= (index < 0) | (index >= n_bins - 1)
+    else:
+        index = np.searchsorted(edges, np.where(missing, 0, values), side='right')
+    return np.where(missing, n_bins - 1, index)
+
+class ReportAggregate:
+    """Các tổng cộng dồn của báo cáo. Mỗi chunk tạo 1 bản, tiến trình chính gộp lại bằng merge()."""
+
+    def __init__(self, n_features, n_bins):
+        self.rows = 0
+        self.rule_rejections = np.zeros(len(RULE_NAMES) + 1, dtype=np.int64)
+        self.decisions = np.zeros(len(DECISIONS), dtype=np.int64)
+        # Theo quyết định x feature
+        self.abs_shap = np.zeros((len(DECISIONS), n_features))
+        self.sum_shap = np.zeros((len(DECISIONS), n_features))
+        self.sum_prob = np.zeros(len(DECISIONS))
+        # Theo feature x bin
+        self.bin_rows = [np.zeros(n, dtype=np.int64) for n in n_bins]
+        self.bin_value = [np.zeros(n) for n in n_bins]
+        self.bin_shap = [np.zeros(n) for n in n_bins]
+        self.bin_shap_sq = [np.zeros(n) for n in n_bins]
+        self.bin_prob = [np.zeros(n) for n in n_bins]
+        # Theo quyết định x thứ hạng lý do x feature (cột cuối: không có lý do đáng kể)
+        self.reasons = np.zeros((len(DECISIONS), REASON_TOP_K, n_features + 1), dtype=np.int64)
+        # Theo quyết định: hồ sơ không có lý do nào đáng kể ("Hồ sơ cân bằng, ...")
+        self.balanced = np.zeros(len(DECISIONS), dtype=np.int64)
+
+    def add(self, rule, X, probs, shap_values, edges, threshold):
+        self.rows += len(rule)
+        self.rule_rejections += np.bincount(rule, minlength=len(self.rule_rejections))
+        if len(probs) == 0:
+            return
+        reject = probs >= threshold
+        decision = reject.astype(np.int64)
+        self.decisions += np.bincount(decision, minlength=len(DECISIONS))
+        for d in range(len(DECISIONS)):
+            mask = decision == d
+            self.abs_shap[d] += np.abs(shap_values[mask]).sum(axis=0)
+            self.sum_shap[d] += shap_values[mask].sum(axis=0)
+            self.sum_prob[d] += probs[mask].sum()
+
+        for j, (rows, edge) in enumerate(zip(self.bin_rows, edges)):
+            n = len(rows)
+            index = bin_index(X[:, j], edge, n)
+            values = X[:, j]
+            rows += np.bincount(index, minlength=n)
+            self.bin_value[j] += np.bincount(index, np.where(np.isnan(values), 0, values), minlength=n)
+            self.bin_shap[j] += np.bincount(index, shap_values[:, j], minlength=n)
+            self.bin_shap_sq[j] += np.bincount(index, shap_values[:, j] ** 2, minlength=n)
+            self.bin_prob[j] += np.bincount(index, probs, minlength=n)
+
+        top = top_reason_indices(shap_values, reject)
+        self.balanced += np.bincount(decision[(top < 0).all(axis=1)], minlength=len(DECISIONS))
+        # -1 (không đáng kể) -> cột cuối
+        top = np.where(top < 0, self.reasons.shape[2] - 1, top)
+        for rank in range(top.shape[1]):
+            np.add.at(self.reasons, (decision, rank, top[:, rank]), 1)
+
+    def merge(self, other):
+        self.rows += other.rows
+        for name in ('rule_rejections', 'decisions', 'abs_shap', 'sum_shap', 'sum_prob', 'reasons', 'balanced'):
+            getattr(self, name).__iadd__(getattr(other, name))
+        for name in ('bin_rows', 'bin_value', 'bin_shap', 'bin_shap_sq', 'bin_prob'):
+            for mine, theirs in zip(getattr(self, name), getattr(other, name)):
+                mine += theirs
+        return self
+
+def explain_chunk(chunk, edges, n_bins, threshold):
+    """HARD RULES + predict + SHAP cho 1 chunk -> ReportAggregate của chunk."""
+    columns = {field: chunk[field].to_numpy() for field in INPUT_FIELDS}
+    rule, _, _ = check_hard_rules(columns['AMT_INCOME_TOTAL'], columns['AMT_CREDIT'], columns['AMT_ANNUITY'])
+    pipeline = _worker['pipeline']
+    aggregate = ReportAggregate(len(pipeline.features), n_bins)
+    passed = np.flatnonzero(rule == RULE_PASS)
+    if len(passed):
+        X = pipeline.transform(serving_columns(columns, passed))
+        probs = _worker['predictor'].predict_proba(X)[:, 1]
+        shap_values = positive_class_shap(_worker['explainer'].shap_values(X))
+    else:
+        X = np.empty((0, len(pipeline.features)))
+        probs = shap_values = np.empty(0)
+    aggregate.add(rule, X, probs, shap_values, edges, threshold)
+    return aggregate
+
+def _safe_div(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b > 0, a / np.maximum(b, 1), np.nan)
+
+def _floats(values):
+    """Mảng -> list số (NaN -> None, để ghi JSON hợp lệ)."""
+    return [None if np.isnan(v) else round(float(v), 6) for v in np.atleast_1d(np.asarray(values, dtype=np.float64))]
+
+def build_report(aggregate, features, edges, categories, base_value, threshold):
+    """ReportAggregate -> dict của file báo cáo."""
+    scored = aggregate.decisions.sum()
+    importance = []
+    for j, name in enumerate(features):
+        importance.append({
+            'feature': name,
+            'name': FEATURE_NAME_MAP.get(name, name),
+            'mean_abs_shap': _floats([aggregate.abs_shap[:, j].sum() / max(scored, 1)])[0],
+            'mean_shap': _floats([aggregate.sum_shap[:, j].sum() / max(scored, 1)])[0],
+            'by_decision': {
+                d: {'mean_abs_shap': _floats(_safe_div(aggregate.abs_shap[k, j], aggregate.decisions[k]))[0],
+                    'mean_shap': _floats(_safe_div(aggregate.sum_shap[k, j], aggregate.decisions[k]))[0]}
+                for k, d in enumerate(DECISIONS)
+            },
+        })
+    importance.sort(key=lambda item: -item['mean_abs_shap'])
+
+    dependence = {}
+    for j, (name, edge) in enumerate(zip(features, edges)):
+        rows = aggregate.bin_rows[j]
+        mean_shap = _safe_div(aggregate.bin_shap[j], rows)
+        variance = np.maximum(_safe_div(aggregate.bin_shap_sq[j], rows) - mean_shap ** 2, 0)
+        if edge is None:
+            labels = [str(c) for c in categories.get(name, ())] + ['missing']
+            mean_value = None
+        else:
+            bounds = [-np.inf] + list(edge) + [np.inf]
+            labels = [f"[{lo:.6g}, {hi:.6g})" for lo, hi in zip(bounds[:-1], bounds[1:])] + ['missing']
+            mean_value = _floats(_safe_div(aggregate.bin_value[j], rows))
+            mean_value[-1] = None
+        dependence[name] = {
+            'bins': labels,
+            'edges': None if edge is None else _floats(edge),
+            'rows': rows.tolist(),
+            'mean_value': mean_value,
+            'mean_shap': _floats(mean_shap),
+            'std_shap': _floats(np.sqrt(variance)),
+            'mean_probability': _floats(_safe_div(aggregate.bin_prob[j], rows)),
+        }
+
+    reasons = {}
+    for k, d in enumerate(DECISIONS):
+        by_rank = []
+        for rank in range(aggregate.reasons.shape[1]):
+            counts = aggregate.reasons[k, rank]
+            table = {features[j]: int(c) for j, c in enumerate(counts[:-1]) if c}
+            by_rank.append({'counts': dict(sorted(table.items(), key=lambda kv: -kv[1])), 'none': int(counts[-1])})
+        # Lý do ở bất kỳ thứ hạng nào (số hồ sơ có feature này trong top 3)
+        any_rank = aggregate.reasons[k, :, :-1].sum(axis=0)
+        reasons[d] = {
+            'rows': int(aggregate.decisions[k]),
+            'any_rank': {features[j]: int(any_rank[j]) for j in np.argsort(-any_rank, kind='stable') if any_rank[j]},
+            'by_rank': by_rank,
+            'balanced': int(aggregate.balanced[k]),
+        }
+
+    return {
+        'rows': int(aggregate.rows),
+        'threshold': float(threshold),
+        'shap_base_value': base_value,
+        'hard_rules': {RULE_NAMES[code]: int(aggregate.rule_rejections[code]) for code in RULE_NAMES},
+        'decisions': {
+            d: {'rows': int(aggregate.decisions[k]),
+                'mean_probability': _floats(_safe_div(aggregate.sum_prob[k], aggregate.decisions[k]))[0]}
+            for k, d in enumerate(DECISIONS)
+        },
+        'importance': importance,
+        'dependence': dependence,
+        'reasons': reasons,
+    }
+
+def chunk_aggregates(chunks, edges, n_bins, threshold, workers, pool):
+    """Generator: xử lý lần lượt (workers=1) hoặc song song, giữ tối đa 2 chunk/worker đang xử lý."""
+    if pool is None:
+        for chunk in chunks:
+            yield len(chunk), explain_chunk(chunk, edges, n_bins, threshold)
+        return
+    in_flight = deque()
+    for chunk in chunks:
+        in_flight.append((len(chunk), pool.apply_async(explain_chunk, (chunk, edges, n_bins, threshold))))
+        if len(in_flight) >= 2 * workers:
+            rows, result = in_flight.popleft()
+            yield rows, result.get()
+    while in_flight:
+        rows, result = in_flight.popleft()
+        yield rows, result.get()
+
+def explain_report(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, engine="lightgbm",
+                   explain_backend="native", model_path=MODEL_PATH, meta_path=META_PATH, n_bins=N_BINS,
+                   threshold=FINAL_THRESHOLD):
+    """Tạo báo cáo cho cả file, ghi JSON ra output_path. Trả về (báo cáo, số giây)."""
+    from model_loader import load_model, make_explainer, artifact_version, is_artifact
+    start = time.perf_counter()
+    chunks = read_chunks(input_path, chunk_size, INPUT_FIELDS)
+    # Tiến trình chính chỉ cần pipeline (bin của chunk đầu) và base value của explainer
+    model, metadata, pipeline, _ = load_model(model_path, meta_path, engine)
+    base_value = positive_class_base(make_explainer(model, explain_backend).expected_value)
+    features = pipeline.features
+
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError(f"File rỗng: {input_path}")
+    columns = {field: first[field].to_numpy() for field in INPUT_FIELDS}
+    rule, _, _ = check_hard_rules(columns['AMT_INCOME_TOTAL'], columns['AMT_CREDIT'], columns['AMT_ANNUITY'])
+    edges = bin_edges(pipeline.transform(serving_columns(columns, np.flatnonzero(rule == RULE_PASS))),
+                      pipeline.cat_features, features, n_bins)
+    counts = bin_counts(edges, pipeline.categories, features)
+
+    # Mỗi worker 1 thread OpenMP; chạy 1 tiến trình thì để LightGBM dùng tất cả core
+    threads = 1 if workers > 1 else None
+    init_args = (model_path, meta_path, engine, explain_backend, threads)
+    pool = None
+    if workers > 1:
+        # spawn: không fork tiến trình đã khởi tạo OpenMP/pyarrow
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_worker, initargs=init_args)
+    else:
+        init_worker(*init_args)
+
+    def all_chunks():
+        yield first
+        yield from chunks
+
+    total = ReportAggregate(len(features), counts)
+    scoring_start = time.perf_counter()
+    rows = 0
+    try:
+        for n, aggregate in chunk_aggregates(all_chunks(), edges, counts, threshold, workers, pool):
+            total.merge(aggregate)
+            rows += n
+            elapsed = time.perf_counter() - scoring_start
+            print(f"   {rows:,} dòng | {elapsed:.1f}s | {rows / elapsed:,.0f} dòng/s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    report = build_report(total, features, edges, pipeline.categories, base_value, threshold)
+    seconds = time.perf_counter() - start
+    report['run'] = {
+        'input': os.path.abspath(input_path),
+        'model': os.path.basename(model_path),
+        'model_version': artifact_version(*((model_path,) if is_artifact(model_path) else (model_path, meta_path))),
+        'explain_backend': explain_backend,
+        'workers': workers,
+        'chunk_size': chunk_size,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / max(time.perf_counter() - scoring_start, 1e-9), 1),
+    }
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, output_path)
+    return report, seconds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Báo cáo giải thích toàn cục (SHAP) trên cả danh mục hồ sơ.")
+    parser.add_argument('input', help="File đầu vào (.csv hoặc .parquet) có các cột của CreditApplication")
+    parser.add_argument('output', help="File báo cáo (.json)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Số dòng mỗi chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình tính SHAP song song")
+    parser.add_argument('--bins', type=int, default=N_BINS, help="Số bin phân vị của đường phụ thuộc")
+    parser.add_argument('--engine', choices=['lightgbm', 'numpy'], default=os.getenv("INFERENCE_ENGINE", "lightgbm"))
+    parser.add_argument('--explain-backend', choices=['native', 'shap'], default=os.getenv("EXPLAIN_BACKEND", "native"))
+    parser.add_argument('--model', default=MODEL_PATH, help="File .artifact hoặc .pkl của joblib")
+    parser.add_argument('--meta', default=META_PATH, help="Metadata .pkl (bỏ qua khi --model là .artifact)")
+    args = parser.parse_args(argv)
+
+    print(f"Báo cáo giải thích {args.input} -> {args.output} ({args.workers} worker, chunk {args.chunk_size:,})")
+    report, seconds = explain_report(
+        args.input, args.output, args.chunk_size, args.workers, args.engine, args.explain_backend,
+        args.model, args.meta, args.bins
+    )
+    print(f"Xong: {report['rows']:,} dòng trong {seconds:.1f}s ({report['run']['rows_per_second']:,.0f} dòng/s)")
+    print("Top feature (mean |SHAP|): " + ", ".join(
+        f"{item['feature']} {item['mean_abs_shap']:.4f}" for item in report['importance'][:5]))
+
+if __name__ == '__main__':
+    main()
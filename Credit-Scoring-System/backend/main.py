@@ -1,15 +1,51 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Header
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import asyncio
+import hmac
 import numpy as np
-import joblib
-import shap
 import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="HUST Bank Intelligent System", version="Final + SHAP")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_CORE_DIR = os.path.join(BASE_DIR, '../model_core')
+# Cho phép import các module cùng thư mục khi chạy "backend.main:app" (Docker) hoặc "main:app" (local)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(1, MODEL_CORE_DIR)
+
+from scoring import EXPLAIN_NONE, EXPLAIN_TOP3, EXPLAIN_FULL, applications_to_columns, scoring_config
+from registry import ModelRegistry, is_valid_version_name
+from batching import MicroBatcher
+from whatif import what_if
+from admission import AdmissionMiddleware, ComputeExecutor, Overloaded
+from serve import available_cpus
+from result_cache import ResultCache
+from shadow import ShadowScorer
+import metrics
+
+# Mốc thời gian tiến trình bắt đầu import app (tính thời gian khởi động)
+_PROCESS_START = time.monotonic()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Server nhận kết nối ngay; model được tải ở thread nền, /readyz báo khi sẵn sàng
+    if startup_state["status"] == "ready":
+        # Model đã được nạp sẵn trước khi fork (serve.py): chỉ cần bật watcher trong worker
+        start_watching()
+    else:
+        start_loading()
+    yield
+
+app = FastAPI(title="HUST Bank Intelligent System", version="Final + SHAP", lifespan=lifespan)
+
+# Từ chối sớm khi quá tải (check_admission, định nghĩa bên dưới); thêm trước CORS để response 429 vẫn có header CORS
+app.add_middleware(AdmissionMiddleware, check=lambda: check_admission(), paths=("/predict",))
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,48 +55,148 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, '../model_core/lgbm_credit_model_v3.pkl')
-META_PATH = os.path.join(BASE_DIR, '../model_core/model_metadata_v3.pkl')
-
-# HARD RULES
-MIN_INCOME = 5_000_000
-MAX_DTI = 0.6
-MAX_LOAN_TERM_MONTHS = 360
-MIN_LOAN_TERM_MONTHS = 3
-FINAL_THRESHOLD = 0.15 
-
-print("Loading AI Core & Explainer...")
-try:
-    model = joblib.load(MODEL_PATH)
-    metadata = joblib.load(META_PATH)
-    EXPECTED_FEATURES = metadata['features']
-    CAT_FEATURES = metadata.get('cat_features', [])
-    
-    # KHỞI TẠO SHAP EXPLAINER (Chỉ làm 1 lần khi start server)
-    # TreeExplainer rất nhanh với LightGBM
-    explainer = shap.TreeExplainer(model)
-    
-    print("System Ready with Explainable AI!")
-except Exception as e:
-    print(f"❌ Error: {e}")
-
-# MAPPING TÊN CỘT SANG TIẾNG VIỆT
-FEATURE_NAME_MAP = {
-    'AMT_INCOME_TOTAL': 'Tổng thu nhập',
-    'AMT_CREDIT': 'Số tiền vay',
-    'AMT_ANNUITY': 'Số tiền trả hàng tháng',
-    'DAYS_BIRTH': 'Tuổi tác',
-    'DAYS_EMPLOYED': 'Thâm niên làm việc',
-    'NAME_HOUSING_TYPE': 'Loại hình nhà ở',
-    'NAME_FAMILY_STATUS': 'Tình trạng hôn nhân',
-    'EXT_SOURCE_2': 'Điểm lịch sử tín dụng',
-    'EXT_SOURCE_3': 'Điểm tín dụng phụ',
-    'CREDIT_INCOME_PERCENT': 'Tỷ lệ Vay / Thu nhập',
-    'ANNUITY_INCOME_PERCENT': 'Gánh nặng nợ / Thu nhập',
-    'CREDIT_TERM': 'Thời hạn vay',
-    'DAYS_EMPLOYED_PERCENT': 'Tỷ lệ Thâm niên / Tuổi'
-}
+# REGISTRY MODEL (xem registry.py): các phiên bản được nạp, phiên bản mặc định và nguồn ngưỡng quyết định
+MODEL_DIR = os.getenv("MODEL_DIR", MODEL_CORE_DIR)
+MODEL_VERSIONS = [name.strip() for name in os.getenv("MODEL_VERSIONS", "v3").split(",") if name.strip()]
+DEFAULT_MODEL_VERSION = os.getenv("DEFAULT_MODEL_VERSION", MODEL_VERSIONS[0])
+MODEL_THRESHOLD_SOURCE = os.getenv("MODEL_THRESHOLD_SOURCE", "fixed")
+# Định dạng file model: "auto" (artifact native .artifact nếu có, không thì joblib .pkl), "native", "joblib"
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "auto")
+# Chu kỳ (giây) kiểm tra file model để tự nạp lại (0 = tắt, chỉ nạp lại qua API admin)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 0))
+# Token cho các endpoint /admin (không đặt = tắt API admin)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# ENGINE SUY LUẬN: "lightgbm" (predict_proba của LGBMClassifier) hoặc "numpy" (model_core/tree_engine.py)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "lightgbm")
+
+# SHAP: "native" (pred_contrib của LightGBM, không cần import shap) hoặc "shap" (shap.TreeExplainer)
+EXPLAIN_BACKEND = os.getenv("EXPLAIN_BACKEND", "native")
+
+# Giới hạn số hồ sơ trong một lần gọi /predict/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10_000))
+# Giới hạn số phương án (điểm lưới) trong một lần gọi /predict/what-if
+WHATIF_MAX_POINTS = int(os.getenv("WHATIF_MAX_POINTS", 10_000))
+
+# MICRO-BATCHING: gom các request /predict đồng thời thành 1 lần gọi model
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "1") == "1"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", 64))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", 2.0))
+
+# ADMISSION CONTROL (xem admission.py): số luồng tính song song (feature, LightGBM, SHAP), số request/tác vụ
+# chờ tối đa (đầy -> 429) và hạn chờ của mỗi request tính từ lúc nhận (quá hạn -> 503; 0 = không hạn)
+# Mặc định = số CPU được cấp: trên 1 core, thêm luồng tính chỉ tranh GIL với event loop
+COMPUTE_CONCURRENCY = int(os.getenv("COMPUTE_CONCURRENCY", 0)) or available_cpus()
+COMPUTE_MAX_QUEUE = int(os.getenv("COMPUTE_MAX_QUEUE", 256))
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", 2000))
+
+# CACHE KẾT QUẢ cho hồ sơ gửi lại giống hệt (0 = tắt); TTL tính bằng giây (0 = không hết hạn)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 10_000))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 0))
+
+# SHADOW SCORING (xem shadow.py): các model ứng viên chấm thử mẫu traffic /predict ngoài đường trả response.
+# SHADOW_MODELS: VD "focused" (được nạp cùng MODEL_VERSIONS); SHADOW_SAMPLE_RATE: tỷ lệ request được lấy mẫu;
+# hàng đợi đầy hoặc hàng đợi tính toán có tác vụ chờ -> bỏ mẫu
+SHADOW_MODELS = [name.strip() for name in os.getenv("SHADOW_MODELS", "").split(",") if name.strip()]
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", 0.1))
+SHADOW_MAX_QUEUE = int(os.getenv("SHADOW_MAX_QUEUE", 1000))
+SHADOW_BATCH_SIZE = int(os.getenv("SHADOW_BATCH_SIZE", 64))
+SHADOW_MAX_WAIT_MS = float(os.getenv("SHADOW_MAX_WAIT_MS", 100))
+
+# TRẠNG THÁI KHỞI ĐỘNG cho /readyz: "not_started" -> "loading" -> "ready" | "failed"
+startup_state = {"status": "not_started", "error": None, "timings_s": {}}
+_ready = threading.Event()
+_load_lock = threading.Lock()
+
+def _on_model_swap(name, previous, version):
+    # Phiên bản mới thay bản cũ -> kết quả đã cache của bản cũ không còn dùng
+    if previous is not None:
+        result_cache.clear()
+
+# Model ứng viên của shadow scoring được nạp cùng các phiên bản phục vụ
+registry = ModelRegistry(
+    MODEL_DIR, MODEL_VERSIONS + [name for name in SHADOW_MODELS if name not in MODEL_VERSIONS],
+    DEFAULT_MODEL_VERSION, INFERENCE_ENGINE, EXPLAIN_BACKEND, MODEL_THRESHOLD_SOURCE,
+    on_swap=_on_model_swap, model_format=MODEL_FORMAT
+)
+
+def load_model_state(watch=True):
+    """
+    Nạp các phiên bản model vào registry (chạy 1 lần, an toàn khi gọi từ nhiều thread).
+    Mỗi phiên bản được tải, dựng explainer và chấm thử hồ sơ giả lập trước khi phục vụ.
+    Thư viện nặng (joblib/lightgbm/sklearn/pandas) chỉ được import ở đây, không phải lúc import app
+    (artifact native: không import joblib/sklearn).
+    Sẵn sàng khi phiên bản mặc định nạp được; phiên bản khác lỗi chỉ được ghi nhận (xem /admin/models).
+    watch=False: không bật watcher (serve.py nạp model trước khi fork, watcher chạy trong từng worker).
+    """
+    with _load_lock:
+        if startup_state["status"] != "not_started":
+            return
+        startup_state["status"] = "loading"
+    timings = startup_state["timings_s"]
+    start = time.monotonic()
+    print("Loading AI Core & Explainer...")
+    try:
+        import model_loader  # noqa: F401
+        timings["imports"] = time.monotonic() - start
+
+        default = registry.load(registry.default)
+        timings.update(default.timings)
+        for name in registry.names:
+            if name not in registry:
+                try:
+                    registry.load(name)
+                except Exception as e:
+                    print(f"⚠️ Không nạp được model '{name}': {e}")
+        if watch:
+            start_watching()
+
+        timings["total"] = time.monotonic() - start
+        timings["since_process_start"] = time.monotonic() - _PROCESS_START
+        startup_state["status"] = "ready"
+        print(f"System Ready with Explainable AI! ({timings['total']:.2f}s, model {default.id})")
+    except Exception as e:
+        startup_state["status"] = "failed"
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+        print(f"❌ Error: {e}")
+    finally:
+        _ready.set()
+
+def start_watching():
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.watch(MODEL_WATCH_INTERVAL)
+
+def start_loading():
+    """Tải model ở thread nền (gọi từ lifespan)."""
+    threading.Thread(target=load_model_state, name="model-loader", daemon=True).start()
+
+def wait_until_ready(timeout=None):
+    """Chờ tải model xong (tự tải ngay trong thread hiện tại nếu chưa bắt đầu). Trả về True nếu sẵn sàng."""
+    if startup_state["status"] == "not_started":
+        load_model_state()
+    _ready.wait(timeout)
+    return startup_state["status"] == "ready"
+
+def resolve_version(pin=None):
+    """Phiên bản model cho 1 request: 503 khi chưa sẵn sàng, 404 khi không có phiên bản được chọn."""
+    if startup_state["status"] != "ready":
+        raise HTTPException(
+            status_code=503, detail=f"Model chưa sẵn sàng ({startup_state['status']}).", headers={"Retry-After": "1"}
+        )
+    try:
+        return registry.get(pin)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Không có phiên bản model '{pin}'.")
+
+def request_deadline():
+    """Mốc time.monotonic() mà request phải được bắt đầu tính trước đó (None = không hạn)."""
+    return time.monotonic() + REQUEST_DEADLINE_MS / 1000 if REQUEST_DEADLINE_MS > 0 else None
+
+def require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="API admin đang tắt (chưa đặt ADMIN_TOKEN).")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Sai admin token.")
 
 class CreditApplication(BaseModel):
     AMT_INCOME_TOTAL: float
@@ -72,136 +208,257 @@ class CreditApplication(BaseModel):
     NAME_FAMILY_STATUS: str
     EXT_SOURCE_2: float
 
-def get_top_reasons(shap_values, feature_names, is_reject):
+ExplainMode = Literal[EXPLAIN_NONE, EXPLAIN_TOP3, EXPLAIN_FULL]
+
+class SweepRange(BaseModel):
+    """Dải giá trị cần quét: `steps` giá trị cách đều từ min đến max (gồm cả 2 đầu)."""
+    min: float = Field(gt=0)
+    max: float = Field(gt=0)
+    steps: int = Field(20, ge=1)
+
+    def values(self):
+        if self.max < self.min:
+            raise ValueError("max phải >= min")
+        return np.linspace(self.min, self.max, self.steps)
+
+class WhatIfRequest(BaseModel):
+    application: CreditApplication
+    AMT_CREDIT: Optional[SweepRange] = None
+    AMT_ANNUITY: Optional[SweepRange] = None
+    term_months: Optional[SweepRange] = None
+    # Trục cần tối ưu: AMT_CREDIT (lớn nhất), AMT_ANNUITY (nhỏ nhất) hoặc term_months (ngắn nhất)
+    target: Optional[Literal["AMT_CREDIT", "AMT_ANNUITY", "term_months"]] = None
+
+def score_batch(applications, explain=EXPLAIN_TOP3, version=None):
+    version = version or registry.get()
+    return version.score(applications_to_columns(applications), explain)
+
+def score_micro_batch(items):
+    # Mỗi phần tử là (hồ sơ, mức giải thích, phiên bản model) -> mỗi phiên bản chấm chung 1 lần,
+    # SHAP chỉ cho dòng cần
+    groups = {}
+    for i, (_, _, version) in enumerate(items):
+        groups.setdefault(version, []).append(i)
+    results = [None] * len(items)
+    for version, rows in groups.items():
+        scored = score_batch([items[i][0] for i in rows], [items[i][1] for i in rows], version)
+        for i, result in zip(rows, scored):
+            results[i] = result
+    return results
+
+compute = ComputeExecutor(COMPUTE_CONCURRENCY, COMPUTE_MAX_QUEUE)
+batcher = MicroBatcher(score_micro_batch, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS, compute, COMPUTE_MAX_QUEUE)
+
+# Kết quả cũ chỉ dùng lại khi cùng phiên bản model (nằm trong key) và cùng ngưỡng (đổi -> cache tự xóa)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+result_cache.set_version(f"{scoring_config()}:{MODEL_THRESHOLD_SOURCE}")
+metrics.REGISTRY.register(metrics.Gauge(
+    "credit_micro_batch_queue_depth", "Số request /predict đang chờ trong hàng đợi micro-batch.", batcher.queue_depth
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "credit_compute_queue_depth", "Số tác vụ đang chờ luồng tính (admission control).", compute.queued
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "credit_compute_running", "Số tác vụ đang được tính.", compute.running
+))
+metrics.REGISTRY.register(metrics.Gauge("credit_result_cache_size", "Số kết quả trong cache.", result_cache.__len__))
+for _name in ("hits", "misses", "evictions", "expirations"):
+    metrics.REGISTRY.register(metrics.CounterFunc(
+        f"credit_result_cache_{_name}", f"Số lần {_name} của cache kết quả.",
+        lambda name=_name: getattr(result_cache, name)
+    ))
+
+shadow = ShadowScorer(
+    registry, SHADOW_MODELS, SHADOW_SAMPLE_RATE, SHADOW_MAX_QUEUE, SHADOW_BATCH_SIZE, SHADOW_MAX_WAIT_MS,
+    # queued() tính từ Future chưa xong của từng tác vụ -> request bị hủy không làm "bận" mãi
+    busy=lambda: compute.queued() > 0,
+)
+metrics.REGISTRY.register(metrics.Gauge(
+    "credit_shadow_queue_depth", "Số mẫu shadow đang chờ model ứng viên chấm.", shadow.queue_depth
+))
+
+def check_admission():
+    """Từ chối sớm (middleware) khi hàng đợi micro-batch hoặc hàng đợi tính toán đã đầy."""
+    if not COMPUTE_MAX_QUEUE:
+        return None
+    depth = batcher.queue_depth() if MICRO_BATCH_ENABLED else compute.queued()
+    if depth >= COMPUTE_MAX_QUEUE:
+        return compute.reject("queue_full", depth // MICRO_BATCH_MAX_SIZE if MICRO_BATCH_ENABLED else depth)
+    return None
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc):
+    # Quá tải: từ chối ngay thay vì để request xếp hàng đến khi client hết thời gian chờ
+    metrics.SHED_REQUESTS.inc(request.url.path, exc.reason)
+    detail = "Hàng đợi đã đầy." if exc.reason == "queue_full" else "Quá thời gian chờ trong hàng đợi."
+    return JSONResponse(
+        {"detail": f"Hệ thống đang quá tải: {detail}", "reason": exc.reason},
+        status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.post("/predict")
+async def predict_credit_score(data: CreditApplication, explain: ExplainMode = EXPLAIN_TOP3,
+                               model_version: Optional[str] = None):
     """
-    Hàm tìm ra Top 3 lý do quan trọng nhất.
-    - Nếu REJECT (Rủi ro cao): Tìm các feature đẩy xác suất TĂNG (SHAP dương lớn nhất).
-    - Nếu APPROVE (An toàn): Tìm các feature kéo xác suất GIẢM (SHAP âm bé nhất).
+    explain: "none" (chỉ quyết định, bỏ qua SHAP), "top3" (mặc định) hoặc "full" (SHAP toàn bộ feature).
+    model_version: chọn phiên bản model ("v3" hoặc "v3@<hash>"); mặc định là phiên bản mặc định.
+    Kết quả ghi kèm "model_version" đã dùng để chấm.
+    Quá tải: 429 (hàng đợi đầy) hoặc 503 (quá REQUEST_DEADLINE_MS), kèm Retry-After.
     """
-    # shap_values[1] là tác động lên lớp 1 (Vỡ nợ)
-    # shap_values trả về mảng shape (1, n_features) -> lấy [0]
-    vals = shap_values[0] if isinstance(shap_values, list) else shap_values
-    
-    # Tạo list (tên feature, giá trị shap)
-    feature_impacts = list(zip(feature_names, vals))
-    
-    if is_reject:
-        # Sắp xếp giảm dần (Lấy cái dương lớn nhất - Nguyên nhân gây rủi ro)
-        sorted_impacts = sorted(feature_impacts, key=lambda x: x[1], reverse=True)
-    else:
-        # Sắp xếp tăng dần (Lấy cái âm bé nhất - Nguyên nhân giúp an toàn)
-        sorted_impacts = sorted(feature_impacts, key=lambda x: x[1])
-        
-    top_3 = sorted_impacts[:3]
-    
-    reasons = []
-    for feat, impact in top_3:
-        # Chỉ lấy những lý do có tác động đáng kể (absolute > 0.01)
-        if abs(impact) > 0.01:
-            vn_name = FEATURE_NAME_MAP.get(feat, feat)
-            
-            # Chuyển SHAP value (log-odds) sang % thay đổi xác suất
-            # Sử dụng hàm sigmoid để chuyển đổi chính xác
-            impact_percent = 100 * (1 / (1 + np.exp(-impact)) - 0.5)
-            
-            if is_reject:
-                reasons.append(f"{vn_name} làm tăng rủi ro (+{impact_percent:.1f}%)")
-            else:
-                reasons.append(f"{vn_name} giúp hồ sơ an toàn ({impact_percent:.1f}%)")
-                
-    return reasons if reasons else ["Hồ sơ cân bằng, không có yếu tố nổi bật."]
+    deadline = request_deadline()
+    version = resolve_version(model_version)
+    start = time.perf_counter()
+    try:
+        if result_cache.enabled:
+            key = result_cache.key(data, explain, version.id)
+            cached = result_cache.get(key)
+            if cached is not None:
+                shadow.submit(data, cached, version.name)
+                return cached
+        if MICRO_BATCH_ENABLED:
+            # Chờ micro-batch chấm cùng các request đồng thời khác (không giữ thread nào trong lúc chờ)
+            result = await asyncio.wrap_future(batcher.submit((data, explain, version), deadline))
+        else:
+            # Một hồ sơ = batch 1 dòng, dùng chung logic với /predict/batch
+            result = (await compute.run(score_batch, [data], explain, version, deadline=deadline))[0]
+        if result_cache.enabled:
+            result_cache.put(key, result)
+        # Lấy mẫu cho model ứng viên (chỉ đưa vào hàng đợi, được chấm ở thread nền)
+        shadow.submit(data, result, version.name)
+        return result
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, "/predict")
 
-@app.post("/predict")
-def predict_credit_score(data: CreditApplication):
-    # HARD RULES 
-    if data.AMT_ANNUITY <= 0:
-        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Số tiền trả hàng tháng không hợp lệ."}
-    
-    term_months = data.AMT_CREDIT / data.AMT_ANNUITY
-    if term_months > MAX_LOAN_TERM_MONTHS:
-        return {"status": "REJECT", "probability": 1.0, "threshold": FINAL_THRESHOLD, "credit_score": 300, "message": f"Thời gian vay quá dài ({term_months/12:.1f} năm).", "reasons": ["Vi phạm chính sách thời hạn vay (Nhiều nhất 30 năm)"]}
-        
-    if data.AMT_INCOME_TOTAL < MIN_INCOME * 12:
-        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Thu nhập không đủ điều kiện.", "reasons": ["Thu nhập dưới chuẩn tối thiểu"]}
+def score_batch_cached(data, explain, version):
+    if not result_cache.enabled:
+        return score_batch(data, explain, version)
+    # Chỉ chấm các hồ sơ chưa có trong cache
+    keys = [result_cache.key(app, explain, version.id) for app in data]
+    results = [result_cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        for i, result in zip(missing, score_batch([data[i] for i in missing], explain, version)):
+            results[i] = result
+            result_cache.put(keys[i], result)
+    return results
 
-    monthly_income = data.AMT_INCOME_TOTAL / 12
-    dti_ratio = data.AMT_ANNUITY / monthly_income
-    if dti_ratio > MAX_DTI:
-        return {"status": "REJECT", "probability": 0.9, "credit_score": 350, "message": f"Gánh nặng nợ quá lớn ({dti_ratio:.1%}).", "reasons": ["Tỷ lệ Trả nợ/Thu nhập vượt quá 60%"]}
+@app.post("/predict/batch")
+async def predict_credit_score_batch(data: List[CreditApplication], explain: ExplainMode = EXPLAIN_TOP3,
+                                     model_version: Optional[str] = None):
+    """
+    Chấm điểm nhiều hồ sơ trong một lần gọi (VD: chấm lại toàn bộ danh mục ban đêm).
+    HARD RULES, feature engineering, predict_proba và shap_values chạy 1 lần cho cả batch.
+    Kết quả trả về theo đúng thứ tự đầu vào, mỗi phần tử giống hệt /predict.
+    """
+    if len(data) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch tối đa {MAX_BATCH_SIZE} hồ sơ.")
+    deadline = request_deadline()
+    version = resolve_version(model_version)
+    start = time.perf_counter()
+    try:
+        # Hash cache + chấm điểm đều chạy trong executor, không chặn event loop
+        return await compute.run(score_batch_cached, data, explain, version, deadline=deadline, kind="batch")
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, "/predict/batch")
 
-    # AI PREDICTION 
+@app.post("/predict/what-if")
+async def predict_what_if(data: WhatIfRequest, model_version: Optional[str] = None):
+    """
+    Quét các phương án vay cho 1 hồ sơ (1-2 trục trong AMT_CREDIT, AMT_ANNUITY, term_months) và trả về
+    ranh giới duyệt ("boundary", "best") cùng xác suất/điểm trên cả lưới ("grid").
+    Cả lưới được chấm trong 1 lần predict_proba (xem whatif.py), không tính SHAP.
+    """
     try:
-        input_dict = {
-            'AMT_INCOME_TOTAL': [data.AMT_INCOME_TOTAL],
-            'AMT_CREDIT': [data.AMT_CREDIT],
-            'AMT_ANNUITY': [data.AMT_ANNUITY],
-            'DAYS_BIRTH': [data.DAYS_BIRTH],
-            'DAYS_EMPLOYED': [data.DAYS_EMPLOYED],
-            'NAME_HOUSING_TYPE': [data.NAME_HOUSING_TYPE],
-            'NAME_FAMILY_STATUS': [data.NAME_FAMILY_STATUS],
-            'EXT_SOURCE_2': [data.EXT_SOURCE_2],
-            'EXT_SOURCE_3': [data.EXT_SOURCE_2] 
-        }
-        df = pd.DataFrame(input_dict)
-        
-        for col in CAT_FEATURES:
-            if col in df.columns: df[col] = df[col].astype('category')
-
-        # Feature Engineering
-        df['CREDIT_INCOME_PERCENT'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
-        df['ANNUITY_INCOME_PERCENT'] = df['AMT_ANNUITY'] / (df['AMT_INCOME_TOTAL'] / 12)
-        df['CREDIT_TERM'] = df['AMT_CREDIT'] / df['AMT_ANNUITY']
-        df['DAYS_EMPLOYED_PERCENT'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
-        
-        for col in EXPECTED_FEATURES:
-            if col not in df.columns: df[col] = 0
-        df = df[EXPECTED_FEATURES]
-        
-        # 1. Predict Probability
-        prob_default = model.predict_proba(df)[0][1]
-        
-        # 2. Calculate SHAP Values 
-        # shap_values trả về list các array cho từng class, ta quan tâm class 1 (Vỡ nợ)
-        shap_vals = explainer.shap_values(df)
-        
-        # LightGBM binary classification thường trả về list [array_class0, array_class1]
-        # Hoặc chỉ 1 array nếu objective khác. 
-        if isinstance(shap_vals, list) and len(shap_vals) == 2:
-            target_shap = shap_vals[1][0] # Lấy SHAP của class 1, dòng đầu tiên
-        else:
-            target_shap = shap_vals[0] # Fallback
-            
-        # Logic Status
-        status = "REJECT" if prob_default >= FINAL_THRESHOLD else "APPROVE"
-        
-        # 3. Lấy lý do từ SHAP
-        reasons = get_top_reasons(target_shap, EXPECTED_FEATURES, is_reject=(status=="REJECT"))
+        axes = {name: getattr(data, name).values() for name in ("AMT_CREDIT", "AMT_ANNUITY", "term_months")
+                if getattr(data, name) is not None}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    n_points = int(np.prod([len(values) for values in axes.values()]))
+    if n_points > WHATIF_MAX_POINTS:
+        raise HTTPException(status_code=413, detail=f"Lưới tối đa {WHATIF_MAX_POINTS} phương án.")
+    deadline = request_deadline()
+    version = resolve_version(model_version)
+    start = time.perf_counter()
+    try:
+        result = await compute.run(what_if, data.application.model_dump(), axes, version, data.target,
+                                   deadline=deadline, kind="whatif")
+        # Kết quả chỉ gồm kiểu JSON cơ bản: trả thẳng, bỏ qua jsonable_encoder (chậm với lưới hàng nghìn điểm)
+        return JSONResponse(result)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, "/predict/what-if")
 
-        # Score Calculation
-        if prob_default <= FINAL_THRESHOLD:
-            score = int(850 - (prob_default / FINAL_THRESHOLD) * 150)
-        else:
-            score = int(700 - ((prob_default - FINAL_THRESHOLD) / (1 - FINAL_THRESHOLD)) * 400)
-        if score < 300: score = 300
-
-        msg = f"Hồ sơ Rất Tốt. Rủi ro: ({prob_default:.1%})" if status == "APPROVE" else f"Rủi ro cao ({prob_default:.1%})."
-
-        return {
-            "status": status,
-            "probability": float(prob_default),
-            "threshold": float(FINAL_THRESHOLD),
-            "credit_score": score,
-            "message": msg,
-            "reasons": reasons # Trả về mảng lý do
-        }
-        
-    except Exception as e:
-        print(f"SHAP Error: {e}")
-        # Fallback nếu SHAP lỗi
-        return {
-            "status": "REJECT", "probability": 0.5, "credit_score": 500, 
-            "message": "Lỗi hệ thống khi phân tích.", "reasons": ["Không thể xác định lý do"]
-        }
+@app.get("/healthz")
+def healthz():
+    """Liveness: tiến trình còn sống và phục vụ được request (kể cả khi model đang tải)."""
+    return {"status": "alive", "pid": os.getpid(), "uptime_s": time.monotonic() - _PROCESS_START}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 khi model đã tải và warm-up xong, 503 khi đang tải hoặc tải lỗi."""
+    body = {
+        **startup_state,
+        "pid": os.getpid(),
+        "inference_engine": INFERENCE_ENGINE,
+        "default_model": registry.default,
+        "models": {name: info["id"] for name, info in registry.status()["versions"].items()},
+    }
+    if startup_state["status"] != "ready":
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "1"})
+    return body
+
+@app.get("/admin/models")
+def list_models(x_admin_token: Optional[str] = Header(None)):
+    """Các phiên bản model đang phục vụ, phiên bản mặc định và lỗi nạp gần nhất."""
+    require_admin(x_admin_token)
+    return registry.status()
+
+@app.post("/admin/models/{name}/reload", status_code=202)
+def reload_model(name: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Nạp lại (hoặc nạp mới) phiên bản `name` từ file trong MODEL_DIR ở thread nền.
+    Request đang chạy vẫn dùng bản cũ; bản mới chỉ thay thế khi tải + warm-up thành công.
+    """
+    require_admin(x_admin_token)
+    if not is_valid_version_name(name):
+        raise HTTPException(status_code=400, detail="Tên phiên bản chỉ gồm chữ, số, '_' hoặc '-'.")
+    registry.reload(name)
+    return {"status": "reloading", "name": name}
+
+@app.post("/admin/models/{name}/default")
+def set_default_model(name: str, x_admin_token: Optional[str] = Header(None)):
+    """Đổi phiên bản mặc định (cho request không chọn model_version)."""
+    require_admin(x_admin_token)
+    if name not in registry:
+        raise HTTPException(status_code=404, detail=f"Phiên bản model '{name}' chưa được nạp.")
+    registry.default = name
+    return {"default": name, "id": registry.get().id}
+
+@app.get("/metrics/batching")
+def micro_batching_stats():
+    """Độ sâu hàng đợi, kích thước batch và thời gian chờ của micro-batching."""
+    return {"enabled": MICRO_BATCH_ENABLED, **batcher.stats()}
+
+@app.get("/metrics/admission")
+def admission_stats():
+    """Số luồng tính, tác vụ đang chờ / đang tính và số request bị từ chối theo lý do."""
+    return {"deadline_ms": REQUEST_DEADLINE_MS, **compute.stats()}
+
+@app.get("/metrics/cache")
+def result_cache_stats():
+    """Kích thước, hit/miss, số phần tử bị loại (LRU) / hết hạn (TTL) của cache kết quả."""
+    return result_cache.stats()
+
+@app.get("/metrics/shadow")
+def shadow_stats():
+    """Shadow scoring: số mẫu đã lấy/bỏ, tỷ lệ cùng quyết định, chênh lệch xác suất, độ trễ theo model ứng viên."""
+    return shadow.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metrics dạng text cho Prometheus: độ trễ từng bước, quyết định, luật từ chối, lỗi SHAP/fallback."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
     
 # CẤU HÌNH SERVE FRONTEND (REACT)
 # Lấy đường dẫn tuyệt đối đến thư mục chứa file tĩnh (React Build)
@@ -217,8 +474,8 @@ if os.path.exists(STATIC_DIR):
     @app.get("/{full_path:path}")
     async def serve_react_app(full_path: str):
         # Nếu gọi API thì không trả về HTML (đã xử lý ở trên)
-        if full_path.startswith("predict") or full_path.startswith("docs"):
-            return 
+        if full_path.startswith(("predict", "docs", "metrics", "openapi.json", "healthz", "readyz", "admin")):
+            raise HTTPException(status_code=404, detail="Not Found")
         
         # Trả về file index.html cho mọi route khác (để React Router xử lý)
         return FileResponse(os.path.join(STATIC_DIR, "index.html"))
\ No newline at end of file
@@ -0,0 +1,198 @@
+import os
+import threading
+from bisect import bisect_left
+
+# METRICS CHO PROMETHEUS (không cần thư viện prometheus_client)
+# Counter / Histogram bucket cố định, cập nhật bằng 1 lần bisect + cộng dưới lock của riêng metric
+# -> chi phí cỡ micro-giây, đủ nhỏ để luôn bật ngay cả khi tải cao (xem benchmarks/).
+# render() trả về định dạng text của Prometheus cho endpoint /metrics.
+
+# METRICS_ENABLED=0 để tắt ghi nhận (endpoint /metrics vẫn trả về các giá trị 0)
+_enabled = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Bucket độ trễ (giây): 50µs -> 5s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+# Bucket số dòng trong 1 lần chấm điểm
+ROWS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 10_000)
+
+def set_enabled(flag):
+    """Bật/tắt ghi nhận metrics lúc chạy (dùng khi đo overhead)."""
+    global _enabled
+    _enabled = bool(flag)
+
+def is_enabled():
+    return _enabled
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Bộ đếm tăng dần, có thể có nhãn (VD: rule="max_dti")."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for labels, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Histogram:
+    """Histogram với các bucket cố định (giá trị tính bằng giây với độ trễ)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # nhãn -> [số lần theo từng bucket (không cộng dồn, phần tử cuối là +Inf), tổng, số lần]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = _format_labels(self.labelnames, labels, [("le", _format_value(float(bound)))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            base = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{base} {_format_value(total)}"
+            yield f"{self.name}_count{base} {n}"
+
+class Gauge:
+    """Giá trị tức thời, đọc qua hàm `read` lúc render (VD: độ sâu hàng đợi)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self):
+        yield f"{self.name} {_format_value(self.read())}"
+
+class CounterFunc(Gauge):
+    """Counter mà giá trị do đối tượng khác tự đếm, đọc qua hàm `read` lúc render (VD: hit của cache)."""
+
+    kind = "counter"
+
+    def samples(self):
+        yield f"{self.name}_total {_format_value(self.read())}"
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Toàn bộ metrics theo định dạng text của Prometheus (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# METRICS CỦA ĐƯỜNG CHẤM ĐIỂM (scoring.score_applications)
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "credit_stage_duration_seconds",
+    "Thời gian từng bước chấm điểm cho 1 batch (hard_rules, features, predict_proba, shap_values, reasons).",
+    labelnames=("stage",),
+))
+BATCH_ROWS = REGISTRY.register(Histogram(
+    "credit_scoring_batch_rows", "Số hồ sơ trong 1 lần chấm điểm.", buckets=ROWS_BUCKETS,
+))
+HARD_RULE_REJECTIONS = REGISTRY.register(Counter(
+    "credit_hard_rule_rejections", "Số hồ sơ bị từ chối bởi HARD RULES, theo luật.", labelnames=("rule",),
+))
+MODEL_DECISIONS = REGISTRY.register(Counter(
+    "credit_model_decisions", "Số quyết định của model, theo kết quả.", labelnames=("status",),
+))
+SHAP_FAILURES = REGISTRY.register(Counter(
+    "credit_shap_failures", "Số lần tính SHAP bị lỗi.",
+))
+SCORING_ERRORS = REGISTRY.register(Counter(
+    "credit_scoring_errors", "Số lần chấm điểm bị lỗi, theo bước.", labelnames=("stage",),
+))
+FALLBACK_RESPONSES = REGISTRY.register(Counter(
+    "credit_fallback_responses", "Số hồ sơ nhận response dự phòng do lỗi hệ thống.",
+))
+
+# METRICS CỦA API
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "credit_request_duration_seconds", "Thời gian xử lý request, theo endpoint.", labelnames=("endpoint",),
+))
+
+# METRICS CỦA HÀNG ĐỢI TÍNH TOÁN (admission.py): thời gian chờ tách riêng khỏi thời gian tính
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "credit_compute_queue_wait_seconds", "Thời gian chờ trong hàng đợi trước khi được tính, theo loại tác vụ.",
+    labelnames=("kind",),
+))
+COMPUTE_SECONDS = REGISTRY.register(Histogram(
+    "credit_compute_duration_seconds", "Thời gian tính của 1 tác vụ trong executor, theo loại tác vụ.",
+    labelnames=("kind",),
+))
+SHED_REQUESTS = REGISTRY.register(Counter(
+    "credit_shed_requests", "Số request bị từ chối sớm do quá tải, theo endpoint và lý do.",
+    labelnames=("endpoint", "reason"),
+))
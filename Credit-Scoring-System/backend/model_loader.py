@@ -0,0 +1,60 @@
+import hashlib
+
+from scoring import BoosterPredictor, NativeExplainer
+from processing import FeaturePipeline
+from tree_engine import CompiledTreeEnsemble, random_sample, check_parity
+from artifact import ARTIFACT_SUFFIX, load_artifact
+
+# TẢI MODEL DÙNG CHUNG CHO API (main.py) VÀ CHẤM ĐIỂM HÀNG LOẠT (bulk_score.py)
+# Yêu cầu model_core nằm trong sys.path (main.py / bulk_score.py đã thêm sẵn).
+# Model là artifact native (model_core/artifact.py, không cần sklearn) hoặc cặp joblib .pkl như cũ.
+
+def is_artifact(model_path):
+    return model_path.endswith(ARTIFACT_SUFFIX)
+
+def load_model(model_path, meta_path=None, engine="lightgbm"):
+    """
+    Tải model + metadata, dựng FeaturePipeline và predictor.
+    model_path: file .artifact (meta_path bỏ qua) hoặc .pkl của joblib (kèm meta_path).
+    engine: "lightgbm" (booster) hoặc "numpy" (tree_engine, chỉ dùng nếu khớp predict_proba trên tập mẫu).
+    Trả về (model, metadata, pipeline, predictor).
+    """
+    compiled = None
+    if is_artifact(model_path):
+        # Artifact đã kèm bảng cây của engine NumPy -> không phải biên dịch lại từ dump_model
+        model, metadata, compiled = load_artifact(model_path, engine=engine == "numpy")
+    else:
+        import joblib
+        model = joblib.load(model_path)
+        metadata = joblib.load(meta_path)
+    # Dựng ma trận feature bằng NumPy, cùng logic với các script train (model_core/processing.py)
+    pipeline = FeaturePipeline.from_metadata(metadata, model)
+
+    predictor = BoosterPredictor(model)
+    if engine == "numpy":
+        # Biên dịch cây sang NumPy, chỉ dùng nếu khớp predict_proba trên tập mẫu
+        if compiled is None:
+            compiled = CompiledTreeEnsemble.from_model(model, metadata.get('cat_features', []))
+        parity = check_parity(model, compiled, random_sample(compiled, 256))
+        if parity['passed']:
+            predictor = compiled
+            print(f"Inference engine: numpy ({len(compiled.roots)} cây)")
+        else:
+            print(f"⚠️ NumPy engine lệch predict_proba (max diff {parity['max_abs_diff']:.2e}), dùng LightGBM.")
+    return model, metadata, pipeline, predictor
+
+def make_explainer(model, backend="native"):
+    """SHAP explainer: "native" (pred_contrib của LightGBM) hoặc "shap" (shap.TreeExplainer)."""
+    if backend == "shap":
+        import shap
+        return shap.TreeExplainer(model)
+    return NativeExplainer(model)
+
+def artifact_version(*paths, length=12):
+    """Mã phiên bản model: SHA-256 nội dung các file model/metadata (đổi file -> đổi phiên bản)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:length]
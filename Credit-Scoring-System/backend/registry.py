@@ -0,0 +1,279 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scoring import FINAL_THRESHOLD, score_applications, serving_columns
+from artifact import artifact_path, version_suffix
+
+# REGISTRY MODEL: nhiều phiên bản model cùng lúc, nạp lại (hot reload) không gián đoạn
+# Mỗi phiên bản = artifact native lgbm_credit_model_<tên>.artifact (model_core/artifact.py) hoặc bộ file joblib
+# lgbm_credit_model_<tên>.pkl + model_metadata_<tên>.pkl trong thư mục model. Bản mới được tải + warm-up ở thread nền rồi mới thay thế
+# (gán lại tham chiếu), nên request đang chạy vẫn dùng trọn vẹn bản cũ và không request nào bị chặn.
+
+# Ngưỡng quyết định của mỗi phiên bản: "fixed" (FINAL_THRESHOLD, như trước) hoặc "metadata"
+# (ngưỡng tối ưu F1 mà script train lưu trong metadata, VD train_v3.py).
+THRESHOLD_SOURCES = ("fixed", "metadata")
+
+# Định dạng file model: "auto" (artifact nếu có, không thì .pkl), "native" (chỉ artifact), "joblib" (chỉ .pkl)
+MODEL_FORMATS = ("auto", "native", "joblib")
+
+# Hồ sơ giả lập (qua HARD RULES) để warm-up phiên bản mới trước khi đưa vào phục vụ
+WARMUP_APPLICATION = {
+    "AMT_INCOME_TOTAL": 360_000_000, "AMT_CREDIT": 500_000_000, "AMT_ANNUITY": 10_000_000,
+    "DAYS_BIRTH": -12_000, "DAYS_EMPLOYED": -2_000,
+    "NAME_HOUSING_TYPE": "House / apartment", "NAME_FAMILY_STATUS": "Married", "EXT_SOURCE_2": 0.6,
+}
+
+_VERSION_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def is_valid_version_name(name):
+    """Tên phiên bản chỉ gồm chữ, số, '_' hoặc '-' (được ghép vào tên file)."""
+    return bool(_VERSION_NAME.match(name))
+
+def artifact_paths(model_dir, name):
+    """Đường dẫn (model, metadata) của phiên bản `name` ("base" bị từ chối, xem artifact.version_suffix)."""
+    if not is_valid_version_name(name):
+        raise ValueError(f"Tên phiên bản không hợp lệ: {name!r}")
+    suffix = version_suffix(name)
+    return (
+        os.path.join(model_dir, f"lgbm_credit_model{suffix}.pkl"),
+        os.path.join(model_dir, f"model_metadata{suffix}.pkl"),
+    )
+
+def version_paths(model_dir, name, model_format="auto"):
+    """File của phiên bản `name` theo model_format: (artifact,) hoặc (model .pkl, metadata .pkl)."""
+    model_path, meta_path = artifact_paths(model_dir, name)
+    native = artifact_path(model_dir, name)
+    if model_format == "native":
+        return (native,)
+    if model_format == "auto" and os.path.exists(native):
+        # .pkl mới hơn artifact (train lại bằng script không xuất artifact) -> artifact đã cũ, dùng .pkl
+        try:
+            stale = os.stat(model_path).st_mtime_ns > os.stat(native).st_mtime_ns
+        except FileNotFoundError:
+            stale = False
+        if not stale:
+            return (native,)
+    return model_path, meta_path
+
+def file_fingerprint(paths):
+    """(kích thước, thời điểm sửa) của các file; None nếu thiếu file."""
+    try:
+        return tuple((os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths)
+    except FileNotFoundError:
+        return None
+
+class ModelVersion:
+    """Một bộ artifact đã tải: model, metadata, FeaturePipeline, predictor, explainer và ngưỡng."""
+
+    def __init__(self, name, paths, engine="lightgbm", explain_backend="native", threshold_source="fixed"):
+        # Import lười: joblib/LightGBM chỉ được nạp khi tải model, không phải lúc import app
+        from model_loader import load_model, artifact_version
+
+        self.name = name
+        # (artifact,) hoặc (model .pkl, metadata .pkl), xem version_paths()
+        self.paths = tuple(paths)
+        self.explain_backend = explain_backend
+        self.timings = {}
+        # Lấy fingerprint trước khi đọc file: file đổi trong lúc tải -> lần kiểm tra sau sẽ tải lại
+        self.fingerprint = file_fingerprint(self.paths)
+
+        start = time.monotonic()
+        self.model, self.metadata, self.pipeline, self.predictor = load_model(*self.paths, engine=engine)
+        self.digest = artifact_version(*self.paths)
+        self.id = f"{name}@{self.digest}"
+        self.threshold = self._resolve_threshold(threshold_source)
+        self.timings["load_model"] = time.monotonic() - start
+
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self.loaded_at = time.time()
+
+    def _resolve_threshold(self, source):
+        if source == "metadata" and self.metadata.get('threshold') is not None:
+            return float(self.metadata['threshold'])
+        return FINAL_THRESHOLD
+
+    def get_explainer(self):
+        """SHAP explainer của phiên bản này (khởi tạo lười, 1 lần)."""
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    from model_loader import make_explainer
+                    self._explainer = make_explainer(self.model, self.explain_backend)
+        return self._explainer
+
+    def warm_up(self):
+        """Chạy pipeline, predict_proba và SHAP trên hồ sơ giả lập (không ghi metrics); lỗi -> exception."""
+        start = time.monotonic()
+        self.get_explainer()
+        self.timings["explainer"] = time.monotonic() - start
+
+        start = time.monotonic()
+        columns = {field: [value] for field, value in WARMUP_APPLICATION.items()}
+        X = self.pipeline.transform(serving_columns(columns, [0]))
+        prob = self.predictor.predict_proba(X)[:, 1]
+        shap_values = self.get_explainer().shap_values(X)
+        if not (np.all(np.isfinite(prob)) and np.all(np.isfinite(shap_values))):
+            raise RuntimeError(f"Warm-up {self.name}: kết quả không hợp lệ (NaN/inf).")
+        self.timings["warmup"] = time.monotonic() - start
+
+    def score(self, columns, explain):
+        """Chấm điểm dữ liệu dạng cột bằng phiên bản này; mỗi kết quả ghi kèm model_version."""
+        results = score_applications(
+            columns, self.predictor, self.get_explainer, self.pipeline, threshold=self.threshold, explain=explain
+        )
+        for result in results:
+            result["model_version"] = self.id
+        return results
+
+    def info(self):
+        return {
+            "name": self.name,
+            "id": self.id,
+            "threshold": self.threshold,
+            "format": "native" if len(self.paths) == 1 else "joblib",
+            "model_path": self.paths[0],
+            "meta_path": self.paths[1] if len(self.paths) > 1 else None,
+            "n_features": len(self.pipeline.features),
+            "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at)),
+            "timings_s": dict(self.timings),
+        }
+
+class ModelRegistry:
+    """
+    Quản lý các phiên bản model theo tên.
+
+    - load(name): tải + warm-up đồng bộ rồi thay thế phiên bản cùng tên (dùng lúc khởi động).
+    - reload(name): như load nhưng chạy ở thread nền (lần lượt từng bản), trả về Future; lỗi chỉ được
+      ghi nhận, phiên bản đang phục vụ được giữ nguyên.
+    - watch(interval): theo dõi file của các phiên bản, file đổi (và đã ghi xong) -> reload.
+    - get(pin): phiên bản theo tên ("v3") hoặc id chính xác ("v3@<hash>"); None = phiên bản mặc định.
+    """
+
+    def __init__(self, model_dir, names, default=None, engine="lightgbm", explain_backend="native",
+                 threshold_source="fixed", on_swap=None, model_format="auto"):
+        if threshold_source not in THRESHOLD_SOURCES:
+            raise ValueError(f"threshold_source phải là một trong {THRESHOLD_SOURCES}")
+        if model_format not in MODEL_FORMATS:
+            raise ValueError(f"model_format phải là một trong {MODEL_FORMATS}")
+        self.model_dir = model_dir
+        self.names = list(names)
+        self.default = default or self.names[0]
+        self.engine = engine
+        self.explain_backend = explain_backend
+        self.threshold_source = threshold_source
+        self.model_format = model_format
+        self.on_swap = on_swap
+        # Dict được thay mới (copy-on-write) khi swap -> đọc không cần lock
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="model-reload")
+        self._watcher = None
+        self.errors = {}
+        self.reloads = 0
+
+    def load(self, name):
+        """Tải + warm-up phiên bản `name` rồi đưa vào phục vụ. Lỗi được ghi nhận và ném lại."""
+        paths = ()
+        try:
+            paths = version_paths(self.model_dir, name, self.model_format)
+            version = ModelVersion(name, paths, self.engine, self.explain_backend, self.threshold_source)
+            version.warm_up()
+        except Exception as e:
+            self.errors[name] = {
+                "error": f"{type(e).__name__}: {e}",
+                "fingerprint": file_fingerprint(paths),
+                "at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            raise
+        with self._lock:
+            previous = self._versions.get(name)
+            versions = dict(self._versions)
+            versions[name] = version
+            self._versions = versions
+            if previous is not None:
+                self.reloads += 1
+        self.errors.pop(name, None)
+        if name not in self.names:
+            self.names.append(name)
+        if self.on_swap is not None:
+            self.on_swap(name, previous, version)
+        return version
+
+    def _load_quietly(self, name):
+        try:
+            version = self.load(name)
+            print(f"Model {version.id} đã được nạp (threshold={version.threshold:.4f}).")
+            return version
+        except Exception as e:
+            print(f"⚠️ Không nạp được model '{name}', giữ phiên bản đang chạy: {e}")
+            return None
+
+    def reload(self, name):
+        """Nạp lại phiên bản `name` ở thread nền, không chặn request. Trả về Future (ModelVersion hoặc None)."""
+        return self._executor.submit(self._load_quietly, name)
+
+    def get(self, pin=None):
+        """Phiên bản đang phục vụ; KeyError nếu không có (hoặc id không còn khớp bản đang chạy)."""
+        name, _, digest = (pin or self.default).partition("@")
+        version = self._versions[name]
+        if digest and digest != version.digest:
+            raise KeyError(pin)
+        return version
+
+    def __contains__(self, name):
+        return name in self._versions
+
+    def watch(self, interval):
+        """Thread nền kiểm tra file mỗi `interval` giây; chỉ nạp khi file đã đứng yên qua 1 chu kỳ."""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        pending = {}
+        while True:
+            time.sleep(interval)
+            for name in list(self.names):
+                try:
+                    paths = version_paths(self.model_dir, name, self.model_format)
+                except Exception as e:
+                    # Tên phiên bản lỗi (VD "base"): ghi nhận như reload, bỏ qua bản này, vẫn theo dõi các bản khác
+                    if name not in self.errors:
+                        print(f"⚠️ Không theo dõi được model '{name}': {e}")
+                        self.errors[name] = {
+                            "error": f"{type(e).__name__}: {e}",
+                            "fingerprint": None,
+                            "at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        }
+                    continue
+                fingerprint = file_fingerprint(paths)
+                current = self._versions.get(name)
+                failed = self.errors.get(name, {}).get("fingerprint")
+                if fingerprint is None or fingerprint == failed or (current and fingerprint == current.fingerprint):
+                    pending.pop(name, None)
+                    continue
+                # File đổi: chờ thêm 1 chu kỳ không đổi (đang được ghi, hoặc model/metadata chưa ghi xong)
+                if pending.get(name) == fingerprint:
+                    pending.pop(name)
+                    self.reload(name).result()
+                else:
+                    pending[name] = fingerprint
+
+    def status(self):
+        versions = self._versions
+        return {
+            "default": self.default,
+            "threshold_source": self.threshold_source,
+            "model_format": self.model_format,
+            "reloads": self.reloads,
+            "watching": self._watcher is not None,
+            "versions": {name: version.info() for name, version in versions.items()},
+            "errors": dict(self.errors),
+        }
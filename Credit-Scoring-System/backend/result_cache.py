@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from scoring import INPUT_FIELDS, FALLBACK_MESSAGE
+
+# CACHE KẾT QUẢ CHẤM ĐIỂM
+# Frontend / hệ thống giải ngân hay gửi lại đúng hồ sơ cũ (retry, double-click, re-render).
+# Key = hash các trường đã validate + mức giải thích + phiên bản model (id trong registry) + cấu hình ngưỡng,
+# nên hồ sơ giống hệt trả về ngay kết quả đã tính, giống hệt kết quả tính mới.
+# Đổi cấu hình ngưỡng (set_version) hoặc model được nạp lại (main.py) -> cache tự xóa.
+
+class ResultCache:
+    """
+    Cache LRU có giới hạn số phần tử và TTL tùy chọn (an toàn với nhiều thread).
+
+    max_size: số kết quả tối đa (0 = tắt cache).
+    ttl_seconds: thời gian sống của 1 kết quả (0 = không hết hạn).
+    Kết quả trả về là dict dùng chung giữa các request -> không được sửa.
+    """
+
+    def __init__(self, max_size=10_000, ttl_seconds=0.0):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Thống kê
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def set_version(self, version):
+        """Gán phiên bản model/ngưỡng hiện tại; khác phiên bản cũ thì xóa toàn bộ cache."""
+        with self._lock:
+            if version != self.version:
+                if self._data:
+                    self.invalidations += 1
+                self._data.clear()
+                self.version = version
+
+    def key(self, application, explain, model_id=None):
+        """Hash chuẩn hóa của 1 hồ sơ (CreditApplication đã validate) + mức giải thích + phiên bản."""
+        values = (self.version, model_id, explain) + tuple(getattr(application, field) for field in INPUT_FIELDS)
+        return hashlib.blake2b(repr(values).encode(), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, expires = entry
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        # Không cache response dự phòng (lỗi tạm thời)
+        if not self.enabled or result.get("message") == FALLBACK_MESSAGE:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        with self._lock:
+            self._data[key] = (result, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Số liệu cache: kích thước, hit/miss, số phần tử bị loại (LRU) hoặc hết hạn (TTL)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "version": self.version,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,331 @@
+import logging
+import time
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# HARD RULES
+MIN_INCOME = 5_000_000
+MAX_DTI = 0.6
+MAX_LOAN_TERM_MONTHS = 360
+MIN_LOAN_TERM_MONTHS = 3
+FINAL_THRESHOLD = 0.15
+
+# Mã luật bị vi phạm (theo đúng thứ tự kiểm tra của /predict)
+RULE_PASS = 0
+RULE_INVALID_ANNUITY = 1
+RULE_MAX_TERM = 2
+RULE_MIN_INCOME = 3
+RULE_MAX_DTI = 4
+# Tên luật dùng làm nhãn metrics
+RULE_NAMES = {
+    RULE_INVALID_ANNUITY: "invalid_annuity",
+    RULE_MAX_TERM: "max_term",
+    RULE_MIN_INCOME: "min_income",
+    RULE_MAX_DTI: "max_dti",
+}
+
+FALLBACK_MESSAGE = "Lỗi hệ thống khi phân tích."
+
+# Mức giải thích cho từng request
+EXPLAIN_NONE = "none"   # Chỉ quyết định, bỏ qua SHAP hoàn toàn
+EXPLAIN_TOP3 = "top3"   # Top 3 lý do (mặc định, như trước)
+EXPLAIN_FULL = "full"   # Top 3 lý do + SHAP của toàn bộ feature
+EXPLAIN_MODES = (EXPLAIN_NONE, EXPLAIN_TOP3, EXPLAIN_FULL)
+
+# Các trường đầu vào của CreditApplication (EXT_SOURCE_3 được lấy bằng EXT_SOURCE_2)
+INPUT_FIELDS = [
+    'AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_BIRTH', 'DAYS_EMPLOYED',
+    'NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS', 'EXT_SOURCE_2'
+]
+
+# MAPPING TÊN CỘT SANG TIẾNG VIỆT
+FEATURE_NAME_MAP = {
+    'AMT_INCOME_TOTAL': 'Tổng thu nhập',
+    'AMT_CREDIT': 'Số tiền vay',
+    'AMT_ANNUITY': 'Số tiền trả hàng tháng',
+    'DAYS_BIRTH': 'Tuổi tác',
+    'DAYS_EMPLOYED': 'Thâm niên làm việc',
+    'NAME_HOUSING_TYPE': 'Loại hình nhà ở',
+    'NAME_FAMILY_STATUS': 'Tình trạng hôn nhân',
+    'EXT_SOURCE_2': 'Điểm lịch sử tín dụng',
+    'EXT_SOURCE_3': 'Điểm tín dụng phụ',
+    'CREDIT_INCOME_PERCENT': 'Tỷ lệ Vay / Thu nhập',
+    'ANNUITY_INCOME_PERCENT': 'Gánh nặng nợ / Thu nhập',
+    'CREDIT_TERM': 'Thời hạn vay',
+    'DAYS_EMPLOYED_PERCENT': 'Tỷ lệ Thâm niên / Tuổi'
+}
+
+def scoring_config():
+    """Các ngưỡng ảnh hưởng tới kết quả chấm điểm (đổi ngưỡng -> kết quả cũ không còn đúng)."""
+    return (MIN_INCOME, MAX_DTI, MAX_LOAN_TERM_MONTHS, MIN_LOAN_TERM_MONTHS, FINAL_THRESHOLD)
+
+def fallback_response():
+    """Response dự phòng khi model/SHAP lỗi."""
+    return {
+        "status": "REJECT", "probability": 0.5, "credit_score": 500,
+        "message": FALLBACK_MESSAGE, "reasons": ["Không thể xác định lý do"]
+    }
+
+# Số lý do tối đa và ngưỡng |SHAP| (log-odds) để 1 feature được coi là lý do
+REASON_TOP_K = 3
+REASON_MIN_IMPACT = 0.01
+
+def top_reason_indices(shap_matrix, is_reject):
+    """
+    Phần chọn lý do của get_top_reasons, vector hóa cho cả ma trận SHAP (n_rows, n_features).
+    is_reject: mảng bool theo dòng. Trả về mảng (n_rows, REASON_TOP_K) chỉ số feature, -1 nếu tác động
+    không đáng kể. Thứ tự giống sorted() của Python (sắp xếp ổn định, feature đứng trước thắng khi bằng nhau).
+    """
+    shap_matrix = np.asarray(shap_matrix, dtype=np.float64)
+    keys = np.where(np.asarray(is_reject)[:, None], -shap_matrix, shap_matrix)
+    top = np.argsort(keys, axis=1, kind='stable')[:, :REASON_TOP_K]
+    impacts = np.take_along_axis(shap_matrix, top, axis=1)
+    return np.where(np.abs(impacts) > REASON_MIN_IMPACT, top, -1)
+
+def get_top_reasons(shap_values, feature_names, is_reject):
+    """
+    Hàm tìm ra Top 3 lý do quan trọng nhất.
+    - Nếu REJECT (Rủi ro cao): Tìm các feature đẩy xác suất TĂNG (SHAP dương lớn nhất).
+    - Nếu APPROVE (An toàn): Tìm các feature kéo xác suất GIẢM (SHAP âm bé nhất).
+    """
+    # shap_values[1] là tác động lên lớp 1 (Vỡ nợ)
+    # shap_values trả về mảng shape (1, n_features) -> lấy [0]
+    vals = shap_values[0] if isinstance(shap_values, list) else shap_values
+
+    reasons = []
+    # Chỉ lấy những lý do có tác động đáng kể (absolute > 0.01), xem top_reason_indices
+    for j in top_reason_indices(np.asarray(vals)[None, :], [is_reject])[0]:
+        if j < 0:
+            continue
+        feat, impact = feature_names[j], vals[j]
+        vn_name = FEATURE_NAME_MAP.get(feat, feat)
+
+        # Chuyển SHAP value (log-odds) sang % thay đổi xác suất
+        # Sử dụng hàm sigmoid để chuyển đổi chính xác
+        impact_percent = 100 * (1 / (1 + np.exp(-impact)) - 0.5)
+
+        if is_reject:
+            reasons.append(f"{vn_name} làm tăng rủi ro (+{impact_percent:.1f}%)")
+        else:
+            reasons.append(f"{vn_name} giúp hồ sơ an toàn ({impact_percent:.1f}%)")
+
+    return reasons if reasons else ["Hồ sơ cân bằng, không có yếu tố nổi bật."]
+
+def applications_to_columns(applications):
+    """Chuyển list CreditApplication thành dict {tên cột: list giá trị} (dạng cột)."""
+    return {field: [getattr(app, field) for app in applications] for field in INPUT_FIELDS}
+
+def check_hard_rules(income, credit, annuity):
+    """
+    Áp dụng HARD RULES cho cả batch bằng NumPy mask.
+    Trả về (rule, term_months, dti_ratio); rule = RULE_PASS nếu hồ sơ được đưa vào model.
+    Luật đầu tiên bị vi phạm (theo thứ tự của /predict) sẽ được ghi nhận.
+    """
+    income = np.asarray(income, dtype=np.float64)
+    credit = np.asarray(credit, dtype=np.float64)
+    annuity = np.asarray(annuity, dtype=np.float64)
+
+    invalid_annuity = annuity <= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        term_months = np.divide(credit, annuity, out=np.full_like(credit, np.nan), where=~invalid_annuity)
+        dti_ratio = annuity / (income / 12)
+
+    rule = np.full(income.shape, RULE_PASS, dtype=np.int8)
+    # Gán ngược thứ tự để luật kiểm tra trước có ưu tiên cao hơn
+    rule[dti_ratio > MAX_DTI] = RULE_MAX_DTI
+    rule[income < MIN_INCOME * 12] = RULE_MIN_INCOME
+    rule[term_months > MAX_LOAN_TERM_MONTHS] = RULE_MAX_TERM
+    rule[invalid_annuity] = RULE_INVALID_ANNUITY
+    return rule, term_months, dti_ratio
+
+def rule_rejection(rule, term_months, dti_ratio):
+    """Response từ chối theo luật (giữ nguyên nội dung như /predict)."""
+    if rule == RULE_INVALID_ANNUITY:
+        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Số tiền trả hàng tháng không hợp lệ."}
+    if rule == RULE_MAX_TERM:
+        return {"status": "REJECT", "probability": 1.0, "threshold": FINAL_THRESHOLD, "credit_score": 300, "message": f"Thời gian vay quá dài ({term_months/12:.1f} năm).", "reasons": ["Vi phạm chính sách thời hạn vay (Nhiều nhất 30 năm)"]}
+    if rule == RULE_MIN_INCOME:
+        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Thu nhập không đủ điều kiện.", "reasons": ["Thu nhập dưới chuẩn tối thiểu"]}
+    return {"status": "REJECT", "probability": 0.9, "credit_score": 350, "message": f"Gánh nặng nợ quá lớn ({dti_ratio:.1%}).", "reasons": ["Tỷ lệ Trả nợ/Thu nhập vượt quá 60%"]}
+
+def serving_columns(columns, rows):
+    """Lấy các dòng `rows` của dữ liệu dạng cột; EXT_SOURCE_3 được lấy bằng EXT_SOURCE_2 (UI không có)."""
+    selected = {field: [columns[field][i] for i in rows] for field in INPUT_FIELDS}
+    selected['EXT_SOURCE_3'] = selected['EXT_SOURCE_2']
+    return selected
+
+class BoosterPredictor:
+    """predict_proba trên ma trận NumPy bằng booster của LightGBM (không qua lớp kiểm tra của sklearn)."""
+
+    def __init__(self, model):
+        self.booster = getattr(model, 'booster_', model)
+
+    def predict_proba(self, X):
+        prob = self.booster.predict(X)
+        return np.column_stack([1.0 - prob, prob])
+
+class NativeExplainer:
+    """
+    Giải thích bằng pred_contrib=True của chính LightGBM (TreeSHAP trong C++).
+    Cho kết quả trùng khớp shap.TreeExplainer với model LightGBM nhưng không cần import shap
+    (shap kéo theo numba/scipy) và không qua lớp wrapper của shap.
+    """
+
+    def __init__(self, model):
+        self.booster = getattr(model, 'booster_', model)
+        # Cột cuối của pred_contrib là giá trị kỳ vọng (bias), giống nhau cho mọi dòng
+        probe = np.full((1, self.booster.num_feature()), np.nan)
+        self.expected_value = float(self.booster.predict(probe, pred_contrib=True)[0, -1])
+
+    def shap_values(self, X):
+        return self.booster.predict(X, pred_contrib=True)[:, :-1]
+
+def positive_class_shap(shap_vals):
+    """Lấy ma trận SHAP của lớp 1 (Vỡ nợ), shape (n_rows, n_features)."""
+    # LightGBM binary classification thường trả về list [array_class0, array_class1]
+    # Hoặc chỉ 1 array nếu objective khác.
+    if isinstance(shap_vals, list) and len(shap_vals) == 2:
+        return shap_vals[1]
+    return shap_vals
+
+def positive_class_base(expected_value):
+    """Giá trị kỳ vọng (log-odds) của lớp 1 từ explainer."""
+    values = np.ravel(expected_value)
+    return float(values[-1])
+
+def credit_scores(probs, threshold):
+    """Quy đổi xác suất vỡ nợ sang điểm tín dụng 300-850 (vector hóa)."""
+    probs = np.asarray(probs, dtype=np.float64)
+    scores = np.where(
+        probs <= threshold,
+        850 - (probs / threshold) * 150,
+        700 - ((probs - threshold) / (1 - threshold)) * 400,
+    )
+    return np.maximum(np.trunc(scores).astype(np.int64), 300)
+
+def model_decision(prob_default, score, threshold, reasons=None):
+    """Response cho hồ sơ đã qua HARD RULES và được model chấm điểm."""
+    status = "REJECT" if prob_default >= threshold else "APPROVE"
+    msg = f"Hồ sơ Rất Tốt. Rủi ro: ({prob_default:.1%})" if status == "APPROVE" else f"Rủi ro cao ({prob_default:.1%})."
+    result = {
+        "status": status,
+        "probability": float(prob_default),
+        "threshold": float(threshold),
+        "credit_score": int(score),
+        "message": msg,
+    }
+    if reasons is not None:
+        result["reasons"] = reasons # Trả về mảng lý do
+    return result
+
+def score_applications(columns, model, explainer, pipeline, threshold=FINAL_THRESHOLD, explain=EXPLAIN_TOP3):
+    """
+    Chấm điểm cả batch hồ sơ (dạng cột, xem applications_to_columns).
+    - HARD RULES được áp dụng bằng NumPy mask.
+    - Chỉ các hồ sơ qua luật mới được dựng ma trận feature (pipeline: processing.FeaturePipeline)
+      và gọi predict_proba (1 lần); model là BoosterPredictor hoặc engine NumPy.
+    - explain: một mức giải thích chung hoặc list theo từng dòng (EXPLAIN_MODES).
+      shap_values chỉ được gọi (1 lần) cho các dòng cần giải thích; explainer có thể là
+      None nếu không dòng nào cần, hoặc một hàm trả về explainer (khởi tạo lười).
+    Kết quả từng dòng giống hệt /predict.
+    Thời gian từng bước và số quyết định được ghi vào metrics (xem metrics.py).
+    """
+    clock = time.perf_counter
+    started = clock()
+    rule, term_months, dti_ratio = check_hard_rules(
+        columns['AMT_INCOME_TOTAL'], columns['AMT_CREDIT'], columns['AMT_ANNUITY']
+    )
+    if isinstance(explain, str):
+        explain = [explain] * len(rule)
+    results = [None] * len(rule)
+    for i in np.flatnonzero(rule != RULE_PASS):
+        results[i] = rule_rejection(rule[i], term_months[i], dti_ratio[i])
+    _record_rules(rule)
+    metrics.BATCH_ROWS.observe(len(rule))
+    now = clock()
+    metrics.STAGE_SECONDS.observe(now - started, "hard_rules")
+
+    passed = np.flatnonzero(rule == RULE_PASS)
+    if len(passed) == 0:
+        return results
+
+    # AI PREDICTION
+    stage = "features"
+    try:
+        X = pipeline.transform(serving_columns(columns, passed))
+        expected_features = pipeline.features
+        now = _observe_stage(stage, now)
+
+        # 1. Predict Probability
+        stage = "predict_proba"
+        probs = model.predict_proba(X)[:, 1]
+        scores = credit_scores(probs, threshold)
+        now = _observe_stage(stage, now)
+
+        # 2. Calculate SHAP Values (chỉ cho các dòng cần giải thích)
+        modes = [explain[i] for i in passed]
+        explained = [row for row, mode in enumerate(modes) if mode != EXPLAIN_NONE]
+        if explained:
+            stage = "shap_values"
+            if callable(explainer):
+                explainer = explainer()
+            sub_X = X if len(explained) == len(X) else X[explained]
+            shap_rows = dict(zip(explained, positive_class_shap(explainer.shap_values(sub_X))))
+            if EXPLAIN_FULL in modes:
+                base_value = positive_class_base(explainer.expected_value)
+            now = _observe_stage(stage, now)
+
+        stage = "reasons"
+        for row, i in enumerate(passed):
+            prob_default = probs[row]
+            if modes[row] == EXPLAIN_NONE:
+                results[i] = model_decision(prob_default, scores[row], threshold)
+                continue
+            # 3. Lấy lý do từ SHAP
+            target_shap = shap_rows[row]
+            reasons = get_top_reasons(target_shap, expected_features, is_reject=(prob_default >= threshold))
+            results[i] = model_decision(prob_default, scores[row], threshold, reasons)
+            if modes[row] == EXPLAIN_FULL:
+                results[i]["shap_base_value"] = base_value
+                results[i]["shap_values"] = {feat: float(v) for feat, v in zip(expected_features, target_shap)}
+        _observe_stage(stage, now)
+
+    except Exception:
+        logger.exception("Lỗi chấm điểm ở bước %s (%d hồ sơ), trả về response dự phòng", stage, len(passed))
+        metrics.SCORING_ERRORS.inc(stage)
+        if stage == "shap_values":
+            metrics.SHAP_FAILURES.inc()
+        metrics.FALLBACK_RESPONSES.inc(amount=len(passed))
+        # Fallback nếu SHAP lỗi
+        for i in passed:
+            results[i] = fallback_response()
+        return results
+
+    n_reject = int(np.count_nonzero(probs >= threshold))
+    if n_reject:
+        metrics.MODEL_DECISIONS.inc("REJECT", amount=n_reject)
+    if n_reject < len(probs):
+        metrics.MODEL_DECISIONS.inc("APPROVE", amount=len(probs) - n_reject)
+    return results
+
+def _observe_stage(stage, since):
+    now = time.perf_counter()
+    metrics.STAGE_SECONDS.observe(now - since, stage)
+    return now
+
+def _record_rules(rule):
+    if not metrics.is_enabled():
+        return
+    if len(rule) <= 8:
+        # Batch nhỏ (request /predict lẻ): duyệt trực tiếp rẻ hơn bincount
+        for code in rule.tolist():
+            if code != RULE_PASS:
+                metrics.HARD_RULE_REJECTIONS.inc(RULE_NAMES[code])
+        return
+    counts = np.bincount(rule, minlength=len(RULE_NAMES) + 1)
+    for code, name in RULE_NAMES.items():
+        if counts[code]:
+            metrics.HARD_RULE_REJECTIONS.inc(name, amount=int(counts[code]))
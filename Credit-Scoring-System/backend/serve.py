@@ -0,0 +1,197 @@
+import argparse
+import gc
+import math
+import os
+import signal
+import socket
+import sys
+import time
+
+# PHỤC VỤ NHIỀU TIẾN TRÌNH (PRE-FORK), MODEL DÙNG CHUNG BỘ NHỚ
+# Tiến trình cha nạp model + explainer + warm-up 1 lần (main.load_model_state), rồi fork N worker
+# cùng nghe trên 1 socket. Booster LightGBM (bộ nhớ C++) và các mảng NumPy của model/explainer nằm
+# trong trang nhớ copy-on-write mà worker chỉ đọc -> không bị sao chép, RAM gần như không tăng theo số worker.
+# gc.freeze() trước khi fork để GC không ghi vào header của các object đã nạp (tránh copy-on-write).
+# Socket được bind + listen trước khi nạp model: kết nối đến trong lúc nạp chờ trong backlog của kernel rồi được
+# worker phục vụ, thay vì bị từ chối (connection refused). Đánh đổi so với khởi động 1 tiến trình (main.py
+# nạp model ở thread nền): trong lúc nạp, /healthz và /readyz chưa trả lời (request chờ, không lỗi).
+# Cần liveness/readiness tách biệt ngay từ đầu thì chạy --no-preload (mỗi worker tự nạp model ở nền).
+#
+# Chạy: python serve.py --workers 4 --port 7860      (mặc định số worker = số CPU được cấp)
+# kill -USR1 <pid cha> để in RSS/PSS của từng worker.
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", os.getenv("PORT", 7860)))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", 0))  # 0 = số CPU được cấp
+# Mỗi worker 1 thread OpenMP: tận dụng core bằng tiến trình, và libgomp không an toàn khi fork
+# sau khi đã tạo thread pool
+SERVE_THREADS_PER_WORKER = "1"
+# In báo cáo RAM sau khi worker khởi động (giây)
+SERVE_REPORT_DELAY = float(os.getenv("SERVE_REPORT_DELAY", 3))
+
+def available_cpus():
+    """Số CPU tiến trình được dùng (affinity + quota cgroup v2 trong container)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def worker_compute_concurrency(workers, cpus=None):
+    """COMPUTE_CONCURRENCY mặc định của mỗi worker: chia đều số CPU được cấp cho các worker (ít nhất 1)."""
+    cpus = available_cpus() if cpus is None else cpus
+    return max(1, cpus // max(1, workers))
+
+def read_memory(pid):
+    """RSS / PSS / phần dùng chung / phần riêng (MB) của 1 tiến trình (Linux, /proc/<pid>/smaps_rollup)."""
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb",
+              "Private_Clean": "private_mb", "Private_Dirty": "private_mb"}
+    memory = dict.fromkeys(fields.values(), 0.0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    memory[fields[key]] += int(rest.split()[0]) / 1024
+    except OSError:
+        return None
+    return memory
+
+def memory_report(pids):
+    """RAM của từng worker và tổng. Tổng PSS = RAM thực tế mà các worker chiếm (phần dùng chung chia đều)."""
+    workers = {pid: read_memory(pid) for pid in pids}
+    workers = {pid: m for pid, m in workers.items() if m is not None}
+    total = {key: sum(m[key] for m in workers.values()) for key in ("rss_mb", "pss_mb", "private_mb")}
+    return {"workers": workers, "total": total}
+
+def print_memory_report(pids, parent=None):
+    report = memory_report(pids)
+    print(f"{'PID':>8}{'RSS (MB)':>12}{'PSS (MB)':>12}{'Shared (MB)':>14}{'Private (MB)':>14}")
+    rows = list(report["workers"].items())
+    if parent is not None and read_memory(parent):
+        rows.insert(0, (f"{parent}*", read_memory(parent)))
+    for pid, m in rows:
+        print(f"{pid:>8}{m['rss_mb']:>12.1f}{m['pss_mb']:>12.1f}{m['shared_mb']:>14.1f}{m['private_mb']:>14.1f}")
+    total = report["total"]
+    print(f"{'worker':>8}{total['rss_mb']:>12.1f}{total['pss_mb']:>12.1f}{'':>14}{total['private_mb']:>14.1f}"
+          f"   (* = tiến trình cha giữ model)")
+    sys.stdout.flush()
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock, log_level):
+    import uvicorn
+    import main
+
+    config = uvicorn.Config(main.app, log_level=log_level, access_log=False, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+class Supervisor:
+    """Tiến trình cha: fork worker, tạo lại worker bị chết, chuyển tiếp tín hiệu dừng."""
+
+    def __init__(self, sock, n_workers, log_level="warning"):
+        self.sock = sock
+        self.n_workers = n_workers
+        self.log_level = log_level
+        self.workers = set()
+        self.stopping = False
+        self.report_requested = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+                signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.sock, self.log_level)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} lỗi: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers.add(pid)
+        return pid
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _request_report(self, signum, frame):
+        self.report_requested = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR1, self._request_report)
+        for _ in range(self.n_workers):
+            self.spawn()
+        print(f"Đang phục vụ với {self.n_workers} worker (pid cha {os.getpid()}).", flush=True)
+        report_at = time.monotonic() + SERVE_REPORT_DELAY
+
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.discard(pid)
+                if not self.stopping:
+                    print(f"⚠️ Worker {pid} dừng (status {status}), tạo lại.", flush=True)
+                    self.spawn()
+                continue
+            if self.report_requested or (report_at and time.monotonic() >= report_at):
+                self.report_requested, report_at = False, None
+                print_memory_report(sorted(self.workers), parent=os.getpid())
+            time.sleep(0.2)
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy API với nhiều worker (pre-fork), model dùng chung bộ nhớ.")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS or available_cpus())
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Mỗi worker tự nạp model riêng (như uvicorn --workers), để so sánh RAM")
+    args = parser.parse_args(argv)
+
+    # Phải đặt trước khi LightGBM (libgomp) được nạp
+    os.environ["OMP_NUM_THREADS"] = SERVE_THREADS_PER_WORKER
+    # Mặc định mỗi tiến trình có số luồng tính = số CPU -> N worker sẽ chạy N x số CPU luồng tính.
+    # Phải đặt trước khi import main (COMPUTE_CONCURRENCY đọc lúc import, worker kế thừa qua fork)
+    if args.workers > 1 and not int(os.getenv("COMPUTE_CONCURRENCY", 0)):
+        os.environ["COMPUTE_CONCURRENCY"] = str(worker_compute_concurrency(args.workers))
+    # Bind trước khi import app và nạp model: kết nối trong lúc nạp chờ trong backlog thay vì bị từ chối
+    sock = bind_socket(args.host, args.port)
+    import main
+
+    if not args.no_preload:
+        main.load_model_state(watch=False)
+        if main.startup_state["status"] != "ready":
+            sock.close()
+            sys.exit(f"Không nạp được model: {main.startup_state['error']}")
+        # Đưa các object đã nạp ra khỏi vùng theo dõi của GC -> GC ở worker không ghi vào trang nhớ dùng chung
+        gc.collect()
+        gc.freeze()
+
+    Supervisor(sock, args.workers, args.log_level).run()
+
+if __name__ == "__main__":
+    main_cli()
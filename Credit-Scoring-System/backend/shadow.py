@@ -0,0 +1,219 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from scoring import FALLBACK_MESSAGE, RULE_PASS, applications_to_columns, check_hard_rules, serving_columns
+
+logger = logging.getLogger(__name__)
+
+# SHADOW SCORING: CHẤM THỬ MODEL ỨNG VIÊN TRÊN TRAFFIC THẬT, NGOÀI ĐƯỜNG TRẢ RESPONSE
+# Sau khi /predict có kết quả, hồ sơ được lấy mẫu (SHADOW_SAMPLE_RATE) và đưa vào hàng đợi giới hạn
+# (chỉ random + put_nowait, không chờ). Một thread nền gom các mẫu thành batch, áp lại HARD RULES và chỉ chấm
+# các hồ sơ qua luật bằng từng model ứng viên (feature + predict_proba, không SHAP, không ghi metrics của
+# đường chấm chính), rồi so với kết quả của model chính: tỷ lệ cùng quyết định, chênh lệch xác suất, độ trễ.
+# Hàng đợi đầy hoặc hệ thống đang bận (hàng đợi tính toán có tác vụ chờ) -> bỏ mẫu, không làm chậm request.
+
+# Bucket |chênh lệch xác suất| giữa model ứng viên và model chính
+DELTA_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+SHADOW_SAMPLES = metrics.REGISTRY.register(metrics.Counter(
+    "credit_shadow_samples", "Số hồ sơ (qua HARD RULES) được model ứng viên chấm thử, theo model.",
+    labelnames=("model",),
+))
+SHADOW_AGREEMENTS = metrics.REGISTRY.register(metrics.Counter(
+    "credit_shadow_agreements", "Số hồ sơ model ứng viên ra cùng quyết định với model chính, theo model.",
+    labelnames=("model",),
+))
+SHADOW_DELTA = metrics.REGISTRY.register(metrics.Histogram(
+    "credit_shadow_probability_delta", "|Xác suất ứng viên - xác suất model chính|, theo model.",
+    buckets=DELTA_BUCKETS, labelnames=("model",),
+))
+SHADOW_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "credit_shadow_batch_duration_seconds", "Thời gian model ứng viên chấm 1 batch shadow, theo model.",
+    labelnames=("model",),
+))
+SHADOW_DROPPED = metrics.REGISTRY.register(metrics.Counter(
+    "credit_shadow_dropped", "Số mẫu shadow bị bỏ, theo lý do (queue_full, busy).", labelnames=("reason",),
+))
+
+class ShadowScorer:
+    """
+    Chấm thử các model ứng viên (theo tên trong registry) trên mẫu traffic của /predict.
+
+    - submit(application, result, primary): gọi trên đường request, chỉ lấy mẫu + put_nowait.
+    - Thread nền (khởi động ở lần submit đầu, an toàn khi fork nhiều worker) gom tối đa batch_size mẫu
+      hoặc chờ tối đa max_wait_ms rồi chấm cả batch bằng từng ứng viên.
+    - busy: hàm trả về True khi hệ thống đang chịu tải (VD hàng đợi tính toán có tác vụ chờ) -> bỏ mẫu.
+    - Ứng viên được lấy từ registry mỗi batch -> bản nạp lại (hot reload) được dùng ngay; ứng viên chưa nạp
+      hoặc trùng model chính của hồ sơ thì bỏ qua.
+    """
+
+    def __init__(self, registry, models, sample_rate=0.1, max_queue=1000, batch_size=64, max_wait_ms=100.0,
+                 busy=None):
+        self.registry = registry
+        self.models = list(models)
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.busy = busy
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Thống kê theo model ứng viên
+        self._stats = {}
+        self.submitted = 0
+        self.dropped = {"queue_full": 0, "busy": 0}
+        self.batches = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return bool(self.models) and self.sample_rate > 0
+
+    def submit(self, application, result, primary):
+        """Lấy mẫu 1 hồ sơ /predict (CreditApplication + kết quả của model chính `primary`)."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        if self.busy is not None and self.busy():
+            self._drop("busy")
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((application, result, primary))
+            self.submitted += 1
+        except queue.Full:
+            self._drop("queue_full")
+
+    def _drop(self, reason):
+        self.dropped[reason] += 1
+        SHADOW_DROPPED.inc(reason)
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self.score_batch(batch)
+            except Exception:
+                self.errors += 1
+                logger.exception("Shadow scoring failed (%d mẫu)", len(batch))
+
+    def score_batch(self, batch):
+        """Chấm 1 batch mẫu bằng từng model ứng viên và cộng dồn thống kê."""
+        # Response dự phòng (model chính lỗi) không có gì để so sánh
+        batch = [item for item in batch if item[1].get("message") != FALLBACK_MESSAGE]
+        columns = applications_to_columns([application for application, _, _ in batch])
+        rule, _, _ = check_hard_rules(columns['AMT_INCOME_TOTAL'], columns['AMT_CREDIT'], columns['AMT_ANNUITY'])
+        passed = np.flatnonzero(rule == RULE_PASS)
+        self.batches += 1
+        if len(passed) == 0:
+            return
+        primary_prob = np.array([batch[i][1]["probability"] for i in passed], dtype=np.float64)
+        primary_reject = np.array([batch[i][1]["status"] == "REJECT" for i in passed])
+        primary_name = [batch[i][2] for i in passed]
+
+        for name in self.models:
+            if name not in self.registry:
+                continue
+            candidate = self.registry.get(name)
+            rows = [row for row, primary in enumerate(primary_name) if primary != name]
+            if not rows:
+                continue
+            start = time.perf_counter()
+            X = candidate.pipeline.transform(serving_columns(columns, passed[rows]))
+            prob = candidate.predictor.predict_proba(X)[:, 1]
+            seconds = time.perf_counter() - start
+            self._record(name, candidate.id, prob, prob >= candidate.threshold,
+                         primary_prob[rows], primary_reject[rows], seconds)
+
+    def _record(self, name, model_id, prob, reject, primary_prob, primary_reject, seconds):
+        delta = prob - primary_prob
+        agree = int(np.count_nonzero(reject == primary_reject))
+        n = len(prob)
+        SHADOW_SAMPLES.inc(name, amount=n)
+        SHADOW_AGREEMENTS.inc(name, amount=agree)
+        SHADOW_SECONDS.observe(seconds, name)
+        for value in np.abs(delta).tolist():
+            SHADOW_DELTA.observe(value, name)
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                "id": model_id, "samples": 0, "agreements": 0, "approve_to_reject": 0, "reject_to_approve": 0,
+                "sum_delta": 0.0, "sum_abs_delta": 0.0, "sum_sq_delta": 0.0, "max_abs_delta": 0.0,
+                "batches": 0, "seconds": 0.0, "max_batch_seconds": 0.0,
+            })
+            stats["id"] = model_id
+            stats["samples"] += n
+            stats["agreements"] += agree
+            stats["approve_to_reject"] += int(np.count_nonzero(reject & ~primary_reject))
+            stats["reject_to_approve"] += int(np.count_nonzero(~reject & primary_reject))
+            stats["sum_delta"] += float(delta.sum())
+            stats["sum_abs_delta"] += float(np.abs(delta).sum())
+            stats["sum_sq_delta"] += float((delta ** 2).sum())
+            stats["max_abs_delta"] = max(stats["max_abs_delta"], float(np.abs(delta).max()))
+            stats["batches"] += 1
+            stats["seconds"] += seconds
+            stats["max_batch_seconds"] = max(stats["max_batch_seconds"], seconds)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Cấu hình, số mẫu đã lấy/bỏ và so sánh theo từng model ứng viên."""
+        with self._lock:
+            models = {}
+            for name, s in self._stats.items():
+                n = s["samples"]
+                models[name] = {
+                    "id": s["id"],
+                    "samples": n,
+                    "agreement_rate": s["agreements"] / n,
+                    "approve_to_reject": s["approve_to_reject"],
+                    "reject_to_approve": s["reject_to_approve"],
+                    "mean_delta": s["sum_delta"] / n,
+                    "mean_abs_delta": s["sum_abs_delta"] / n,
+                    "rmse_delta": (s["sum_sq_delta"] / n) ** 0.5,
+                    "max_abs_delta": s["max_abs_delta"],
+                    "avg_batch_ms": 1000 * s["seconds"] / s["batches"],
+                    "max_batch_ms": 1000 * s["max_batch_seconds"],
+                    "avg_row_ms": 1000 * s["seconds"] / n,
+                }
+        return {
+            "enabled": self.enabled,
+            "candidates": self.models,
+            "sample_rate": self.sample_rate,
+            "batch_size": self.batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "submitted": self.submitted,
+            "dropped": dict(self.dropped),
+            "batches": self.batches,
+            "errors": self.errors,
+            "models": models,
+        }
@@ -0,0 +1,154 @@
+import numpy as np
+
+from scoring import INPUT_FIELDS, RULE_NAMES, RULE_PASS, check_hard_rules, credit_scores, rule_rejection
+
+# WHAT-IF: TÌM RANH GIỚI DUYỆT KHI THAY ĐỔI CẤU TRÚC KHOẢN VAY
+# Từ 1 hồ sơ, dựng toàn bộ lưới phương án (số tiền vay / tiền trả hàng tháng / thời hạn) thành 1 ma trận:
+# HARD RULES áp dụng bằng NumPy mask trên cả lưới, các phương án qua luật được chấm bằng 1 lần predict_proba
+# (không SHAP) -> lưới 1.000 điểm tốn cỡ vài request /predict thay vì 1.000 lượt gọi API.
+# Cùng FeaturePipeline, model và ngưỡng với /predict: mỗi điểm cho đúng xác suất/điểm như khi gửi riêng.
+
+# Các trục có thể quét; thời hạn (tháng) = AMT_CREDIT / AMT_ANNUITY nên chỉ quét được tối đa 2 trục,
+# trục còn lại được suy ra. Quét 1 trục: giữ nguyên AMT_ANNUITY (nếu quét AMT_CREDIT) hoặc AMT_CREDIT.
+SWEEP_FIELDS = ("AMT_CREDIT", "AMT_ANNUITY", "term_months")
+# Hướng tìm ranh giới của từng trục: vay nhiều nhất, trả hàng tháng ít nhất, thời hạn ngắn nhất
+OBJECTIVES = {"AMT_CREDIT": "max", "AMT_ANNUITY": "min", "term_months": "min"}
+
+# Xác suất/điểm của phương án bị HARD RULES từ chối (giống hệt response của /predict)
+_RULE_PROBABILITY = np.zeros(len(RULE_NAMES) + 1)
+_RULE_SCORE = np.zeros(len(RULE_NAMES) + 1, dtype=np.int64)
+for _code in RULE_NAMES:
+    _rejection = rule_rejection(_code, 0.0, 0.0)
+    _RULE_PROBABILITY[_code] = _rejection["probability"]
+    _RULE_SCORE[_code] = _rejection["credit_score"]
+
+def build_grid(application, axes):
+    """
+    application: dict các trường của CreditApplication; axes: {trục: mảng giá trị} (1-2 trục trong SWEEP_FIELDS).
+    Trả về (credit, annuity, term_months, shape): mảng phẳng theo thứ tự C của lưới shape.
+    """
+    unknown = set(axes) - set(SWEEP_FIELDS)
+    if unknown:
+        raise ValueError(f"Trục không hợp lệ: {sorted(unknown)}")
+    if not 1 <= len(axes) <= 2:
+        raise ValueError("Cần quét 1 hoặc 2 trục (thời hạn = số tiền vay / tiền trả hàng tháng).")
+
+    names = [field for field in SWEEP_FIELDS if field in axes]
+    grids = np.meshgrid(*(np.asarray(axes[name], dtype=np.float64) for name in names), indexing="ij")
+    shape = grids[0].shape
+    swept = {name: grid.ravel() for name, grid in zip(names, grids)}
+    n = int(np.prod(shape))
+
+    credit = swept.get("AMT_CREDIT")
+    annuity = swept.get("AMT_ANNUITY")
+    term = swept.get("term_months")
+    if term is None:
+        credit = np.full(n, application["AMT_CREDIT"], dtype=np.float64) if credit is None else credit
+        annuity = np.full(n, application["AMT_ANNUITY"], dtype=np.float64) if annuity is None else annuity
+        with np.errstate(divide="ignore", invalid="ignore"):
+            term = credit / annuity
+    elif annuity is None:
+        credit = np.full(n, application["AMT_CREDIT"], dtype=np.float64) if credit is None else credit
+        annuity = credit / term
+    else:
+        credit = annuity * term
+    return credit, annuity, term, shape
+
+def score_grid(application, credit, annuity, version):
+    """
+    Chấm mọi phương án: HARD RULES (mask) -> 1 lần transform + predict_proba cho các phương án qua luật.
+    Trả về (rule, probability, credit_score) theo từng điểm.
+    """
+    n = len(credit)
+    income = np.full(n, application["AMT_INCOME_TOTAL"], dtype=np.float64)
+    rule, _, _ = check_hard_rules(income, credit, annuity)
+    probs = _RULE_PROBABILITY[rule]
+    scores = _RULE_SCORE[rule]
+
+    passed = np.flatnonzero(rule == RULE_PASS)
+    if len(passed):
+        columns = {field: [application[field]] * len(passed) for field in INPUT_FIELDS}
+        columns["AMT_CREDIT"] = credit[passed]
+        columns["AMT_ANNUITY"] = annuity[passed]
+        columns["EXT_SOURCE_3"] = columns["EXT_SOURCE_2"]
+        X = version.pipeline.transform(columns)
+        probs[passed] = version.predictor.predict_proba(X)[:, 1]
+        scores[passed] = credit_scores(probs[passed], version.threshold)
+    return rule, probs, scores
+
+def _point(i, credit, annuity, term, probs, scores):
+    return {
+        "AMT_CREDIT": float(credit[i]), "AMT_ANNUITY": float(annuity[i]), "term_months": float(term[i]),
+        "probability": float(probs[i]), "credit_score": int(scores[i]),
+    }
+
+def approval_boundary(approved, values, objective, shape, target_axis):
+    """
+    Với mỗi giá trị của trục còn lại: chỉ số (phẳng) của phương án được duyệt có giá trị trục đích tốt nhất
+    (max/min theo objective), -1 nếu không phương án nào được duyệt.
+    Model cây không đơn điệu nên phía trong ranh giới vẫn có thể có điểm bị từ chối (xem "grid").
+    """
+    fill = -np.inf if objective == "max" else np.inf
+
+    # Đưa trục đích về cuối: mỗi dòng là 1 giá trị của trục còn lại
+    def rows_of(a):
+        return np.moveaxis(a.reshape(shape), target_axis, -1).reshape(-1, shape[target_axis])
+
+    masked = rows_of(np.where(approved, values, fill))
+    best = masked.argmax(axis=1) if objective == "max" else masked.argmin(axis=1)
+    rows = np.arange(len(best))
+    flat = rows_of(np.arange(approved.size))[rows, best]
+    return np.where(rows_of(approved)[rows, best], flat, -1)
+
+def what_if(application, axes, version, target=None):
+    """
+    Quét lưới phương án cho 1 hồ sơ và tìm ranh giới duyệt.
+    target: trục cần tối ưu (mặc định trục đầu tiên theo thứ tự SWEEP_FIELDS).
+    """
+    credit, annuity, term, shape = build_grid(application, axes)
+    if not np.all(np.isfinite(term)):
+        raise ValueError("AMT_ANNUITY phải lớn hơn 0 để tính thời hạn vay.")
+    names = [field for field in SWEEP_FIELDS if field in axes]
+    target = target or names[0]
+    if target not in names:
+        raise ValueError(f"Trục tối ưu '{target}' không nằm trong các trục được quét {names}.")
+
+    rule, probs, scores = score_grid(application, credit, annuity, version)
+    approved = (rule == RULE_PASS) & (probs < version.threshold)
+    values = {"AMT_CREDIT": credit, "AMT_ANNUITY": annuity, "term_months": term}
+    objective = OBJECTIVES[target]
+    boundary = approval_boundary(approved, values[target], objective, shape, names.index(target))
+
+    others = [name for name in names if name != target]
+    rows = []
+    for j, i in enumerate(boundary):
+        row = {name: float(axes[name][j]) for name in others}
+        row["best"] = None if i < 0 else _point(i, credit, annuity, term, probs, scores)
+        rows.append(row)
+    # Phương án tốt nhất trên toàn lưới; cùng giá trị trục đích thì lấy xác suất vỡ nợ thấp hơn
+    sign = -1 if objective == "max" else 1
+    candidates = [row["best"] for row in rows if row["best"] is not None]
+    best = min(candidates, key=lambda p: (sign * p[target], p["probability"])) if candidates else None
+
+    rule_names = [None] + [RULE_NAMES[code] for code in sorted(RULE_NAMES)]
+    return {
+        "model_version": version.id,
+        "threshold": float(version.threshold),
+        "axes": names,
+        "shape": list(shape),
+        "target": target,
+        "objective": objective,
+        "n_points": int(len(rule)),
+        "n_feasible": int(np.count_nonzero(rule == RULE_PASS)),
+        "n_approved": int(np.count_nonzero(approved)),
+        "best": best,
+        "boundary": rows,
+        # Mảng lồng nhau theo shape: phần tử [i][j] ứng với values[axes[0]][i], values[axes[1]][j]
+        "grid": {
+            "values": {name: np.asarray(axes[name], dtype=np.float64).tolist() for name in names},
+            "status": np.where(approved, "APPROVE", "REJECT").reshape(shape).tolist(),
+            "probability": probs.reshape(shape).tolist(),
+            "credit_score": scores.reshape(shape).tolist(),
+            "rule": np.array(rule_names, dtype=object)[rule].reshape(shape).tolist(),
+        },
+    }
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from paths import BACKEND_DIR
+from synthetic import make_applicants
+from bench_serving import percentiles
+from bench_startup import _free_port, _wait_for
+
+# QUÁ TẢI: GOODPUT VÀ ĐỘ TRỄ ĐUÔI KHI TẢI VƯỢT NĂNG LỰC (admission control, backend/admission.py)
+# Tải vòng hở (open-loop): request được gửi đều `rate` request/giây bất kể server trả lời nhanh hay chậm,
+# giống client thật. So sánh cấu hình mặc định (hàng đợi giới hạn + deadline) với "unbounded"
+# (COMPUTE_MAX_QUEUE=0, REQUEST_DEADLINE_MS=0: mọi request đều xếp hàng).
+# - goodput_rps: số response 200 trả về trong CLIENT_TIMEOUT giây, chia cho thời gian bắn tải
+# - ok_p50_ms / ok_p99_ms: độ trễ của request được nhận
+# - rejected: 429/503 (trả về nhanh, client có thể thử lại theo Retry-After); timeouts: client bỏ cuộc;
+#   errors: kết nối bị đóng
+
+CLIENT_TIMEOUT = float(os.getenv("BENCH_CLIENT_TIMEOUT", 5.0))
+UNBOUNDED_ENV = {"COMPUTE_MAX_QUEUE": "0", "REQUEST_DEADLINE_MS": "0"}
+
+class _Connection:
+    """Kết nối HTTP/1.1 keep-alive tối giản (client httpx tốn CPU đến mức chính nó thành nút thắt)."""
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+
+    @classmethod
+    async def open(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def post(self, path, body):
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server đóng kết nối")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            if name.lower() == b"content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+    def close(self):
+        self.writer.close()
+
+async def _open_loop(port, bodies, rate, duration, connections=256):
+    results = []
+    # Mở sẵn kết nối trước khi bắn tải; thiếu thì mở thêm
+    idle = [await _Connection.open("127.0.0.1", port) for _ in range(connections)]
+
+    async def post(conn, body):
+        try:
+            return conn, await conn.post("/predict", body)
+        except ConnectionError:
+            # Kết nối rảnh quá keep-alive timeout của server đã bị đóng: mở kết nối mới, gửi lại
+            conn.close()
+            conn = await _Connection.open("127.0.0.1", port)
+            return conn, await conn.post("/predict", body)
+
+    async def one(body):
+        conn = idle.pop() if idle else await _Connection.open("127.0.0.1", port)
+        start = time.perf_counter()
+        try:
+            conn, status = await asyncio.wait_for(post(conn, body), CLIENT_TIMEOUT)
+            results.append((status, time.perf_counter() - start))
+            idle.append(conn)
+        except asyncio.TimeoutError:
+            # Client bỏ cuộc: đóng kết nối (server vẫn có thể đang tính request này)
+            results.append(("timeout", time.perf_counter() - start))
+            conn.close()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            results.append(("error", time.perf_counter() - start))
+            conn.close()
+
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(int(rate * duration)):
+        delay = t0 + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(bodies[i % len(bodies)])))
+    await asyncio.gather(*tasks)
+    for conn in idle:
+        conn.close()
+    return results
+
+def bench_overload(rate, duration=10.0, env=None, timeout=120):
+    """Chạy uvicorn main:app (env bổ sung) rồi bắn tải vòng hở `rate` req/s trong `duration` giây."""
+    import httpx
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server_env = {**os.environ, "RESULT_CACHE_SIZE": "0", **(env or {})}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "error"],
+        cwd=BACKEND_DIR, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            _wait_for(client, f"{base}/readyz", 200, time.perf_counter() + timeout)
+        bodies = [json.dumps(payload).encode() for payload in make_applicants(500, seed=5)]
+        results = asyncio.run(_open_loop(port, bodies, rate, duration))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    ok = [latency for status, latency in results if status == 200]
+    rejected = [latency for status, latency in results if status in (429, 503)]
+    stats = percentiles(ok) if ok else {'p50_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'offered_rps': rate,
+        'goodput_rps': len(ok) / duration,
+        'ok_p50_ms': stats['p50_ms'],
+        'ok_p99_ms': stats['p99_ms'],
+        'rejected_429': sum(status == 429 for status, _ in results),
+        'rejected_503': sum(status == 503 for status, _ in results),
+        'rejected_p99_ms': percentiles(rejected)['p99_ms'] if rejected else 0.0,
+        'timeouts': sum(status == "timeout" for status, _ in results),
+        'errors': sum(status == "error" for status, _ in results),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Goodput và độ trễ khi quá tải: admission control vs không giới hạn")
+    parser.add_argument('--rate', type=float, default=200.0, help="Số request/giây gửi tới server")
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    for label, env in (("admission", None), ("unbounded", UNBOUNDED_ENV)):
+        row = bench_overload(args.rate, args.duration, env)
+        print(f"[{label}] " + ", ".join(f"{k}={v:.1f}" for k, v in row.items()))
@@ -0,0 +1,153 @@
+import time
+import asyncio
+import numpy as np
+
+import paths  # noqa: F401  (thêm backend/model_core vào sys.path)
+from synthetic import make_applicants
+
+# ĐỘ TRỄ TỪNG BƯỚC CỦA /predict VÀ THROUGHPUT HTTP
+# Các bước giống hệt đường chấm điểm của backend (scoring.score_applications):
+# validate (pydantic) -> columns -> hard_rules -> features (FeaturePipeline) -> predict_proba
+# -> shap_values -> top_reasons; "end_to_end" là score_batch (không tính validate).
+# bench_whatif: /predict/what-if quét cả lưới phương án trong 1 lần predict_proba.
+
+def percentiles(samples):
+    """samples: list thời gian (giây) -> p50/p90/p99/mean tính bằng ms."""
+    ms = np.asarray(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+    }
+
+def _time(fn, batches, repeats):
+    fn(batches[0])  # warm-up
+    samples = []
+    for i in range(repeats):
+        batch = batches[i % len(batches)]
+        start = time.perf_counter()
+        fn(batch)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+def bench_stages(main, batch_size, repeats, seed=0):
+    """Độ trễ từng bước khi chấm 1 batch `batch_size` hồ sơ (1 = 1 request /predict)."""
+    from scoring import (
+        RULE_PASS, applications_to_columns, check_hard_rules, serving_columns,
+        positive_class_shap, get_top_reasons
+    )
+
+    n_batches = max(1, min(repeats, 64))
+    raw = make_applicants(batch_size * n_batches, seed)
+    payloads = [raw[i * batch_size:(i + 1) * batch_size] for i in range(n_batches)]
+    apps = [[main.CreditApplication(**d) for d in p] for p in payloads]
+    columns = [applications_to_columns(a) for a in apps]
+    passed = []
+    for c in columns:
+        rule, _, _ = check_hard_rules(c['AMT_INCOME_TOTAL'], c['AMT_CREDIT'], c['AMT_ANNUITY'])
+        passed.append(np.flatnonzero(rule == RULE_PASS))
+    # Các bước model chỉ đo trên hồ sơ qua HARD RULES (batch rỗng thì lấy nguyên batch)
+    feature_inputs = [serving_columns(c, p if len(p) else np.arange(batch_size)) for c, p in zip(columns, passed)]
+    version = main.registry.get()
+    pipeline, predictor, explainer = version.pipeline, version.predictor, version.get_explainer()
+    matrices = [pipeline.transform(f) for f in feature_inputs]
+    shap_rows = [positive_class_shap(explainer.shap_values(X)) for X in matrices]
+    probs = [predictor.predict_proba(X)[:, 1] for X in matrices]
+    features = pipeline.features
+
+    def top_reasons(batch):
+        shap_values, prob = batch
+        return [get_top_reasons(s, features, is_reject=(p >= version.threshold)) for s, p in zip(shap_values, prob)]
+
+    stages = {
+        'validate': (lambda p: [main.CreditApplication(**d) for d in p], payloads),
+        'columns': (applications_to_columns, apps),
+        'hard_rules': (lambda c: check_hard_rules(c['AMT_INCOME_TOTAL'], c['AMT_CREDIT'], c['AMT_ANNUITY']), columns),
+        'features': (pipeline.transform, feature_inputs),
+        'predict_proba': (predictor.predict_proba, matrices),
+        'shap_values': (explainer.shap_values, matrices),
+        'top_reasons': (top_reasons, list(zip(shap_rows, probs))),
+        'end_to_end': (lambda a: main.score_batch(a, 'top3'), apps),
+    }
+    return {name: _time(fn, batches, repeats) for name, (fn, batches) in stages.items()}
+
+async def _http_load(app, payloads, concurrency, path):
+    import httpx
+    latencies = []
+    queue = list(reversed(payloads))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post(path, json=payloads[0])  # warm-up
+
+        async def worker():
+            while queue:
+                payload = queue.pop()
+                start = time.perf_counter()
+                response = await client.post(path, json=payload)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {'rps': len(payloads) / elapsed, **percentiles(latencies)}
+
+def bench_http(main, concurrency, n_requests, path='/predict', seed=1, n_unique=None):
+    """
+    Throughput end-to-end qua HTTP (client ASGI trong tiến trình) với `concurrency` request đồng thời.
+    n_unique: chỉ dùng n_unique hồ sơ khác nhau, gửi lặp lại (đo đường cache kết quả).
+    """
+    if n_unique:
+        unique = make_applicants(n_unique, seed)
+        payloads = [unique[i % n_unique] for i in range(n_requests)]
+    else:
+        payloads = make_applicants(n_requests, seed)
+        # Hồ sơ mới hoàn toàn -> không request nào trúng cache kết quả của lần đo trước
+        main.result_cache.clear()
+    result = asyncio.run(_http_load(main.app, payloads, concurrency, path))
+    return {'throughput_rps': result.pop('rps'), **{f'latency_{k}': v for k, v in result.items()}}
+
+def bench_whatif(main, n_requests, credit_steps=50, term_steps=20, seed=4):
+    """
+    Độ trễ /predict/what-if với lưới credit_steps x term_steps phương án (mặc định 1.000 điểm),
+    mỗi request 1 hồ sơ khác nhau; so với 1 request /predict khi xem kết quả.
+    """
+    payloads = [
+        {"application": app,
+         "AMT_CREDIT": {"min": 0.2 * app["AMT_CREDIT"], "max": 5 * app["AMT_CREDIT"], "steps": credit_steps},
+         "term_months": {"min": 6, "max": 360, "steps": term_steps}}
+        for app in make_applicants(n_requests, seed)
+    ]
+    result = asyncio.run(_http_load(main.app, payloads, 1, '/predict/what-if'))
+    return {'points': credit_steps * term_steps, **{f'latency_{k}': v for k, v in result.items() if k != 'rps'}}
+
+def bench_metrics_overhead(main, repeats, batch_size=1, explain='none', seed=2):
+    """
+    Chi phí ghi metrics (metrics.py) trên score_batch: đo xen kẽ bật/tắt để loại nhiễu.
+    Mặc định explain="none" (đường rẻ nhất) -> tỷ lệ overhead là cận trên.
+    """
+    import metrics
+
+    raw = make_applicants(batch_size * 64, seed)
+    apps = [[main.CreditApplication(**d) for d in raw[i * batch_size:(i + 1) * batch_size]] for i in range(64)]
+    was_enabled = metrics.is_enabled()
+    samples = {True: [], False: []}
+    try:
+        main.score_batch(apps[0], explain)  # warm-up
+        for i in range(repeats):
+            # Đảo thứ tự mỗi vòng để lượt chạy sau không luôn được hưởng cache ấm
+            for enabled in ((True, False) if i % 2 else (False, True)):
+                metrics.set_enabled(enabled)
+                start = time.perf_counter()
+                main.score_batch(apps[i % len(apps)], explain)
+                samples[enabled].append(time.perf_counter() - start)
+    finally:
+        metrics.set_enabled(was_enabled)
+    on, off = percentiles(samples[True]), percentiles(samples[False])
+    return {
+        'enabled_p50_ms': on['p50_ms'],
+        'disabled_p50_ms': off['p50_ms'],
+        'overhead_us': (on['p50_ms'] - off['p50_ms']) * 1000,
+        'overhead_pct': 100 * (on['p50_ms'] - off['p50_ms']) / off['p50_ms'],
+    }
@@ -0,0 +1,66 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from paths import BACKEND_DIR
+from synthetic import make_applicants
+
+# THỜI GIAN KHỞI ĐỘNG (COLD START) CỦA API
+# Chạy uvicorn trong tiến trình riêng rồi đo:
+# - bind_s: đến khi /healthz trả lời (server nhận kết nối)
+# - ready_s: đến khi /readyz trả về 200 (model đã tải + warm-up)
+# - first_predict_s: đến khi request /predict đầu tiên (gửi ngay khi ready) có kết quả
+
+POLL_INTERVAL = 0.01
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for(client, url, expect_status, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == expect_status:
+                return time.perf_counter()
+        except Exception:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"Hết thời gian chờ {url}")
+
+def bench_startup(timeout=120, env=None):
+    """Khởi động `uvicorn main:app` và đo bind / ready / request đầu tiên (giây, tính từ lúc chạy lệnh)."""
+    import httpx
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    payload = make_applicants(1, seed=7)[0]
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **(env or {})}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            deadline = start + timeout
+            bound = _wait_for(client, f"{base}/healthz", 200, deadline)
+            ready = _wait_for(client, f"{base}/readyz", 200, deadline)
+            client.post(f"{base}/predict", json=payload).raise_for_status()
+            first = time.perf_counter()
+            timings = client.get(f"{base}/readyz").json()["timings_s"]
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {
+        'bind_s': bound - start,
+        'ready_s': ready - start,
+        'first_predict_s': first - start,
+        'first_predict_after_ready_ms': (first - ready) * 1000,
+        **{f'server_{k}_s': v for k, v in timings.items()},
+    }
+
+if __name__ == '__main__':
+    for key, value in bench_startup().items():
+        print(f"{key:<32}{value:>10.3f}")
@@ -0,0 +1,130 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from paths import BACKEND_DIR
+from synthetic import make_applicants
+from bench_serving import percentiles
+from bench_startup import _free_port, _wait_for
+
+# THROUGHPUT VÀ RAM KHI PHỤC VỤ NHIỀU WORKER (backend/serve.py)
+# Với mỗi số worker N: chạy serve.py, bắn tải /predict từ nhiều tiến trình client trong `duration` giây,
+# đo throughput, độ trễ và RAM (RSS/PSS) của tiến trình cha + từng worker.
+# preload (mặc định): model nạp 1 lần trước khi fork; --no-preload: mỗi worker tự nạp (như uvicorn --workers).
+# Cache kết quả bị tắt để mọi request đều đi qua model.
+
+def _client(args):
+    import httpx
+
+    base, payloads, duration = args
+    latencies = []
+    deadline = time.perf_counter() + duration
+    with httpx.Client(base_url=base, timeout=30) as client:
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.post("/predict", json=payloads[i % len(payloads)]).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            i += 1
+    return latencies
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+def _memory(parent):
+    from serve import read_memory
+
+    workers = [read_memory(pid) for pid in _children(parent)]
+    workers = [m for m in workers if m]
+    main = read_memory(parent) or {'rss_mb': 0.0, 'pss_mb': 0.0}
+    return {
+        'worker_rss_mb': max((m['rss_mb'] for m in workers), default=0.0),
+        'worker_pss_mb': max((m['pss_mb'] for m in workers), default=0.0),
+        'worker_private_mb': max((m['private_mb'] for m in workers), default=0.0),
+        # RAM thực tế của cả nhóm tiến trình: PSS chia đều phần dùng chung nên cộng được
+        'total_pss_mb': main['pss_mb'] + sum(m['pss_mb'] for m in workers),
+        'total_rss_mb': main['rss_mb'] + sum(m['rss_mb'] for m in workers),
+    }
+
+def bench_workers(n_workers, preload=True, clients=None, duration=10.0, timeout=180):
+    """Chạy serve.py với n_workers worker và đo throughput / độ trễ / RAM dưới tải."""
+    import httpx
+
+    clients = clients or 2 * n_workers
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    cmd = [sys.executable, "serve.py", "--workers", str(n_workers), "--host", "127.0.0.1", "--port", str(port)]
+    if not preload:
+        cmd.append("--no-preload")
+    env = {**os.environ, "RESULT_CACHE_SIZE": "0", "SERVE_REPORT_DELAY": "1e9"}
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            deadline = time.perf_counter() + timeout
+            _wait_for(client, f"{base}/readyz", 200, deadline)
+            # Không preload: mỗi worker tự nạp -> chờ đến khi mọi worker đều sẵn sàng
+            # (kết nối mới mỗi lần kiểm tra để được phân cho worker khác)
+            ready_pids = set()
+            while len(ready_pids) < n_workers and time.perf_counter() < deadline:
+                r = client.get(f"{base}/readyz", headers={"Connection": "close"})
+                if r.status_code == 200:
+                    ready_pids.add(r.json()['pid'])
+                else:
+                    time.sleep(0.05)
+        idle = _memory(proc.pid)
+
+        payloads = make_applicants(500, seed=3)
+        url_payloads = [(f"{base}", payloads[i::clients], duration) for i in range(clients)]
+        with multiprocessing.get_context('spawn').Pool(clients) as pool:
+            results = pool.map(_client, url_payloads)
+        loaded = _memory(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    latencies = [x for r in results for x in r]
+    stats = percentiles(latencies)
+    return {
+        'workers': n_workers,
+        'preload': preload,
+        'clients': clients,
+        'throughput_rps': len(latencies) / duration,
+        'latency_p50_ms': stats['p50_ms'],
+        'latency_p99_ms': stats['p99_ms'],
+        **{f'idle_{k}': v for k, v in idle.items()},
+        **{f'loaded_{k}': v for k, v in loaded.items()},
+    }
+
+def scaling_table(worker_counts, preload=True, duration=10.0):
+    rows = [bench_workers(n, preload=preload, duration=duration) for n in worker_counts]
+    base = rows[0]['throughput_rps'] / rows[0]['workers']
+    for row in rows:
+        row['scaling_efficiency'] = row['throughput_rps'] / (base * row['workers'])
+    return rows
+
+if __name__ == '__main__':
+    from serve import available_cpus
+
+    parser = argparse.ArgumentParser(description="Throughput và RAM theo số worker của serve.py")
+    parser.add_argument('--workers', default=None, help="VD 1,2,4,8 (mặc định 1,2,4,... đến số CPU)")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--no-preload', action='store_true')
+    args = parser.parse_args()
+    cpus = available_cpus()
+    counts = [int(n) for n in args.workers.split(',')] if args.workers else \
+        sorted({2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus} | {cpus})
+
+    print(f"CPU: {cpus}, preload: {not args.no_preload}")
+    print(f"{'Worker':>7}{'req/s':>10}{'Hiệu suất':>11}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'RSS/worker':>12}{'PSS/worker':>12}{'Tổng PSS MB':>13}")
+    for row in scaling_table(counts, preload=not args.no_preload, duration=args.duration):
+        print(f"{row['workers']:>7}{row['throughput_rps']:>10.1f}{row['scaling_efficiency']:>11.0%}"
+              f"{row['latency_p50_ms']:>9.1f}{row['latency_p99_ms']:>9.1f}{row['loaded_worker_rss_mb']:>12.1f}"
+              f"{row['loaded_worker_pss_mb']:>12.1f}{row['loaded_total_pss_mb']:>13.1f}")
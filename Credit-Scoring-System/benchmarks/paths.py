@@ -0,0 +1,14 @@
+import os
+import sys
+
+# ĐƯỜNG DẪN DÙNG CHUNG CHO CÁC BENCHMARK (chạy từ bất kỳ thư mục nào)
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+MODEL_CORE_DIR = os.path.join(ROOT_DIR, 'model_core')
+DATA_PATH = os.path.join(ROOT_DIR, 'data', 'application_train.csv')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+for path in (BACKEND_DIR, MODEL_CORE_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
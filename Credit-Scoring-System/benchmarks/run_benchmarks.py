@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from paths import DATA_PATH, RESULTS_DIR
+
+# BỘ BENCHMARK CHO ĐƯỜNG PHỤC VỤ (/predict), THỜI GIAN KHỞI ĐỘNG API, CHẠY NHIỀU WORKER, QUÁ TẢI
+# VÀ BƯỚC TẢI DỮ LIỆU TRAIN
+# Kết quả lưu dạng JSON (metrics phẳng "nhóm.tên.chỉ_số") để so sánh giữa các lần chạy.
+# Có --baseline: chỉ số nào xấu đi quá --tolerance so với baseline thì suite trả về exit code 1.
+#
+# VD:
+#   python run_benchmarks.py --output results/baseline.json
+#   python run_benchmarks.py --baseline results/baseline.json --tolerance 0.25
+
+DEFAULT_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.25))
+# Chỉ số quá nhỏ (ms) dao động mạnh theo nhiễu hệ thống -> không dùng để đánh giá regression
+NOISE_FLOOR_MS = float(os.getenv("BENCH_NOISE_FLOOR_MS", 0.05))
+
+# (batch size, số lần lặp) cho phần đo từng bước; --quick giảm số lần lặp
+STAGE_BATCHES = [(1, 300), (64, 50), (1024, 10)]
+# (batch size, số lần lặp) khi đo overhead của metrics.py (bật/tắt xen kẽ)
+OVERHEAD_BATCHES = [(1, 2000), (64, 300)]
+HTTP_CONCURRENCY = [1, 8, 32]
+HTTP_REQUESTS = 400
+# Thời gian bắn tải (giây) cho mỗi cấu hình số worker của serve.py
+WORKERS_DURATION = 10.0
+# Tải vòng hở (req/s) khi đo quá tải: cần lớn hơn năng lực của server
+OVERLOAD_RATE = float(os.getenv("BENCH_OVERLOAD_RATE", 400))
+OVERLOAD_DURATION = 10.0
+
+def lower_is_better(name):
+    return name.endswith(('_ms', '_s', '_mb'))
+
+def is_gated(name):
+    """Chỉ số dùng để đánh giá regression: p50 độ trễ, throughput, thời gian tải/khởi động và RAM."""
+    return (name.endswith(('p50_ms', '_rps', 'load_s', 'ram_mb', 'total_pss_mb', 'bind_s', 'ready_s', 'first_predict_s'))
+            and not name.startswith(('overhead.', 'overload.unbounded.')))
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Trả về list regression (tên, baseline, hiện tại, % thay đổi) vượt quá tolerance."""
+    regressions = []
+    for name, value in current.items():
+        base = baseline.get(name)
+        if base is None or not is_gated(name) or base <= 0:
+            continue
+        if name.endswith('_ms') and max(base, value) < NOISE_FLOOR_MS:
+            continue
+        change = (value - base) / base
+        worse = change > tolerance if lower_is_better(name) else change < -tolerance
+        if worse:
+            regressions.append((name, base, value, change))
+    return regressions
+
+def run_serving(metrics, quick):
+    import main  # backend/main.py: tải model như khi chạy API
+    from bench_serving import bench_stages, bench_http, bench_metrics_overhead, bench_whatif
+
+    if not main.wait_until_ready():
+        raise RuntimeError(f"Backend chưa tải được model ({main.startup_state['error']}), không thể benchmark phần serving.")
+    for batch_size, repeats in STAGE_BATCHES:
+        repeats = max(5, repeats // 5) if quick else repeats
+        print(f"[serving] batch={batch_size}, {repeats} lần lặp")
+        for stage, stats in bench_stages(main, batch_size, repeats).items():
+            for key, value in stats.items():
+                metrics[f"serving.batch{batch_size}.{stage}.{key}"] = value
+
+    for batch_size, repeats in OVERHEAD_BATCHES:
+        repeats = repeats // 5 if quick else repeats
+        print(f"[metrics] overhead ghi metrics, batch={batch_size}, {repeats} lần lặp")
+        for key, value in bench_metrics_overhead(main, repeats, batch_size).items():
+            metrics[f"overhead.metrics.batch{batch_size}.{key}"] = value
+
+    n_requests = HTTP_REQUESTS // 4 if quick else HTTP_REQUESTS
+    for concurrency in HTTP_CONCURRENCY:
+        print(f"[http] /predict, concurrency={concurrency}, {n_requests} request")
+        for key, value in bench_http(main, concurrency, n_requests).items():
+            metrics[f"http.predict.c{concurrency}.{key}"] = value
+
+    n_sweeps = 20 if quick else 100
+    print(f"[http] /predict/what-if lưới 50x20, {n_sweeps} request")
+    for key, value in bench_whatif(main, n_sweeps).items():
+        metrics[f"http.whatif.grid1000.{key}"] = value
+
+    # Hồ sơ gửi lại (retry, double-click): 50 hồ sơ lặp lại -> phần lớn trúng cache kết quả
+    print(f"[http] /predict lặp lại 50 hồ sơ, concurrency=8, {n_requests} request")
+    main.result_cache.clear()
+    for key, value in bench_http(main, 8, n_requests, n_unique=50).items():
+        metrics[f"http.predict_repeat.c8.{key}"] = value
+
+def run_startup(metrics):
+    from bench_startup import bench_startup
+
+    print("[startup] uvicorn main:app -> /healthz, /readyz, /predict đầu tiên")
+    for key, value in bench_startup().items():
+        metrics[f"startup.{key}"] = value
+
+def run_workers(metrics, quick):
+    from bench_workers import bench_workers
+    from serve import available_cpus
+
+    duration = WORKERS_DURATION / 3 if quick else WORKERS_DURATION
+    for n_workers in sorted({1, available_cpus()}):
+        for preload in (True, False):
+            mode = "preload" if preload else "no_preload"
+            print(f"[workers] serve.py --workers {n_workers} ({mode}), {duration:.0f}s tải")
+            row = bench_workers(n_workers, preload=preload, duration=duration)
+            for key in ('throughput_rps', 'latency_p50_ms', 'latency_p99_ms', 'loaded_worker_pss_mb',
+                        'loaded_worker_private_mb', 'loaded_total_pss_mb'):
+                metrics[f"workers.n{n_workers}.{mode}.{key}"] = row[key]
+
+def run_overload(metrics, quick):
+    from bench_overload import bench_overload, UNBOUNDED_ENV
+
+    duration = OVERLOAD_DURATION / 2 if quick else OVERLOAD_DURATION
+    for mode, env in (("admission", None), ("unbounded", UNBOUNDED_ENV)):
+        print(f"[overload] {OVERLOAD_RATE:.0f} req/s vòng hở, {mode}, {duration:.0f}s")
+        for key, value in bench_overload(OVERLOAD_RATE, duration, env).items():
+            metrics[f"overload.{mode}.{key}"] = value
+
+def run_loaders(metrics):
+    from data_loader import benchmark_loaders
+
+    if not os.path.exists(DATA_PATH):
+        print(f"[loaders] Bỏ qua: không có {DATA_PATH}")
+        return
+    print("[loaders] CSV vs cache Parquet cho từng script train")
+    for row in benchmark_loaders(DATA_PATH):
+        prefix = f"loaders.{row['script'].replace('.py', '')}.{row['mode']}"
+        metrics[f"{prefix}.load_s"] = row['seconds']
+        metrics[f"{prefix}.ram_mb"] = row['ram_mb']
+        metrics[f"{prefix}.frame_mb"] = row['frame_mb']
+
+def print_summary(metrics):
+    for name in sorted(metrics):
+        if name.endswith(('p50_ms', 'p99_ms', '_rps', '_s', 'ram_mb', 'total_pss_mb')) and not name.startswith('startup.server_'):
+            print(f"  {name:<58}{metrics[name]:>14.3f}")
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark đường phục vụ và bước tải dữ liệu train.")
+    parser.add_argument('--only', choices=['serving', 'startup', 'workers', 'overload', 'loaders'], help="Chỉ chạy một nhóm benchmark")
+    parser.add_argument('--quick', action='store_true', help="Ít lần lặp hơn (kiểm tra nhanh)")
+    parser.add_argument('--output', help="File JSON kết quả (mặc định results/<thời gian>.json)")
+    parser.add_argument('--baseline', help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Mức xấu đi tối đa cho phép (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    metrics = {}
+    started = time.time()
+    if args.only in (None, 'serving'):
+        run_serving(metrics, args.quick)
+    if args.only in (None, 'startup'):
+        run_startup(metrics)
+    if args.only in (None, 'workers'):
+        run_workers(metrics, args.quick)
+    if args.only in (None, 'overload'):
+        run_overload(metrics, args.quick)
+    if args.only in (None, 'loaders'):
+        run_loaders(metrics)
+
+    result = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': args.quick,
+            'env': {k: v for k, v in os.environ.items()
+                    if k in ('INFERENCE_ENGINE', 'EXPLAIN_BACKEND', 'MICRO_BATCH_ENABLED', 'MICRO_BATCH_MAX_SIZE',
+                             'COMPUTE_CONCURRENCY', 'COMPUTE_MAX_QUEUE', 'REQUEST_DEADLINE_MS')},
+        },
+        'metrics': metrics,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print_summary(metrics)
+    print(f"Đã lưu kết quả: {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+        regressions = compare(metrics, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} chỉ số xấu đi quá {args.tolerance:.0%} so với {args.baseline}:")
+            for name, base, value, change in regressions:
+                print(f"  {name}: {base:.3f} -> {value:.3f} ({change:+.0%})")
+            return 1
+        print(f"\n✅ Không có regression vượt quá {args.tolerance:.0%} so với {args.baseline}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
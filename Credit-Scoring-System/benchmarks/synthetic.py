@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+from paths import DATA_PATH
+
+# HỒ SƠ GIẢ LẬP CHO BENCHMARK
+# Có data/application_train.csv: lấy mẫu nguyên dòng (giữ tương quan thu nhập / khoản vay / trả góp)
+# từ dữ liệu train. Không có thì sinh theo phân phối tham số gần giống dữ liệu Home Credit.
+# Số tiền trong dữ liệu train được nhân AMOUNT_SCALE để về thang VND mà API nhận (form nhập VND/năm),
+# để tỷ lệ hồ sơ qua HARD RULES và được model chấm điểm giống thực tế.
+
+AMOUNT_SCALE = float(os.getenv("BENCH_AMOUNT_SCALE", 1000))
+AMOUNT_FIELDS = ['AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY']
+APPLICANT_FIELDS = [
+    'AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_BIRTH', 'DAYS_EMPLOYED',
+    'NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS', 'EXT_SOURCE_2'
+]
+
+HOUSING_TYPES = ['House / apartment', 'With parents', 'Municipal apartment', 'Rented apartment',
+                 'Office apartment', 'Co-op apartment']
+HOUSING_P = [0.887, 0.048, 0.036, 0.016, 0.009, 0.004]
+FAMILY_STATUSES = ['Married', 'Single / not married', 'Civil marriage', 'Separated', 'Widow']
+FAMILY_P = [0.639, 0.148, 0.097, 0.064, 0.052]
+
+def _from_training_data(n, rng):
+    from data_loader import load_application_data
+    df = load_application_data(APPLICANT_FIELDS, csv_path=DATA_PATH).dropna()
+    rows = df.iloc[rng.integers(0, len(df), n)]
+    columns = {}
+    for field in APPLICANT_FIELDS:
+        values = rows[field].to_numpy()
+        if field in AMOUNT_FIELDS:
+            values = np.round(values.astype(np.float64) * AMOUNT_SCALE, 2)
+        columns[field] = values
+    return columns
+
+def _parametric(n, rng):
+    income = np.round(np.exp(rng.normal(12, 0.5, n)) * AMOUNT_SCALE, 2)
+    credit = np.round(np.exp(rng.normal(13, 0.7, n)) * AMOUNT_SCALE, 2)
+    annuity = np.round(credit / rng.uniform(10, 60, n), 2)
+    employed = -rng.integers(0, 15000, n)
+    employed[rng.random(n) < 0.18] = 365243  # Người hưu trí/không đi làm trong Home Credit
+    return {
+        'AMT_INCOME_TOTAL': income,
+        'AMT_CREDIT': credit,
+        'AMT_ANNUITY': annuity,
+        'DAYS_BIRTH': -rng.integers(7500, 25200, n),
+        'DAYS_EMPLOYED': employed,
+        'NAME_HOUSING_TYPE': rng.choice(HOUSING_TYPES, n, p=HOUSING_P),
+        'NAME_FAMILY_STATUS': rng.choice(FAMILY_STATUSES, n, p=FAMILY_P),
+        'EXT_SOURCE_2': rng.beta(4, 2, n),
+    }
+
+def make_applicants(n, seed=0):
+    """n hồ sơ giả lập dạng dict (giống body JSON của /predict)."""
+    rng = np.random.default_rng(seed)
+    columns = _from_training_data(n, rng) if os.path.exists(DATA_PATH) else _parametric(n, rng)
+    casts = {'DAYS_BIRTH': int, 'DAYS_EMPLOYED': int, 'NAME_HOUSING_TYPE': str, 'NAME_FAMILY_STATUS': str}
+    return [
+        {field: casts.get(field, float)(columns[field][i]) for field in APPLICANT_FIELDS}
+        for i in range(n)
+    ]
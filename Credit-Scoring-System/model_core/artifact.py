@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import importlib
+import numpy as np
+
+# ARTIFACT MODEL NATIVE: 1 FILE GỌN, CÓ PHIÊN BẢN, TẢI KHÔNG CẦN SKLEARN
+# Cặp joblib .pkl (LGBMClassifier + metadata) buộc backend import sklearn (~1.4s) và unpickle cả wrapper sklearn
+# mỗi lần tiến trình khởi động. File .artifact gồm:
+#   header (magic, phiên bản định dạng, độ dài manifest) + manifest JSON + các section căn lề 64 byte:
+#   - "model.txt": booster ở định dạng text native của LightGBM (nén zlib), nạp bằng lgb.Booster(model_str=...)
+#   - "engine/<tên>": bảng cây gọn của tree_engine.CompiledTreeEnsemble (engine NumPy không phải biên dịch lại)
+# Manifest: feature, cột category + từ điển category, preprocessing, ngưỡng, thông tin train, vị trí/kiểu/shape
+# và SHA-256 của từng section + checksum tổng (kiểm tra trước khi dùng).
+# Backend đọc file qua mmap (không đọc cả file vào bytes): model text được giải nén thẳng từ mmap, bảng cây của
+# engine được dựng từ view NumPy trên mmap.
+#
+# Các script train ghi artifact cạnh file .pkl. Xuất từ cặp .pkl đã có + so sánh kích thước/thời gian tải:
+#   python artifact.py v3 focused
+#   python artifact.py --all --compare
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARTIFACT_MAGIC = b"CSMODEL\x00"
+# Tăng khi đổi bố cục file (loader từ chối phiên bản lạ thay vì đọc sai)
+ARTIFACT_FORMAT_VERSION = 1
+ARTIFACT_SUFFIX = ".artifact"
+# magic, phiên bản định dạng, dự trữ, độ dài manifest (byte)
+_HEADER = struct.Struct("<8sIIQ")
+_ALIGN = 64
+MODEL_TEXT_SECTION = "model.txt"
+ENGINE_PREFIX = "engine/"
+
+class ArtifactError(ValueError):
+    """File artifact hỏng, sai checksum, khác phiên bản định dạng, hoặc model và metadata không khớp nhau."""
+
+# Bộ file không hậu tố không phải 1 phiên bản: lgbm_credit_model.pkl do train.py ghi (one-hot, danh sách feature
+# trong model_features.pkl), còn model_metadata.pkl là metadata cũ của train_advanced.py (nay ghi ra "final")
+BASE_VERSION_ERROR = (
+    "Phiên bản 'base' không dùng được: lgbm_credit_model.pkl (train.py) và model_metadata.pkl (train_advanced.py) "
+    "không cùng 1 lần train. Dùng phiên bản có cặp file khớp nhau, VD 'v3' hoặc 'focused'."
+)
+
+def version_suffix(version):
+    """Hậu tố tên file của phiên bản: lgbm_credit_model_<version>.* / model_metadata_<version>.pkl."""
+    if version == "base":
+        raise ValueError(BASE_VERSION_ERROR)
+    return f"_{version}"
+
+def artifact_path(model_dir, version):
+    """Đường dẫn artifact theo quy ước tên của registry."""
+    return os.path.join(model_dir, f"lgbm_credit_model{version_suffix(version)}{ARTIFACT_SUFFIX}")
+
+# Module con của lightgbm cần sklearn và các tên lightgbm/__init__.py export từ chúng
+_SKLEARN_PARTS = {
+    'sklearn': ('LGBMModel', 'LGBMClassifier', 'LGBMRegressor', 'LGBMRanker'),
+    'plotting': ('create_tree_digraph', 'plot_importance', 'plot_metric', 'plot_split_value_histogram', 'plot_tree'),
+    'dask': ('DaskLGBMClassifier', 'DaskLGBMRanker', 'DaskLGBMRegressor'),
+}
+# Tên lightgbm.engine lấy từ lightgbm.compat lúc import (lgb.cv dùng StratifiedKFold của sklearn)
+_ENGINE_SKLEARN_NAMES = ('SKLEARN_INSTALLED', '_LGBMBaseCrossValidator', '_LGBMGroupKFold', '_LGBMStratifiedKFold')
+
+class _SklearnSupport:
+    """
+    Sau khi lightgbm được import không kèm sklearn: nạp lại phần tích hợp sklearn khi có code cần tới
+    -> tiến trình không bị thay đổi ngầm (LGBMClassifier, joblib.load file .pkl, lgb.cv vẫn dùng bình thường).
+    - import lightgbm.sklearn / plotting / dask (VD unpickle LGBMClassifier): finder trong sys.meta_path
+    - lgb.LGBMClassifier, from lightgbm import plot_importance, ...: __getattr__ của module lightgbm
+    Cả 2 đều nạp lại lightgbm.compat (lúc này mới import sklearn) trước khi import module con.
+    """
+
+    def __init__(self, lightgbm):
+        self.lightgbm = lightgbm
+        self.restored = False
+
+    def install(self):
+        # Module con đã được import với lớp giả thay cho sklearn -> bỏ đi, import lại khi cần
+        for part, names in _SKLEARN_PARTS.items():
+            sys.modules.pop(f'lightgbm.{part}', None)
+            for name in (part,) + names:
+                self.lightgbm.__dict__.pop(name, None)
+        self.lightgbm.__getattr__ = self.getattr
+        sys.meta_path.insert(0, self)
+
+    def find_spec(self, name, path=None, target=None):
+        if name.startswith('lightgbm.') and name[len('lightgbm.'):] in _SKLEARN_PARTS:
+            self.restore_compat()
+        # Để các finder mặc định import module như bình thường
+        return None
+
+    def restore_compat(self):
+        if self.restored:
+            return
+        self.restored = True
+        sys.meta_path.remove(self)
+        compat = importlib.reload(self.lightgbm.compat)
+        for name in _ENGINE_SKLEARN_NAMES:
+            setattr(self.lightgbm.engine, name, getattr(compat, name))
+
+    def getattr(self, name):
+        part = next((p for p, names in _SKLEARN_PARTS.items() if name == p or name in names), None)
+        if part is None:
+            raise AttributeError(f"module 'lightgbm' has no attribute {name!r}")
+        self.restore_compat()
+        try:
+            module = importlib.import_module(f'lightgbm.{part}')
+        except ImportError as e:
+            # Như lightgbm/__init__.py: thiếu thư viện phụ thuộc (VD matplotlib, dask) thì không có tên này
+            raise AttributeError(f"module 'lightgbm' has no attribute {name!r}") from e
+        return module if name == part else getattr(module, name)
+
+def import_lightgbm():
+    """
+    import lightgbm mà không kéo theo sklearn (~1s): artifact chỉ dùng lgb.Booster, sklearn chỉ cần cho
+    LGBMClassifier. Phần tích hợp sklearn được nạp lại khi có code dùng tới (_SklearnSupport), nên tiến trình
+    vẫn dùng LGBMClassifier / file .pkl như bình thường. Nếu sklearn hoặc lightgbm đã được import thì giữ nguyên.
+    """
+    if 'lightgbm' not in sys.modules and 'sklearn' not in sys.modules:
+        sys.modules['sklearn'] = None
+        try:
+            import lightgbm
+        finally:
+            del sys.modules['sklearn']
+        if not lightgbm.compat.SKLEARN_INSTALLED:
+            _SklearnSupport(lightgbm).install()
+    import lightgbm
+    return lightgbm
+
+def _json_safe(obj):
+    """Metadata của script train -> kiểu JSON (số NumPy -> số Python, tuple -> list)."""
+    if isinstance(obj, dict):
+        return {str(k): _json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_safe(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _json_safe(obj.tolist())
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def export_artifact(model, metadata, path, engine_tables=True):
+    """
+    Ghi model (LGBMClassifier hoặc lgb.Booster) + metadata ra file artifact (file tạm rồi đổi tên,
+    registry không bao giờ đọc phải file ghi dở). Trả về manifest.
+    engine_tables: lưu kèm bảng cây của engine NumPy (bỏ qua nếu model không biên dịch được).
+    """
+    from processing import FeaturePipeline
+    from tree_engine import CompiledTreeEnsemble
+
+    booster = getattr(model, 'booster_', model)
+    # Model và metadata phải từ cùng 1 lần train (VD lgbm_credit_model.pkl của train.py + model_metadata.pkl của
+    # train_advanced.py thì không) -> không ghi artifact mà backend không nạp được
+    if booster.feature_name() != list(metadata['features']):
+        raise ArtifactError(
+            f"feature của model ({booster.num_feature()}) khác metadata['features'] ({len(metadata['features'])}): "
+            f"model và metadata không cùng 1 lần train"
+        )
+    pipeline = FeaturePipeline.from_metadata(metadata, model)
+    sections = {MODEL_TEXT_SECTION: (zlib.compress(booster.model_to_string().encode(), 6), None)}
+    engine_info = None
+    if engine_tables:
+        try:
+            engine = CompiledTreeEnsemble.from_model(booster, pipeline.cat_features)
+        except ValueError as e:
+            print(f"⚠️ Bỏ qua bảng cây engine NumPy: {e}")
+        else:
+            engine_info, arrays = engine.to_arrays()
+            for name, array in arrays.items():
+                sections[ENGINE_PREFIX + name] = (np.ascontiguousarray(array), array)
+
+    entries, offset, checksum = {}, 0, hashlib.sha256()
+    for name, (payload, array) in sections.items():
+        data = payload.tobytes() if isinstance(payload, np.ndarray) else payload
+        digest = hashlib.sha256(data).hexdigest()
+        checksum.update(digest.encode())
+        entries[name] = {'offset': offset, 'nbytes': len(data), 'sha256': digest}
+        if array is not None:
+            entries[name].update(dtype=array.dtype.str, shape=list(array.shape))
+        else:
+            entries[name].update(codec='zlib')
+        sections[name] = data
+        offset = _align(offset + len(data))
+
+    import lightgbm
+    manifest = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'lightgbm_version': lightgbm.__version__,
+        'num_trees': int(booster.num_trees()),
+        'features': list(pipeline.features),
+        'cat_features': list(pipeline.cat_features),
+        'categories': _json_safe(pipeline.categories),
+        'preprocessing': _json_safe(metadata.get('preprocessing', {})),
+        'threshold': _json_safe(metadata.get('threshold')),
+        # Các khóa còn lại của metadata (training, hpo, median_fill...) để registry/script đọc như metadata cũ
+        'metadata': _json_safe({k: v for k, v in metadata.items()
+                                if k not in ('features', 'cat_features', 'categories', 'preprocessing', 'threshold')}),
+        'engine': engine_info,
+        'sections': entries,
+        'checksum': checksum.hexdigest(),
+    }
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode()
+    data_start = _align(_HEADER.size + len(manifest_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT_VERSION, 0, len(manifest_bytes)))
+        f.write(manifest_bytes)
+        for name, data in sections.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(data)
+    os.replace(tmp_path, path)
+    return manifest
+
+def read_artifact(path, verify=True):
+    """
+    Mở artifact bằng mmap. Trả về (manifest, {tên section: memoryview/mảng NumPy chỉ đọc trên mmap}).
+    verify: kiểm tra SHA-256 từng section và checksum tổng -> ArtifactError nếu lệch.
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm.size() < _HEADER.size:
+        raise ArtifactError(f"{path}: file quá ngắn")
+    magic, version, _, manifest_len = _HEADER.unpack_from(mm, 0)
+    if magic != ARTIFACT_MAGIC:
+        raise ArtifactError(f"{path}: không phải file artifact model")
+    if version != ARTIFACT_FORMAT_VERSION:
+        raise ArtifactError(f"{path}: định dạng phiên bản {version}, loader hỗ trợ {ARTIFACT_FORMAT_VERSION}")
+    manifest = json.loads(mm[_HEADER.size:_HEADER.size + manifest_len])
+    data_start = _align(_HEADER.size + manifest_len)
+
+    view = memoryview(mm)
+    sections, checksum = {}, hashlib.sha256()
+    for name, entry in manifest['sections'].items():
+        start = data_start + entry['offset']
+        data = view[start:start + entry['nbytes']]
+        if len(data) != entry['nbytes']:
+            raise ArtifactError(f"{path}: section '{name}' bị cắt cụt")
+        if verify:
+            digest = hashlib.sha256(data).hexdigest()
+            if digest != entry['sha256']:
+                raise ArtifactError(f"{path}: sai SHA-256 ở section '{name}'")
+            checksum.update(digest.encode())
+        if 'dtype' in entry:
+            data = np.frombuffer(data, dtype=np.dtype(entry['dtype'])).reshape(entry['shape'])
+        sections[name] = data
+    if verify and checksum.hexdigest() != manifest['checksum']:
+        raise ArtifactError(f"{path}: sai checksum tổng")
+    return manifest, sections
+
+def manifest_metadata(manifest):
+    """Metadata dạng dict như file model_metadata*.pkl (cho FeaturePipeline, registry, script train)."""
+    return dict(
+        manifest['metadata'],
+        features=manifest['features'],
+        cat_features=manifest['cat_features'],
+        categories=manifest['categories'],
+        preprocessing=manifest['preprocessing'],
+        threshold=manifest['threshold'],
+    )
+
+def load_artifact(path, verify=True, engine=False):
+    """
+    Tải artifact: trả về (lgb.Booster, metadata, CompiledTreeEnsemble hoặc None).
+    engine=True: dựng engine NumPy từ bảng cây đã lưu (None nếu artifact không có bảng cây).
+    """
+    manifest, sections = read_artifact(path, verify)
+    lgb = import_lightgbm()
+    booster = lgb.Booster(model_str=zlib.decompress(sections[MODEL_TEXT_SECTION]).decode())
+    compiled = None
+    if engine and manifest.get('engine') is not None:
+        from tree_engine import CompiledTreeEnsemble
+        arrays = {name[len(ENGINE_PREFIX):]: data for name, data in sections.items() if name.startswith(ENGINE_PREFIX)}
+        compiled = CompiledTreeEnsemble.from_arrays(manifest['engine'], arrays)
+    return booster, manifest_metadata(manifest), compiled
+
+def export_version(version, model_dir=MODEL_DIR):
+    """Xuất artifact từ cặp lgbm_credit_model*.pkl + model_metadata*.pkl của phiên bản `version`."""
+    import joblib
+    suffix = version_suffix(version)
+    model = joblib.load(os.path.join(model_dir, f"lgbm_credit_model{suffix}.pkl"))
+    metadata = joblib.load(os.path.join(model_dir, f"model_metadata{suffix}.pkl"))
+    path = artifact_path(model_dir, version)
+    export_artifact(model, metadata, path)
+    return path
+
+# SO SÁNH VỚI JOBLIB: mỗi lần đo chạy trong 1 tiến trình mới (tính cả thời gian import lightgbm/sklearn)
+def _measure_load(args):
+    kind, paths = args
+    start = time.perf_counter()
+    if kind == 'joblib':
+        import joblib
+        model = joblib.load(paths[0])
+        joblib.load(paths[1])
+        booster = model.booster_
+    else:
+        booster, _, _ = load_artifact(paths[0])
+    seconds = time.perf_counter() - start
+    return seconds, 'sklearn' in sys.modules, int(booster.num_trees())
+
+def compare_load(version, model_dir=MODEL_DIR, repeat=3):
+    """Kích thước file và thời gian tải (tiến trình mới, trung vị `repeat` lần) của joblib .pkl vs artifact."""
+    import multiprocessing
+    suffix = version_suffix(version)
+    pkl = (os.path.join(model_dir, f"lgbm_credit_model{suffix}.pkl"), os.path.join(model_dir, f"model_metadata{suffix}.pkl"))
+    native = (artifact_path(model_dir, version),)
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for kind, paths in (('joblib', pkl), ('artifact', native)):
+        runs = []
+        for _ in range(repeat):
+            with ctx.Pool(1, maxtasksperchild=1) as pool:
+                runs.append(pool.map(_measure_load, [(kind, paths)])[0])
+        rows.append({
+            'version': version, 'format': kind, 'bytes': sum(os.path.getsize(p) for p in paths),
+            'seconds': float(np.median([r[0] for r in runs])), 'sklearn_imported': runs[0][1], 'trees': runs[0][2],
+        })
+    return rows
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất artifact model native từ cặp file joblib .pkl.")
+    parser.add_argument('versions', nargs='*', help="Phiên bản cần xuất (VD: v3 focused)")
+    parser.add_argument('--all', action='store_true', help="Mọi phiên bản có file .pkl trong --model-dir")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--compare', action='store_true', help="So sánh kích thước/thời gian tải với joblib")
+    args = parser.parse_args(argv)
+
+    versions = list(args.versions)
+    if args.all:
+        for name in sorted(os.listdir(args.model_dir)):
+            if name.startswith('lgbm_credit_model') and name.endswith('.pkl'):
+                stem = name[len('lgbm_credit_model'):-len('.pkl')]
+                meta = os.path.join(args.model_dir, f"model_metadata{stem}.pkl")
+                if not stem:
+                    print(f"⚠️ Bỏ qua {name}: {BASE_VERSION_ERROR}")
+                elif os.path.exists(meta):
+                    versions.append(stem.lstrip('_'))
+    if not versions:
+        parser.error("Cần ít nhất 1 phiên bản hoặc --all")
+
+    exported = []
+    for version in versions:
+        try:
+            path = export_version(version, args.model_dir)
+        except ArtifactError as e:
+            if not args.all:
+                raise
+            # --all (lúc build image): bỏ qua phiên bản lệch thay vì ghi artifact không nạp được
+            print(f"⚠️ Bỏ qua phiên bản '{version}': {e}")
+            continue
+        exported.append(version)
+        print(f"Đã xuất {path} ({os.path.getsize(path) / 1e6:.2f} MB)")
+    if args.compare:
+        print(f"\n{'Phiên bản':<12}{'Định dạng':<12}{'Kích thước (MB)':>17}{'Tải (s)':>10}{'Import sklearn':>16}")
+        for version in exported:
+            for row in compare_load(version, args.model_dir):
+                print(f"{row['version']:<12}{row['format']:<12}{row['bytes'] / 1e6:>17.2f}{row['seconds']:>10.3f}"
+                      f"{'có' if row['sklearn_imported'] else 'không':>16}")
+
+if __name__ == "__main__":
+    main_cli()
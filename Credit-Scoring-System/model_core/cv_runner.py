@@ -0,0 +1,333 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import lightgbm as lgb
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import roc_auc_score
+from ensemble import average_boosters
+from dataset_cache import DATASET_CACHE_ENABLED, cached_dataset, fold_datasets, load_dataset, native_params
+
+# CHẠY CROSS-VALIDATION SONG SONG THEO FOLD
+# LightGBM không tăng tốc tuyến tính theo số core, nên chia core cho nhiều fold chạy cùng lúc
+# (số fold song song x số thread mỗi fold) thường nhanh hơn chạy lần lượt từng fold với n_jobs=-1.
+# Ma trận train được ghi 1 lần ra file .npy và các tiến trình con đọc qua memory-map (không copy/pickle).
+# Số thread mỗi fold đổi theo cách chạy (lần lượt / song song): mặc định fold và model cuối được train với
+# deterministic=True + force_col_wise=True (CV_DETERMINISTIC) nên kết quả không phụ thuộc số thread
+# -> OOF AUC và threshold không đổi. Tắt đi thì kết quả có thể lệch nhẹ giữa các số thread.
+# Dataset đã chia bin của toàn bộ dữ liệu được cache (dataset_cache.py), mỗi fold chỉ lấy subset theo chỉ số dòng
+# và train bằng lgb.train (cùng tham số, metric, early stopping như LGBMClassifier). DATASET_CACHE=0: cách cũ.
+
+# N_PARALLEL_FOLDS: số fold chạy cùng lúc ("auto" = mỗi fold ít nhất 4 core, 1 = chạy lần lượt như cũ)
+# THREADS_PER_FOLD: số thread LightGBM mỗi fold ("auto" = chia đều core; khi chạy lần lượt thì dùng tất cả)
+N_PARALLEL_FOLDS = os.getenv("N_PARALLEL_FOLDS", "auto")
+THREADS_PER_FOLD = os.getenv("THREADS_PER_FOLD", "auto")
+MIN_THREADS_PER_FOLD = 4
+
+# FINALIZE_MODE: cách tạo model deploy sau CV
+#   "retrain"  : train lại trên toàn bộ dữ liệu với n_estimators = trung bình best_iteration của các fold
+#   "ensemble" : không train lại, gộp các model fold thành 1 model trung bình (ensemble.py)
+#   "full"     : train lại trên toàn bộ dữ liệu với đủ n_estimators của params (như train_focused.py)
+FINALIZE_MODE = os.getenv("FINALIZE_MODE", "retrain")
+FINALIZE_MODES = ("retrain", "ensemble", "full")
+# Hai phương án luôn được so sánh trong metadata['training']['finalize_comparison'] (thời gian + OOF AUC).
+# Ensemble gần như không tốn thời gian nên luôn được dựng để đo; retrain chỉ chạy thêm (để đo thời gian, không
+# lưu model) khi FINALIZE_COMPARE=1, nếu không thì thời gian của nó để None.
+FINALIZE_OPTIONS = ("retrain", "ensemble")
+FINALIZE_COMPARE = os.getenv("FINALIZE_COMPARE", "0") == "1"
+
+# CV_DETERMINISTIC=0: để LightGBM tự chọn cách dựng histogram (có thể nhanh hơn chút, kết quả lệch nhẹ theo số thread)
+CV_DETERMINISTIC = os.getenv("CV_DETERMINISTIC", "1") == "1"
+# LightGBM chỉ đảm bảo deterministic khi cố định row-wise/col-wise
+DETERMINISTIC_PARAMS = {'deterministic': True, 'force_col_wise': True}
+
+def deterministic_params(params, enabled=CV_DETERMINISTIC):
+    """params + DETERMINISTIC_PARAMS (nếu bật) -> kết quả train giống nhau với mọi số thread."""
+    return dict(params, **DETERMINISTIC_PARAMS) if enabled else dict(params)
+
+def resolve_parallelism(n_splits, n_parallel=N_PARALLEL_FOLDS, threads_per_fold=THREADS_PER_FOLD):
+    """Trả về (số fold song song, n_jobs mỗi fold) từ cấu hình và số core của máy."""
+    cpus = os.cpu_count() or 1
+    if n_parallel == "auto":
+        n_parallel = max(1, min(n_splits, cpus // MIN_THREADS_PER_FOLD))
+    n_parallel = max(1, min(int(n_parallel), n_splits))
+    if threads_per_fold == "auto":
+        threads_per_fold = -1 if n_parallel == 1 else max(1, cpus // n_parallel)
+    return n_parallel, int(threads_per_fold)
+
+def fold_native_params(params, threads, eval_metric='auc'):
+    """
+    Tham số lgb.train cho 1 fold, giống hệt run_cv (dùng chung với hpo.py -> AUC so sánh được với nhau):
+    deterministic_params + metric như LGBMClassifier khi early stopping (eval_metric và binary_logloss).
+    """
+    metric = list(dict.fromkeys(m for m in (eval_metric, 'binary_logloss') if m))
+    return native_params(deterministic_params(params), threads, metric)
+
+def frame_to_matrix(X, cat_features=(), out=None):
+    """
+    DataFrame -> ma trận float64 giống cách LightGBM đọc DataFrame:
+    cột category được thay bằng mã category (NaN nếu thiếu).
+    out: mảng đích (VD np.lib.format.open_memmap) để ghi thẳng ra file thay vì giữ thêm 1 bản trong RAM.
+    """
+    matrix = np.empty(X.shape, dtype=np.float64) if out is None else out
+    for j, col in enumerate(X.columns):
+        if col in cat_features:
+            codes = X[col].cat.codes.to_numpy().astype(np.float64)
+            codes[codes < 0] = np.nan
+            matrix[:, j] = codes
+        else:
+            matrix[:, j] = X[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return matrix
+
+def open_matrix(path, shape):
+    """File .npy float64 mới, mở dạng memory-map để ghi."""
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+
+def _train_cached(train_idx, valid_idx, params, fit_options):
+    """Train 1 fold bằng lgb.train trên subset của Dataset đã cache (không copy ma trận, không chia bin lại)."""
+    full = load_dataset(fit_options['dataset_path'], params)
+    train, valid = fold_datasets(full, train_idx, valid_idx, params.get('class_weight') == 'balanced')
+    n_jobs = params.get('n_jobs', -1)
+    # n_jobs âm theo quy ước joblib giống LGBMClassifier (-1 = tất cả core)
+    threads = n_jobs if n_jobs > 0 else max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    callbacks = [lgb.early_stopping(fit_options['early_stopping_rounds'], verbose=fit_options['verbose'])]
+    if fit_options['log_period'] is not None:
+        callbacks.append(lgb.log_evaluation(fit_options['log_period']))
+    return lgb.train(
+        fold_native_params(params, threads, fit_options['eval_metric']), train,
+        num_boost_round=params.get('n_estimators', 100), valid_sets=[valid], callbacks=callbacks,
+    )
+
+def fold_splits(y, n_splits=5, random_state=42):
+    """(train_idx, valid_idx) của StratifiedKFold. Chỉ phụ thuộc nhãn -> dùng chung cho mọi feature set."""
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    return list(folds.split(np.zeros((len(y), 1)), np.asarray(y)))
+
+def fit_fold(task):
+    """Train 1 fold. Chạy trong tiến trình chính (lần lượt) hoặc tiến trình con (song song)."""
+    n_fold, train_idx, valid_idx, matrix_path, y, params, fit_options = task
+    X = np.load(matrix_path, mmap_mode='r')
+    X_valid, y_valid = X[valid_idx], y[valid_idx]
+
+    start = time.perf_counter()
+    if fit_options['dataset_path'] is not None:
+        booster = _train_cached(train_idx, valid_idx, params, fit_options)
+    else:
+        clf = lgb.LGBMClassifier(**params)
+        callbacks = [lgb.early_stopping(fit_options['early_stopping_rounds'], verbose=fit_options['verbose'])]
+        if fit_options['log_period'] is not None:
+            callbacks.append(lgb.log_evaluation(fit_options['log_period']))
+        clf.fit(
+            X[train_idx], y[train_idx],
+            eval_set=[(X_valid, y_valid)],
+            eval_metric=fit_options['eval_metric'],
+            feature_name=fit_options['feature_names'],
+            categorical_feature=fit_options['categorical_feature'],
+            callbacks=callbacks
+        )
+        booster = clf.booster_
+
+    # = clf.predict_proba(X_valid)[:, 1] (booster dùng best_iteration), không cảnh báo tên cột với numpy
+    valid_preds = booster.predict(X_valid)
+    return {
+        'fold': n_fold,
+        'valid_idx': valid_idx,
+        'valid_preds': valid_preds,
+        'auc': roc_auc_score(y_valid, valid_preds),
+        'best_iteration': booster.best_iteration or booster.current_iteration(),
+        # Model dạng text (chỉ giữ tới best_iteration) để gửi về tiến trình chính
+        'model_str': booster.model_to_string(),
+        'seconds': time.perf_counter() - start,
+    }
+
+def prepare_cv(X, y, params, splits, work_dir, cat_features=(), eval_metric='auc', early_stopping_rounds=100,
+               log_period=None, verbose=True, use_dataset_cache=DATASET_CACHE_ENABLED):
+    """
+    Ghi ma trận của X ra work_dir/X.npy (+ Dataset đã chia bin vào cache) và trả về các task của fit_fold,
+    mỗi fold 1 task. params: tham số LGBMClassifier, n_jobs = số thread mỗi fold.
+    Dùng bởi run_cv và train_all.py (fold của nhiều model chạy chung 1 pool).
+    """
+    y = np.asarray(y)
+    params = deterministic_params(params)
+    feature_names = list(X.columns)
+    cat_features = [c for c in feature_names if c in set(cat_features)]
+    fit_options = {
+        'eval_metric': eval_metric,
+        'early_stopping_rounds': early_stopping_rounds,
+        'log_period': log_period,
+        'feature_names': feature_names,
+        'categorical_feature': cat_features or 'auto',
+        'verbose': verbose,
+    }
+    # class_weight dạng dict chưa hỗ trợ ở lgb.train -> dùng LGBMClassifier như cũ
+    use_dataset_cache = use_dataset_cache and params.get('class_weight') in (None, 'balanced')
+
+    os.makedirs(work_dir, exist_ok=True)
+    matrix_path = os.path.join(work_dir, 'X.npy')
+    # Ghi thẳng ra file theo từng cột (không giữ thêm 1 bản float64 của cả ma trận trong RAM)
+    matrix = frame_to_matrix(X, cat_features, out=open_matrix(matrix_path, X.shape))
+    fit_options['dataset_path'] = (
+        cached_dataset(matrix, y, feature_names, cat_features, params) if use_dataset_cache else None
+    )
+    del matrix
+    return [
+        (n_fold, train_idx, valid_idx, matrix_path, y, params, fit_options)
+        for n_fold, (train_idx, valid_idx) in enumerate(splits)
+    ]
+
+def print_fold(result, prefix=""):
+    print(f"   {prefix}Fold {result['fold']+1} | AUC: {result['auc']:.5f} | {result['seconds']:.1f}s")
+
+def collect_cv(tasks, results, n_parallel, threads_per_fold, seconds):
+    """Gộp kết quả fit_fold của các task (thứ tự bất kỳ) thành kết quả như run_cv()."""
+    y = tasks[0][4]
+    results = sorted(results, key=lambda r: r['fold'])
+    oof_preds = np.zeros(len(y))
+    for result in results:
+        oof_preds[result['valid_idx']] = result['valid_preds']
+
+    return {
+        'oof_preds': oof_preds,
+        'oof_auc': roc_auc_score(y, oof_preds),
+        'fold_auc': [r['auc'] for r in results],
+        'best_iterations': [r['best_iteration'] for r in results],
+        'models': [lgb.Booster(model_str=r['model_str']) for r in results],
+        'valid_idx': [r['valid_idx'] for r in results],
+        'n_parallel': n_parallel,
+        'threads_per_fold': threads_per_fold,
+        'dataset_cache': tasks[0][6]['dataset_path'] is not None,
+        'seconds': seconds,
+    }
+
+def run_cv(X, y, params, n_splits=5, random_state=42, cat_features=(), eval_metric='auc',
+           early_stopping_rounds=100, log_period=None, n_parallel=N_PARALLEL_FOLDS,
+           threads_per_fold=THREADS_PER_FOLD, use_dataset_cache=DATASET_CACHE_ENABLED, splits=None):
+    """
+    StratifiedKFold CV cho LGBMClassifier, các fold chạy lần lượt hoặc song song.
+
+    X: DataFrame (cột category ở dạng pandas category), y: Series/mảng nhãn 0/1.
+    params: tham số LGBMClassifier (n_jobs bị thay bằng số thread mỗi fold).
+    use_dataset_cache: fold = subset của Dataset đã chia bin trong cache (dataset_cache.py).
+    splits: các fold đã chia sẵn (fold_splits), None = chia theo n_splits / random_state.
+    Trả về dict: oof_preds, oof_auc, fold_auc, best_iterations, models (lgb.Booster), seconds.
+    """
+    start = time.perf_counter()
+    if splits is None:
+        splits = fold_splits(y, n_splits, random_state)
+    n_splits = len(splits)
+    n_parallel, n_jobs = resolve_parallelism(n_splits, n_parallel, threads_per_fold)
+
+    tmp_dir = tempfile.mkdtemp(prefix='cv_runner_')
+    try:
+        # Log early stopping của các fold song song sẽ xen lẫn nhau -> chỉ in khi chạy lần lượt
+        tasks = prepare_cv(
+            X, y, dict(params, n_jobs=n_jobs), splits, tmp_dir, cat_features, eval_metric,
+            early_stopping_rounds, log_period, verbose=n_parallel == 1, use_dataset_cache=use_dataset_cache,
+        )
+
+        print(f"CV {n_splits}-fold: {n_parallel} fold song song x {n_jobs} thread/fold")
+        if n_parallel == 1:
+            results = []
+            for task in tasks:
+                result = fit_fold(task)
+                print_fold(result)
+                results.append(result)
+        else:
+            # spawn: tránh fork tiến trình đã khởi tạo OpenMP của LightGBM
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_parallel, mp_context=ctx) as pool:
+                results = list(pool.map(fit_fold, tasks))
+            for result in results:
+                print_fold(result)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return collect_cv(tasks, results, n_parallel, n_jobs, time.perf_counter() - start)
+
+def finalize_n_estimators(cv, params, mode):
+    """Số cây của model deploy theo mode (ensemble: tổng số cây của các model fold)."""
+    if mode == "ensemble":
+        return sum(model.num_trees() for model in cv['models'])
+    if mode == "full":
+        return params.get('n_estimators', 100)
+    return max(1, int(round(np.mean(cv['best_iterations']))))
+
+def oof_auc_at(cv, X, y, cat_features=(), n_trees=None):
+    """
+    OOF AUC khi mỗi model fold chỉ dùng `n_trees` cây đầu (None = tới best_iteration, đúng bằng OOF AUC của CV).
+    Ước lượng cho model train lại với n_trees cây; model fold chỉ giữ tới best_iteration nên n_trees lớn hơn bị cắt.
+    """
+    if n_trees is None:
+        return float(cv['oof_auc'])
+    oof_preds = np.zeros(len(X))
+    for model, valid_idx in zip(cv['models'], cv['valid_idx']):
+        # Chỉ đổi phần valid của fold sang ma trận (không giữ 1 bản float64 của cả X)
+        matrix = frame_to_matrix(X.iloc[valid_idx], cat_features)
+        oof_preds[valid_idx] = model.predict(matrix, num_iteration=min(n_trees, model.current_iteration()))
+    return float(roc_auc_score(np.asarray(y), oof_preds))
+
+def _build_final(mode, cv, X, y, params, cat_features, n_estimators, n_jobs):
+    if mode == "ensemble":
+        return average_boosters(cv['models'])
+    model = lgb.LGBMClassifier(**deterministic_params(dict(params, n_estimators=n_estimators, n_jobs=n_jobs)))
+    model.fit(X, y, categorical_feature=cat_features or 'auto')
+    return model
+
+def finalize_model(cv, X, y, params, cat_features=(), mode=FINALIZE_MODE, n_jobs=-1, compare=FINALIZE_COMPARE):
+    """
+    Tạo model deploy từ kết quả run_cv() theo FINALIZE_MODE.
+    n_jobs: số thread khi train lại (train_all.py giới hạn khi các model khác còn đang chạy CV).
+    compare: train lại thêm 1 lần để đo thời gian retrain khi mode khác "retrain" (xem FINALIZE_COMPARE).
+    Trả về (model, training) với training là thông tin thời gian/AUC để lưu vào metadata,
+    gồm finalize_comparison = {phương án: {seconds, oof_auc, n_estimators}} cho mode và FINALIZE_OPTIONS.
+    """
+    if mode not in FINALIZE_MODES:
+        raise ValueError(f"FINALIZE_MODE phải là một trong {FINALIZE_MODES}, nhận được '{mode}'")
+    cat_features = [c for c in X.columns if c in set(cat_features)]
+
+    model, comparison = None, {}
+    for option in dict.fromkeys((mode,) + FINALIZE_OPTIONS):
+        n_estimators = finalize_n_estimators(cv, params, option)
+        seconds = None
+        if option == mode or option == "ensemble" or compare:
+            if option == "ensemble":
+                print(f"Gộp {len(cv['models'])} model fold thành 1 model trung bình (không retrain)...")
+            elif option == "full":
+                print(f"Đang train model trên toàn bộ dữ liệu với {n_estimators} cây (n_estimators)...")
+            else:
+                print(f"Đang retrain model trên toàn bộ dữ liệu với {n_estimators} cây (trung bình best_iteration)...")
+            start = time.perf_counter()
+            built = _build_final(option, cv, X, y, params, cat_features, n_estimators, n_jobs)
+            seconds = time.perf_counter() - start
+            if option == mode:
+                model = built
+        comparison[option] = {
+            'seconds': seconds,
+            'oof_auc': oof_auc_at(cv, X, y, cat_features, None if option == "ensemble" else n_estimators),
+            'n_estimators': int(n_estimators),
+        }
+
+    for option, row in comparison.items():
+        seconds = "-" if row['seconds'] is None else f"{row['seconds']:.1f}s"
+        chosen = " (deploy)" if option == mode else ""
+        print(f"   {option:<8} | {row['n_estimators']:>5} cây | {seconds:>7} | OOF AUC: {row['oof_auc']:.5f}{chosen}")
+    finalize_seconds = comparison[mode]['seconds']
+    print(f"Finalize ({mode}): {finalize_seconds:.1f}s | CV: {cv['seconds']:.1f}s | OOF AUC: {cv['oof_auc']:.5f}")
+    training = {
+        'finalize_mode': mode,
+        'oof_auc': float(cv['oof_auc']),
+        'fold_auc': [float(a) for a in cv['fold_auc']],
+        'best_iterations': [int(i) for i in cv['best_iterations']],
+        'n_estimators': comparison[mode]['n_estimators'],
+        'n_parallel_folds': cv['n_parallel'],
+        'threads_per_fold': cv['threads_per_fold'],
+        'dataset_cache': cv['dataset_cache'],
+        'cv_seconds': cv['seconds'],
+        'finalize_seconds': finalize_seconds,
+        'total_seconds': cv['seconds'] + finalize_seconds,
+        'finalize_comparison': comparison,
+    }
+    return model, training
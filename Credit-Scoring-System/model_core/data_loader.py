@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import resource
+import numpy as np
+import pandas as pd
+
+# TẢI DỮ LIỆU TRAIN QUA CACHE DẠNG CỘT (PARQUET)
+# Lần đầu: đọc application_train.csv, thu nhỏ kiểu dữ liệu rồi ghi ra data/cache/*.parquet.
+# Các lần sau: chỉ đọc đúng những cột script cần từ file Parquet.
+# Cache tự được tạo lại khi file CSV gốc thay đổi (kích thước / thời điểm sửa).
+# Không có pyarrow thì đọc thẳng CSV (chỉ các cột cần) như cũ.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BASE_DIR, 'data', 'application_train.csv')
+CACHE_DIR = os.getenv("DATA_CACHE_DIR", os.path.join(BASE_DIR, 'data', 'cache'))
+
+# DATA_CACHE=0 để tắt cache (luôn đọc CSV)
+DATA_CACHE_ENABLED = os.getenv("DATA_CACHE", "1") == "1"
+# Mặc định chỉ ép float64 -> float32 khi không mất chính xác (model train ra giữ nguyên).
+# DATA_CACHE_FLOAT32=1: ép mọi cột số thực về float32 (tiết kiệm RAM tối đa, model có thể lệch nhẹ).
+FORCE_FLOAT32 = os.getenv("DATA_CACHE_FLOAT32", "0") == "1"
+
+# Tăng khi đổi cách chuyển đổi -> cache cũ tự bị tạo lại
+CACHE_VERSION = 1
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+def peak_rss_mb():
+    """RAM đỉnh (max RSS) của tiến trình hiện tại, đơn vị MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def downcast_column(series, force_float32=FORCE_FLOAT32):
+    """Thu nhỏ kiểu của 1 cột: chuỗi -> category, số nguyên -> int nhỏ nhất đủ chứa, số thực -> float32."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        return series.astype('category')
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast='integer')
+    if pd.api.types.is_float_dtype(series.dtype) and series.dtype != np.float32:
+        values = series.to_numpy()
+        as_float32 = values.astype(np.float32)
+        # Chỉ ép khi giá trị float32 trùng khớp (NaN vẫn là NaN), trừ khi bắt buộc float32
+        if force_float32 or np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True):
+            return pd.Series(as_float32, index=series.index, name=series.name)
+    return series
+
+def downcast_frame(df, force_float32=FORCE_FLOAT32):
+    """Áp dụng downcast_column cho toàn bộ DataFrame."""
+    return pd.DataFrame({col: downcast_column(df[col], force_float32) for col in df.columns}, index=df.index)
+
+def _cache_paths(csv_path):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}.parquet"), os.path.join(CACHE_DIR, f"{name}.meta.json")
+
+def _fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {
+        "source": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "version": CACHE_VERSION,
+        "force_float32": FORCE_FLOAT32,
+    }
+
+def _cache_is_fresh(csv_path):
+    parquet_path, meta_path = _cache_paths(csv_path)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return False
+    with open(meta_path) as f:
+        return json.load(f).get("fingerprint") == _fingerprint(csv_path)
+
+def build_cache(csv_path=DATA_PATH):
+    """Đọc CSV 1 lần, thu nhỏ kiểu dữ liệu rồi ghi ra Parquet (kèm fingerprint của CSV gốc)."""
+    parquet_path, meta_path = _cache_paths(csv_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    start = time.perf_counter()
+    print(f"Đang tạo cache Parquet từ {os.path.basename(csv_path)}...")
+
+    df = downcast_frame(pd.read_csv(csv_path))
+    tmp_path = parquet_path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    with open(meta_path, "w") as f:
+        json.dump({"fingerprint": _fingerprint(csv_path), "dtypes": {c: str(t) for c, t in df.dtypes.items()}}, f, indent=2)
+
+    print(f"Đã tạo cache: {df.shape[0]} dòng x {df.shape[1]} cột, "
+          f"{df.memory_usage(deep=True).sum() / 1e6:.1f} MB trong RAM, {time.perf_counter() - start:.1f}s")
+    return parquet_path
+
+def load_application_data(columns=None, csv_path=DATA_PATH, use_cache=None):
+    """
+    Tải dữ liệu application_train.
+
+    columns: danh sách cột cần đọc (None = tất cả). Cột không tồn tại được bỏ qua.
+    Trả về DataFrame đã thu nhỏ kiểu (chuỗi ở dạng category).
+    """
+    use_cache = DATA_CACHE_ENABLED if use_cache is None else use_cache
+    start = time.perf_counter()
+
+    if use_cache and HAS_PYARROW:
+        if not _cache_is_fresh(csv_path):
+            build_cache(csv_path)
+        parquet_path, meta_path = _cache_paths(csv_path)
+        if columns is not None:
+            with open(meta_path) as f:
+                available = json.load(f)["dtypes"]
+            columns = [c for c in columns if c in available]
+        df = pd.read_parquet(parquet_path, columns=columns)
+        source = "parquet"
+    else:
+        usecols = None if columns is None else (lambda c: c in set(columns))
+        df = downcast_frame(pd.read_csv(csv_path, usecols=usecols))
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        source = "csv"
+
+    print(f"[data] {source}: {df.shape[0]} dòng x {df.shape[1]} cột trong {time.perf_counter() - start:.2f}s, "
+          f"RAM đỉnh {peak_rss_mb():.0f} MB")
+    return df
+
+def categorical_columns(df):
+    """Các cột dạng chuỗi/category (không phụ thuộc phiên bản pandas hay nguồn CSV/Parquet)."""
+    return list(df.select_dtypes(include=['object', 'category', 'string']).columns)
+
+# SO SÁNH CSV VS CACHE
+# Mỗi lần đo chạy trong 1 tiến trình riêng để RAM đỉnh không bị cộng dồn.
+SCRIPT_COLUMNS = {
+    'train.py': None,
+    'train_advanced.py': None,
+    'train_v3.py': ['TARGET', 'AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_BIRTH', 'DAYS_EMPLOYED',
+                    'NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS', 'EXT_SOURCE_2', 'EXT_SOURCE_3'],
+    'train_focused.py': ['TARGET', 'AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_BIRTH', 'DAYS_EMPLOYED'],
+}
+
+def _measure(args):
+    mode, columns, csv_path = args
+    if HAS_PYARROW:
+        # Import trước engine Parquet để không tính RAM của thư viện vào phần tải dữ liệu
+        import pyarrow.parquet  # noqa: F401
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "csv":
+        df = pd.read_csv(csv_path)
+        if columns is not None:
+            df = df[columns]
+    else:
+        df = load_application_data(columns, csv_path=csv_path, use_cache=True)
+    elapsed = time.perf_counter() - start
+    # RAM tăng thêm do việc tải (không tính phần import thư viện)
+    return elapsed, peak_rss_mb() - rss_before, df.memory_usage(deep=True).sum() / 1e6
+
+def benchmark_loaders(csv_path=DATA_PATH, scripts=SCRIPT_COLUMNS):
+    """
+    Đo thời gian tải và RAM tăng thêm của từng script train: đọc CSV như cũ ("csv") và qua cache ("cache").
+    Trả về list dict {script, mode, seconds, ram_mb, frame_mb}.
+    """
+    import multiprocessing
+
+    # Tiến trình con thừa hưởng RAM đỉnh của tiến trình cha -> tạo cache cũng trong tiến trình con
+    ctx = multiprocessing.get_context('spawn')
+    if HAS_PYARROW and not _cache_is_fresh(csv_path):
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            pool.map(build_cache, [csv_path])
+
+    rows = []
+    for script, columns in scripts.items():
+        for mode in ("csv", "cache"):
+            with ctx.Pool(1, maxtasksperchild=1) as pool:
+                seconds, ram_mb, frame_mb = pool.map(_measure, [(mode, columns, csv_path)])[0]
+            rows.append({'script': script, 'mode': mode, 'seconds': seconds, 'ram_mb': ram_mb, 'frame_mb': frame_mb})
+    return rows
+
+if __name__ == '__main__':
+    print(f"\n{'Script':<20}{'Cách tải':<12}{'Thời gian (s)':>15}{'RAM tăng (MB)':>15}{'DataFrame (MB)':>16}")
+    for row in benchmark_loaders():
+        print(f"{row['script']:<20}{row['mode']:<12}{row['seconds']:>15.2f}{row['ram_mb']:>15.0f}{row['frame_mb']:>16.1f}")
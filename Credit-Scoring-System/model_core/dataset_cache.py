@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import lightgbm as lgb
+from data_loader import CACHE_DIR
+
+# CACHE lgb.Dataset ĐÃ CHIA BIN (FILE BINARY CỦA LIGHTGBM), DÙNG CHUNG CHO CÁC FOLD / SCRIPT / LẦN CHẠY
+# Chia bin (tìm ngưỡng bin từng feature + mã hóa cả ma trận) là phần tốn nhất khi dựng lgb.Dataset và trước đây
+# bị lặp lại ở mỗi fold trên 1 bản copy float64 X[train_idx].
+# - Dataset của toàn bộ dữ liệu chỉ được chia bin 1 lần rồi lưu bằng save_binary, tên file = hash(ma trận, nhãn,
+#   tên feature, cột category, tham số chia bin, phiên bản LightGBM) -> train_v3.py, hpo.py v3, ... cùng feature
+#   set dùng lại đúng file này giữa các script và các lần chạy.
+# - Dataset của mỗi fold = subset() theo chỉ số dòng (chỉ copy bin đã mã hóa, không copy ma trận gốc),
+#   trọng số 'balanced' tính lại theo nhãn của fold.
+# - Bin được tính trên toàn bộ dữ liệu (giống lgb.cv) thay vì phần train của từng fold -> OOF AUC có thể lệch
+#   nhẹ so với trước. DATASET_CACHE=0 để quay lại cách cũ (mỗi fold tự dựng Dataset, không ghi file).
+
+# DATASET_CACHE=0 để tắt cache
+DATASET_CACHE_ENABLED = os.getenv("DATASET_CACHE", "1") == "1"
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(CACHE_DIR, 'lgb'))
+
+# Tăng khi đổi cách dựng Dataset -> cache cũ tự bị bỏ qua
+DATASET_CACHE_VERSION = 1
+BASE_DATASET_PARAMS = {'feature_pre_filter': False, 'verbose': -1}
+# Số dòng mỗi lần đưa vào hash (ma trận có thể là memory-map, không copy cả ma trận)
+HASH_CHUNK_ROWS = 65536
+
+def balanced_weights(y):
+    """Trọng số mẫu giống class_weight='balanced' của LGBMClassifier."""
+    counts = np.bincount(y)
+    return (len(y) / (len(counts) * counts))[y]
+
+def native_params(params, threads, metric='auc'):
+    """Tham số LGBMClassifier -> tham số lgb.train (n_estimators và class_weight được xử lý riêng)."""
+    native = {k: v for k, v in params.items() if k not in ('n_estimators', 'class_weight', 'n_jobs')}
+    native.setdefault('objective', 'binary')
+    native.update(metric=metric, num_threads=threads, feature_pre_filter=False, verbose=-1)
+    return native
+
+def dataset_params(params=None):
+    """Tham số ảnh hưởng tới cách chia bin (max_bin, min_data_in_bin, ...) + seed lấy mẫu dòng khi chia bin."""
+    params = params or {}
+    binning = dict(BASE_DATASET_PARAMS, **lgb.Dataset(None, params=params).get_params())
+    # random_state của LGBMClassifier = seed -> quyết định các dòng được lấy mẫu để tìm ngưỡng bin
+    seed = next((params[k] for k in ('seed', 'random_state', 'random_seed') if params.get(k) is not None), None)
+    if seed is not None:
+        binning['seed'] = int(seed)
+    return binning
+
+def dataset_key(matrix, y, feature_names, cat_features=(), params=None):
+    """Khóa cache: sha256 của ma trận, nhãn, tên feature, cột category, tham số chia bin, phiên bản LightGBM."""
+    header = {
+        'version': DATASET_CACHE_VERSION,
+        'lightgbm': lgb.__version__,
+        'shape': list(matrix.shape),
+        'dtype': str(matrix.dtype),
+        'features': list(feature_names),
+        'cat_features': list(cat_features),
+        'params': dataset_params(params),
+    }
+    h = hashlib.sha256(json.dumps(header, sort_keys=True).encode())
+    h.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    for i in range(0, matrix.shape[0], HASH_CHUNK_ROWS):
+        h.update(np.ascontiguousarray(matrix[i:i + HASH_CHUNK_ROWS]).tobytes())
+    return h.hexdigest()
+
+def cached_dataset(matrix, y, feature_names, cat_features=(), params=None, cache_dir=None):
+    """
+    Đường dẫn file binary của Dataset đầy đủ (matrix: ma trận float64 như frame_to_matrix, có thể là memory-map).
+    Chưa có trong cache thì chia bin 1 lần và ghi ra (file tạm rồi đổi tên: lần chạy song song không đọc file dở).
+    """
+    cache_dir = cache_dir or DATASET_CACHE_DIR
+    cat_features = [c for c in feature_names if c in set(cat_features)]
+    key = dataset_key(matrix, y, feature_names, cat_features, params)
+    path = os.path.join(cache_dir, f"{key[:24]}.bin")
+    if os.path.exists(path):
+        print(f"[dataset] dùng lại Dataset đã chia bin: {path}")
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    start = time.perf_counter()
+    dataset = lgb.Dataset(
+        matrix, np.asarray(y), feature_name=list(feature_names), categorical_feature=cat_features or 'auto',
+        params=dataset_params(params),
+    ).construct()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dataset.save_binary(tmp_path)
+    os.replace(tmp_path, path)
+    with open(os.path.splitext(path)[0] + '.meta.json', 'w') as f:
+        json.dump({
+            'key': key, 'rows': int(matrix.shape[0]), 'features': list(feature_names),
+            'cat_features': cat_features, 'params': dataset_params(params), 'lightgbm': lgb.__version__,
+        }, f, indent=2)
+    print(f"[dataset] chia bin {matrix.shape[0]} dòng x {matrix.shape[1]} feature trong "
+          f"{time.perf_counter() - start:.2f}s -> {path}")
+    return path
+
+def load_dataset(path, params=None):
+    """Đọc Dataset đầy đủ từ file binary (không chia bin lại)."""
+    return lgb.Dataset(path, params=dataset_params(params)).construct()
+
+def fold_datasets(full, train_idx, valid_idx, weighted):
+    """(train, valid) của 1 fold = subset theo chỉ số dòng của Dataset đầy đủ (dùng chung bin)."""
+    train_idx, valid_idx = np.sort(train_idx), np.sort(valid_idx)
+    train = full.subset(train_idx).construct()
+    if weighted:
+        train.set_weight(balanced_weights(full.get_label()[train_idx].astype(np.int64)))
+    valid = full.subset(valid_idx).construct()
+    return train, valid
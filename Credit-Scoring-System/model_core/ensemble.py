@@ -0,0 +1,40 @@
+import re
+import lightgbm as lgb
+
+# GỘP CÁC MODEL FOLD THÀNH 1 MODEL TRUNG BÌNH
+# Trung bình raw score của k model = tổng raw score của tất cả cây với leaf_value chia k.
+# Vì vậy có thể ghép toàn bộ cây của các fold vào 1 lgb.Booster duy nhất: backend tải như model thường
+# (predict, pred_contrib cho SHAP, tree_engine) mà không cần biết đó là ensemble.
+
+TREE_HEADER = re.compile(r'(?m)^Tree=\d+\n')
+SCALED_FIELDS = ('leaf_value=', 'internal_value=')
+
+def _scale_tree(block, factor):
+    lines = []
+    for line in block.split('\n'):
+        if line.startswith(SCALED_FIELDS):
+            key, values = line.split('=', 1)
+            line = key + '=' + ' '.join(repr(float(v) * factor) for v in values.split(' ') if v)
+        lines.append(line)
+    return '\n'.join(lines)
+
+def average_boosters(boosters):
+    """
+    k booster (cùng feature, cùng objective) -> 1 lgb.Booster có raw score = trung bình raw score của k booster.
+    Xác suất = sigmoid(trung bình raw score), tức là trung bình trên thang log-odds.
+    """
+    strings = [b.model_to_string() for b in boosters]
+    factor = 1.0 / len(strings)
+
+    head = strings[0][:strings[0].index('Tree=0\n')]
+    # tree_sizes chỉ để LightGBM đọc song song; bỏ đi thì LightGBM tự tìm từng "Tree=" khi load
+    head = '\n'.join(line for line in head.split('\n') if not line.startswith('tree_sizes='))
+    tail = strings[0][strings[0].index('end of trees'):]
+
+    trees = []
+    for model_str in strings:
+        body = model_str[model_str.index('Tree=0\n'):model_str.index('end of trees')]
+        trees.extend(TREE_HEADER.split(body)[1:])
+
+    merged = head + ''.join(f"Tree={i}\n{_scale_tree(block, factor)}" for i, block in enumerate(trees)) + tail
+    return lgb.Booster(model_str=merged)
@@ -0,0 +1,354 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import lightgbm as lgb
+from sklearn.model_selection import StratifiedKFold
+from cv_runner import fold_native_params, frame_to_matrix, open_matrix
+from dataset_cache import DATASET_CACHE_ENABLED, balanced_weights, cached_dataset, fold_datasets, load_dataset
+
+# TÌM SIÊU THAM SỐ LIGHTGBM CÓ NGÂN SÁCH (SUCCESSIVE HALVING), CHẠY OFFLINE
+# Thay vì sửa tay tham số trong train_v3.py / train_focused.py / train_advanced.py rồi chạy lại 5-fold CV từ CSV:
+# - Dữ liệu được đọc và chia fold 1 lần (cùng StratifiedKFold như run_cv). lgb.Dataset của mỗi fold chỉ được
+#   lấy 1 lần trong mỗi tiến trình worker rồi dùng lại cho mọi cấu hình, vì không gian tìm kiếm chỉ gồm tham số
+#   của booster (không đổi cách chia bin). Fold = subset của Dataset đã chia bin trong cache (dataset_cache.py),
+#   dùng chung với run_cv của script train sau đó.
+# - Successive halving: mọi cấu hình chạy rung 0 (ít fold, ít vòng boosting); chỉ 1/ETA cấu hình tốt nhất
+#   (AUC trung bình trên các fold đã chạy) được lên rung sau với nhiều fold + nhiều vòng hơn. Rung cuối = đủ
+#   fold + đủ n_estimators. Trong mỗi lần train, early stopping tiếp tục cắt bớt vòng boosting thừa.
+# - Các cặp (cấu hình, fold) chạy song song trong giới hạn CPU (số tiến trình x số thread mỗi trial);
+#   hết ngân sách thời gian thì dừng (lần train đang chạy bị cắt ngang) và chọn cấu hình tốt nhất đã có.
+# - Kết quả: bảng xếp hạng JSON trong hpo_results/ và (khi train tiếp) mục 'hpo' trong metadata của model.
+#
+# Chạy (trong thư mục model_core):
+#   python hpo.py v3 --time-budget 1800 --cpus 8       # tìm rồi train V3 với cấu hình tốt nhất
+#   python hpo.py focused --trials 9 --no-train        # chỉ tìm, không ghi model
+
+MODEL_CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+HPO_DIR = os.path.join(MODEL_CORE_DIR, 'hpo_results')
+
+HPO_TRIALS = int(os.getenv("HPO_TRIALS", 27))
+HPO_ETA = int(os.getenv("HPO_ETA", 3))
+HPO_RUNGS = int(os.getenv("HPO_RUNGS", 3))
+HPO_TIME_BUDGET = float(os.getenv("HPO_TIME_BUDGET", 1800))  # giây
+HPO_CPUS = int(os.getenv("HPO_CPUS", 0)) or (os.cpu_count() or 1)
+HPO_THREADS_PER_TRIAL = int(os.getenv("HPO_THREADS_PER_TRIAL", 2))
+HPO_SEED = int(os.getenv("HPO_SEED", 42))
+# Số dòng của bảng xếp hạng lưu trong metadata (file JSON giữ đủ)
+LEADERBOARD_IN_METADATA = 20
+
+# Không gian tìm kiếm (tham số của LGBMClassifier): (kiểu, ...) với kiểu "uniform", "log", "int_log", "choice"
+SEARCH_SPACE = {
+    'learning_rate': ('log', 0.01, 0.1),
+    'num_leaves': ('int_log', 8, 128),
+    'max_depth': ('choice', [-1, 4, 5, 6, 8, 10]),
+    'min_child_samples': ('int_log', 10, 300),
+    'subsample': ('uniform', 0.6, 1.0),
+    'colsample_bytree': ('uniform', 0.5, 1.0),
+    'reg_alpha': ('log', 1e-3, 10.0),
+    'reg_lambda': ('log', 1e-3, 10.0),
+}
+
+def sample_config(rng, space=SEARCH_SPACE):
+    """Lấy ngẫu nhiên 1 cấu hình từ không gian tìm kiếm."""
+    config = {}
+    for name, (kind, *args) in space.items():
+        if kind == 'choice':
+            config[name] = args[0][int(rng.integers(len(args[0])))]
+        elif kind == 'uniform':
+            config[name] = float(rng.uniform(*args))
+        elif kind == 'log':
+            config[name] = float(np.exp(rng.uniform(np.log(args[0]), np.log(args[1]))))
+        elif kind == 'int_log':
+            config[name] = int(round(np.exp(rng.uniform(np.log(args[0]), np.log(args[1])))))
+        else:
+            raise ValueError(f"Kiểu tham số không hợp lệ: {kind}")
+    if config.get('subsample', 1.0) < 1.0:
+        config['subsample_freq'] = 1
+    return config
+
+def make_rungs(n_splits, max_rounds, eta=HPO_ETA, n_rungs=HPO_RUNGS):
+    """(số fold, số vòng boosting tối đa) của từng rung; rung cuối = đủ fold + đủ vòng."""
+    rungs = []
+    for i in range(n_rungs):
+        scale = eta ** (n_rungs - 1 - i)
+        rungs.append((max(1, math.ceil(n_splits / scale)), max(1, int(max_rounds / scale))))
+    return rungs
+
+# TRẠNG THÁI CỦA TIẾN TRÌNH WORKER: ma trận (memory-map), các fold và Dataset đã dựng
+_WORKER = {}
+
+class _BudgetExceeded(Exception):
+    pass
+
+def _init_worker(matrix_path, y, splits, feature_names, cat_features, weighted, dataset_path=None, params=None):
+    warnings.filterwarnings('ignore', message='Overriding the parameters from Reference Dataset')
+    _WORKER.clear()
+    _WORKER.update(
+        X=np.load(matrix_path, mmap_mode='r'), y=y, splits=splits, feature_names=feature_names,
+        cat_features=cat_features or 'auto', weighted=weighted, datasets={},
+        full=load_dataset(dataset_path, params) if dataset_path is not None else None,
+    )
+
+def _fold_datasets(fold):
+    """(train, valid) lgb.Dataset của fold, dựng 1 lần cho mỗi worker."""
+    datasets = _WORKER['datasets'].get(fold)
+    if datasets is None and _WORKER['full'] is not None:
+        train_idx, valid_idx = _WORKER['splits'][fold]
+        datasets = _WORKER['datasets'][fold] = fold_datasets(_WORKER['full'], train_idx, valid_idx, _WORKER['weighted'])
+    elif datasets is None:
+        X, y = _WORKER['X'], _WORKER['y']
+        train_idx, valid_idx = _WORKER['splits'][fold]
+        y_train = y[train_idx]
+        train = lgb.Dataset(
+            X[train_idx], y_train, weight=balanced_weights(y_train) if _WORKER['weighted'] else None,
+            feature_name=_WORKER['feature_names'], categorical_feature=_WORKER['cat_features'],
+            params={'feature_pre_filter': False, 'verbose': -1}, free_raw_data=False,
+        ).construct()
+        valid = lgb.Dataset(
+            X[valid_idx], y[valid_idx], reference=train, feature_name=_WORKER['feature_names'],
+            categorical_feature=_WORKER['cat_features'], free_raw_data=False,
+        ).construct()
+        datasets = _WORKER['datasets'][fold] = (train, valid)
+    return datasets
+
+def _deadline_callback(deadline):
+    def callback(env):
+        if time.time() > deadline:
+            raise _BudgetExceeded()
+    callback.order = 40
+    return callback
+
+def _run_task(task):
+    """Train 1 cấu hình trên 1 fold với tối đa `rounds` vòng boosting."""
+    trial, params, fold, rounds, early_stopping_rounds, deadline = task
+    result = {'trial': trial, 'fold': fold}
+    if time.time() > deadline:
+        return dict(result, status='skipped')
+    train, valid = _fold_datasets(fold)
+    start = time.perf_counter()
+    try:
+        booster = lgb.train(
+            params, train, num_boost_round=rounds, valid_sets=[valid],
+            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False), _deadline_callback(deadline)],
+        )
+    except _BudgetExceeded:
+        return dict(result, status='timeout', seconds=time.perf_counter() - start)
+    return dict(
+        result, status='ok', auc=float(booster.best_score['valid_0']['auc']),
+        best_iteration=int(booster.best_iteration or rounds), seconds=time.perf_counter() - start,
+    )
+
+def search(X, y, base_params, cat_features=(), n_splits=5, random_state=42, early_stopping_rounds=100,
+           n_trials=HPO_TRIALS, eta=HPO_ETA, n_rungs=HPO_RUNGS, time_budget=HPO_TIME_BUDGET, cpus=HPO_CPUS,
+           threads_per_trial=HPO_THREADS_PER_TRIAL, seed=HPO_SEED, space=SEARCH_SPACE,
+           use_dataset_cache=DATASET_CACHE_ENABLED):
+    """
+    Successive halving trên n_trials cấu hình (cấu hình 0 = base_params, còn lại lấy ngẫu nhiên từ `space`).
+
+    X: DataFrame (cột category ở dạng pandas category), y: nhãn 0/1; fold giống hệt run_cv(n_splits, random_state).
+    use_dataset_cache: fold = subset của Dataset đã chia bin trong cache (cùng file với run_cv của script train).
+    Trả về dict: best_params (phần ghi đè base_params), best_auc, best_rung, leaderboard, cấu hình ngân sách...
+    """
+    start = time.time()
+    deadline = start + time_budget
+    y = np.asarray(y)
+    feature_names = list(X.columns)
+    cat_features = [c for c in feature_names if c in set(cat_features)]
+    threads_per_trial = max(1, min(threads_per_trial, cpus))
+    n_parallel = max(1, cpus // threads_per_trial)
+    rungs = make_rungs(n_splits, base_params['n_estimators'], eta, n_rungs)
+
+    rng = np.random.default_rng(seed)
+    trials = [{'trial': 0, 'config': {}, 'status': 'running', 'rungs': []}]
+    trials += [{'trial': i, 'config': sample_config(rng, space), 'status': 'running', 'rungs': []}
+               for i in range(1, n_trials)]
+    print(f"HPO: {n_trials} cấu hình, rung (fold, vòng) = {rungs}, {n_parallel} tiến trình x "
+          f"{threads_per_trial} thread, ngân sách {time_budget:.0f}s")
+
+    tmp_dir = tempfile.mkdtemp(prefix='hpo_')
+    pool = None
+    try:
+        matrix_path = os.path.join(tmp_dir, 'X.npy')
+        matrix = frame_to_matrix(X, cat_features, out=open_matrix(matrix_path, X.shape))
+        dataset_path = (
+            cached_dataset(matrix, y, feature_names, cat_features, base_params) if use_dataset_cache else None
+        )
+        del matrix
+        splits = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X, y))
+        init_args = (matrix_path, y, splits, feature_names, cat_features, base_params.get('class_weight') == 'balanced',
+                     dataset_path, base_params)
+        if n_parallel == 1:
+            _init_worker(*init_args)
+            run_tasks = lambda tasks: [_run_task(task) for task in tasks]  # noqa: E731
+        else:
+            # spawn: tránh fork tiến trình đã khởi tạo OpenMP của LightGBM
+            pool = ProcessPoolExecutor(n_parallel, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=init_args)
+            run_tasks = lambda tasks: list(pool.map(_run_task, tasks))  # noqa: E731
+
+        alive = trials
+        for level, (n_folds, rounds) in enumerate(rungs):
+            if time.time() > deadline:
+                print(f"Hết ngân sách thời gian trước rung {level}.")
+                for trial in alive:
+                    trial['status'] = f'stopped@{level}'
+                break
+            rung_start = time.time()
+            tasks = [
+                # Cùng tham số lgb.train với run_cv (deterministic, metric early stopping) -> AUC so sánh được
+                (trial['trial'], fold_native_params(dict(base_params, **trial['config']), threads_per_trial),
+                 fold, rounds, min(early_stopping_rounds, rounds), deadline)
+                for trial in alive for fold in range(n_folds)
+            ]
+            by_trial = {}
+            for result in run_tasks(tasks):
+                by_trial.setdefault(result['trial'], []).append(result)
+
+            scored = []
+            for trial in alive:
+                results = by_trial[trial['trial']]
+                if any(r['status'] != 'ok' for r in results):
+                    trial['status'] = 'timeout'
+                    continue
+                fold_auc = [r['auc'] for r in results]
+                trial['rungs'].append({
+                    'rung': level, 'n_folds': n_folds, 'max_rounds': rounds, 'auc': float(np.mean(fold_auc)),
+                    'fold_auc': fold_auc, 'best_iterations': [r['best_iteration'] for r in results],
+                    'seconds': sum(r['seconds'] for r in results),
+                })
+                scored.append(trial)
+            scored.sort(key=lambda t: t['rungs'][-1]['auc'], reverse=True)
+            best = f", tốt nhất AUC {scored[0]['rungs'][-1]['auc']:.5f} (trial {scored[0]['trial']})" if scored else ""
+            print(f"   Rung {level}: {len(alive)} cấu hình x {n_folds} fold x ≤{rounds} vòng | "
+                  f"{time.time() - rung_start:.1f}s{best}")
+
+            if level == len(rungs) - 1:
+                for trial in scored:
+                    trial['status'] = 'complete'
+                break
+            keep = max(1, len(scored) // eta)
+            for trial in scored[keep:]:
+                trial['status'] = f'pruned@{level}'
+            alive = scored[:keep]
+            if not alive:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Xếp hạng: rung cao hơn trước (được đánh giá trên nhiều fold/vòng hơn), rồi đến AUC
+    leaderboard = []
+    for trial in trials:
+        last = trial['rungs'][-1] if trial['rungs'] else None
+        leaderboard.append({
+            'trial': trial['trial'],
+            'status': trial['status'],
+            'rung': last['rung'] if last else -1,
+            'auc': last['auc'] if last else None,
+            'n_folds': last['n_folds'] if last else 0,
+            'max_rounds': last['max_rounds'] if last else 0,
+            'best_iterations': last['best_iterations'] if last else [],
+            'params': trial['config'],
+            'history': [{'rung': r['rung'], 'auc': r['auc']} for r in trial['rungs']],
+        })
+    leaderboard.sort(key=lambda row: (row['rung'], row['auc'] if row['auc'] is not None else -1.0), reverse=True)
+    if leaderboard[0]['auc'] is None:
+        raise RuntimeError("Không cấu hình nào chạy xong trong ngân sách thời gian.")
+
+    best = leaderboard[0]
+    baseline = next(row for row in leaderboard if row['trial'] == 0)
+    summary = {
+        'best_trial': best['trial'],
+        'best_params': best['params'],
+        'best_auc': best['auc'],
+        'best_rung': best['rung'],
+        'baseline_auc': baseline['auc'],
+        'baseline_rung': baseline['rung'],
+        'n_trials': n_trials,
+        'eta': eta,
+        'rungs': rungs,
+        'search_space': {name: list(spec[1:]) if spec[0] != 'choice' else spec[1] for name, spec in space.items()},
+        'time_budget_s': time_budget,
+        'cpus': cpus,
+        'n_parallel': n_parallel,
+        'threads_per_trial': threads_per_trial,
+        'seed': seed,
+        'seconds': time.time() - start,
+        'leaderboard': leaderboard,
+    }
+    print(f"HPO xong sau {summary['seconds']:.1f}s: trial {best['trial']} AUC {best['auc']:.5f} (rung {best['rung']}), "
+          f"cấu hình gốc AUC {baseline['auc'] if baseline['auc'] is not None else float('nan'):.5f} "
+          f"(rung {baseline['rung']})")
+    return summary
+
+def _script(name):
+    """(hàm đọc dữ liệu -> (X, y, cột category), tham số gốc, early_stopping_rounds, hàm train(params, hpo))."""
+    if name == 'v3':
+        import train_v3 as m
+        return m.load_v3_data, m.V3_PARAMS, 100, m.train_v3_kfold_model
+    if name == 'focused':
+        import train_focused as m
+        return m.load_focused_data, m.FOCUSED_PARAMS, 50, m.train_focused_model
+    if name == 'advanced':
+        import train_advanced as m
+        def train(params, hpo):
+            df, cat_feats = m.load_and_preprocess_data()
+            return m.train_kfold_model(df, cat_feats, params=params, hpo=hpo)
+        return m.load_advanced_data, m.ADVANCED_PARAMS, 100, train
+    raise ValueError(f"Script không hợp lệ: {name}")
+
+def save_leaderboard(summary, script):
+    os.makedirs(HPO_DIR, exist_ok=True)
+    path = os.path.join(HPO_DIR, f"{script}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+def print_leaderboard(summary, top=10):
+    print(f"{'Trial':>6}{'Rung':>6}{'AUC':>10}  {'Trạng thái':<12}Tham số")
+    for row in summary['leaderboard'][:top]:
+        auc = f"{row['auc']:.5f}" if row['auc'] is not None else "-"
+        params = ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row['params'].items())
+        print(f"{row['trial']:>6}{row['rung']:>6}{auc:>10}  {row['status']:<12}{params or '(cấu hình gốc)'}")
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Tìm siêu tham số LightGBM (successive halving) cho script train.")
+    parser.add_argument('script', choices=['v3', 'focused', 'advanced'])
+    parser.add_argument('--trials', type=int, default=HPO_TRIALS)
+    parser.add_argument('--eta', type=int, default=HPO_ETA, help="Mỗi rung giữ lại 1/eta cấu hình")
+    parser.add_argument('--rungs', type=int, default=HPO_RUNGS)
+    parser.add_argument('--time-budget', type=float, default=HPO_TIME_BUDGET, help="Ngân sách thời gian (giây)")
+    parser.add_argument('--cpus', type=int, default=HPO_CPUS, help="Số CPU tối đa được dùng")
+    parser.add_argument('--threads-per-trial', type=int, default=HPO_THREADS_PER_TRIAL)
+    parser.add_argument('--seed', type=int, default=HPO_SEED)
+    parser.add_argument('--no-train', action='store_true', help="Chỉ tìm, không train/ghi model")
+    args = parser.parse_args(argv)
+
+    load_data, base_params, early_stopping_rounds, train = _script(args.script)
+    X, y, cat_features = load_data()
+    summary = search(
+        X, y, base_params, cat_features, early_stopping_rounds=early_stopping_rounds, n_trials=args.trials,
+        eta=args.eta, n_rungs=args.rungs, time_budget=args.time_budget, cpus=args.cpus,
+        threads_per_trial=args.threads_per_trial, seed=args.seed,
+    )
+    del X, y
+    print_leaderboard(summary)
+    print(f"Đã lưu bảng xếp hạng: {save_leaderboard(summary, args.script)}")
+
+    if not args.no_train:
+        print(f"Train {args.script} với cấu hình tốt nhất (trial {summary['best_trial']})...")
+        hpo = dict(summary, leaderboard=summary['leaderboard'][:LEADERBOARD_IN_METADATA])
+        train(summary['best_params'], hpo)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,118 @@
+import numpy as np
+
+# FEATURE ENGINEERING DÙNG CHUNG CHO TRAINING VÀ SERVING
+# Mọi script train (train*.py) và backend đều gọi các hàm ở đây để 2 bên không bị lệch nhau.
+
+RATIO_FEATURES = ['CREDIT_INCOME_PERCENT', 'ANNUITY_INCOME_PERCENT', 'CREDIT_TERM', 'DAYS_EMPLOYED_PERCENT']
+
+def ratio_features(amt_income, amt_credit, amt_annuity, days_employed, days_birth):
+    """
+    4 đặc trưng tỷ lệ, tính vector hóa trên mảng NumPy (hoặc pandas Series).
+    Chia cho 0 cho ra inf/NaN như pandas; việc xử lý inf/NaN do FeaturePipeline/script train quyết định.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            # Tỷ lệ: Tống số tiền vay / Thu nhập hàng năm (Vay nhiều quá mức lương?)
+            'CREDIT_INCOME_PERCENT': amt_credit / amt_income,
+            # Tỷ lệ: Tiền trả hàng tháng / Thu nhập hàng tháng (Gánh nặng hàng tháng)
+            'ANNUITY_INCOME_PERCENT': amt_annuity / (amt_income / 12),
+            # Tỷ lệ: Thời hạn vay (tháng)
+            'CREDIT_TERM': amt_credit / amt_annuity,
+            # Tỷ lệ: Số ngày đi làm / Số ngày tuổi (Mức độ ổn định công việc)
+            'DAYS_EMPLOYED_PERCENT': days_employed / days_birth,
+        }
+
+def add_ratio_features(df):
+    """Thêm 4 cột tỷ lệ vào DataFrame training (tại chỗ) và trả về chính DataFrame đó."""
+    # Tính bằng float64 như backend, kể cả khi cột đã bị thu nhỏ (float32/int32) lúc tải dữ liệu
+    cols = ['AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_EMPLOYED', 'DAYS_BIRTH']
+    ratios = ratio_features(*(df[c].astype(np.float64) for c in cols))
+    for name, values in ratios.items():
+        df[name] = values
+    return df
+
+def category_vocabulary(df, cat_features):
+    """Từ điển category lúc train (đúng thứ tự mã mà LightGBM dùng) để lưu vào metadata."""
+    return {col: list(df[col].cat.categories) for col in cat_features if col in df.columns}
+
+class FeaturePipeline:
+    """
+    Dựng ma trận feature (theo đúng thứ tự `features` của model) từ dữ liệu dạng cột,
+    không tạo DataFrame. Dùng cho serving (1 hồ sơ hoặc cả batch).
+
+    - Cột categorical được mã hóa theo từ điển category lúc train (category lạ -> NaN,
+      giống cách LightGBM căn chỉnh category của pandas).
+    - 4 cột tỷ lệ được tính bằng ratio_features().
+    - replace_inf / fill_na: xử lý inf và NaN giống script train đã tạo ra model.
+    - Feature không có trong dữ liệu đầu vào được điền 0 (như backend trước đây).
+    - Mặc định float64 như DataFrame của /predict cũ: ép float32 làm giá trị nằm sát ngưỡng split
+      (vd. tỷ lệ đúng bằng 0.05) rẽ sang nhánh khác.
+    """
+
+    def __init__(self, features, cat_features=(), categories=None, replace_inf=True, fill_na=None, dtype=np.float64):
+        self.features = list(features)
+        self.cat_features = [f for f in self.features if f in set(cat_features)]
+        self.categories = categories or {}
+        self.replace_inf = replace_inf
+        self.fill_na = fill_na
+        self.dtype = dtype
+        self._code_maps = {col: {v: i for i, v in enumerate(cats)} for col, cats in self.categories.items()}
+
+    @classmethod
+    def from_metadata(cls, metadata, model=None, dtype=np.float64):
+        """
+        Tạo pipeline từ metadata của script train. Với metadata cũ chưa lưu 'categories',
+        lấy từ điển category từ booster (pandas_categorical) của model.
+        """
+        features = metadata['features']
+        cat_features = metadata.get('cat_features', [])
+        categories = metadata.get('categories')
+        if categories is None and model is not None:
+            booster = getattr(model, 'booster_', model)
+            cat_cols = [f for f in features if f in set(cat_features)]
+            categories = dict(zip(cat_cols, getattr(booster, 'pandas_categorical', None) or []))
+        preprocessing = metadata.get('preprocessing', {})
+        return cls(
+            features, cat_features, categories,
+            replace_inf=preprocessing.get('replace_inf', True),
+            fill_na=preprocessing.get('fill_na'),
+            dtype=dtype,
+        )
+
+    def transform(self, columns):
+        """columns: dict {tên cột: mảng/list giá trị} -> ma trận shape (n_rows, n_features)."""
+        n_rows = len(next(iter(columns.values())))
+        X = np.empty((n_rows, len(self.features)), dtype=self.dtype)
+
+        numeric = {}
+        def column(name):
+            if name not in numeric:
+                numeric[name] = np.asarray(columns[name], dtype=np.float64)
+            return numeric[name]
+
+        ratios = None
+        for j, name in enumerate(self.features):
+            if name in self._code_maps:
+                codes = self._code_maps[name]
+                X[:, j] = [codes.get(v, np.nan) for v in columns[name]]
+            elif name in columns:
+                X[:, j] = column(name)
+            elif name in RATIO_FEATURES:
+                if ratios is None:
+                    ratios = ratio_features(
+                        column('AMT_INCOME_TOTAL'), column('AMT_CREDIT'), column('AMT_ANNUITY'),
+                        column('DAYS_EMPLOYED'), column('DAYS_BIRTH')
+                    )
+                X[:, j] = ratios[name]
+            else:
+                X[:, j] = 0
+
+        if self.replace_inf:
+            X[np.isinf(X)] = np.nan
+        if self.fill_na is not None:
+            X[np.isnan(X)] = self.fill_na
+        return X
+
+    def transform_record(self, record):
+        """1 hồ sơ dạng dict {tên cột: giá trị} -> ma trận shape (1, n_features)."""
+        return self.transform({name: [value] for name, value in record.items()})
@@ -0,0 +1,306 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import numpy as np
+import pandas as pd
+from processing import RATIO_FEATURES, ratio_features
+from data_loader import CACHE_DIR, DATA_PATH, FORCE_FLOAT32, peak_rss_mb
+
+# CHUẨN BỊ DỮ LIỆU TRAIN THEO TỪNG CHUNK (OUT-OF-CORE), RAM KHÔNG PHỤ THUỘC SỐ DÒNG
+# Cho ra đúng kết quả của train_advanced.load_and_preprocess_data (cùng cột, kiểu, category, giá trị),
+# nhưng không bao giờ giữ cả file trong RAM:
+# - Lượt 1: đọc CSV theo chunk, thống kê số giá trị thiếu, từ điển category, kiểu dữ liệu (min/max số nguyên,
+#   float32 có giữ nguyên giá trị không) của từng cột, kể cả 4 cột tỷ lệ (processing.py).
+# - Lượt 2: đọc lại theo chunk, chỉ giữ các cột được chọn (tỷ lệ thiếu <= MISSING_THRESHOLD), ép về kiểu
+#   cuối cùng rồi ghi nối tiếp vào từng file .npy theo cột (category lưu dưới dạng mã, thiếu = -1).
+# Kết quả nằm ở data/cache/prepared/<tên file>/ và được dùng lại cho tới khi CSV gốc hoặc cấu hình thay đổi.
+# PreparedData đọc các cột bằng np.load(mmap_mode='r') và dựng lại DataFrame (chỉ 1 bản, kiểu đã thu nhỏ)
+# thay vì nhiều bản copy của cả DataFrame như cách cũ (isnull().mean(), drop, astype, rename).
+
+# STREAMING_PREP=0 để train_advanced.py xử lý dữ liệu trong RAM như cũ
+STREAMING_PREP_ENABLED = os.getenv("STREAMING_PREP", "1") == "1"
+PREP_CHUNK_ROWS = int(os.getenv("PREP_CHUNK_ROWS", "100000"))
+PREP_DIR = os.getenv("PREP_DIR", os.path.join(CACHE_DIR, 'prepared'))
+MISSING_THRESHOLD = 0.5
+# Cột không bao giờ là feature
+ID_COLUMNS = ('TARGET', 'SK_ID_CURR')
+
+# Tăng khi đổi cách chuẩn bị -> kết quả cũ tự bị tạo lại
+PREP_VERSION = 1
+INT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+# Cột cần để tính 4 cột tỷ lệ (cùng thứ tự tham số của ratio_features)
+RATIO_INPUTS = ('AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY', 'DAYS_EMPLOYED', 'DAYS_BIRTH')
+
+def drop_columns(df, columns):
+    """= df.drop(columns=columns) nhưng không copy: các cột còn lại giữ nguyên mảng (VD memory-map của PreparedData)."""
+    columns = set(columns)
+    return pd.DataFrame({name: df[name] for name in df.columns if name not in columns}, copy=False)
+
+def clean_name(name):
+    """Tên cột không có ký tự đặc biệt (giống bước rename của train_advanced.py)."""
+    return re.sub('[^A-Za-z0-9_]+', '', name)
+
+class ColumnStats:
+    """Thống kê 1 cột qua các chunk (bộ nhớ cố định, trừ từ điển category)."""
+
+    def __init__(self):
+        self.non_null = 0
+        self.kinds = set()
+        self.int_min = None
+        self.int_max = None
+        self.float32_exact = True
+        self.values = set()
+
+    def update(self, series):
+        self.non_null += int(series.notna().sum())
+        dtype = series.dtype
+        if dtype == object or pd.api.types.is_string_dtype(dtype):
+            self.kinds.add('object')
+            self.values.update(series.dropna().unique().tolist())
+        elif pd.api.types.is_bool_dtype(dtype):
+            self.kinds.add('bool')
+        else:
+            self.kinds.add('int' if pd.api.types.is_integer_dtype(dtype) else 'float')
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            if pd.api.types.is_integer_dtype(dtype) and len(series):
+                lo, hi = int(series.min()), int(series.max())
+                self.int_min = lo if self.int_min is None else min(self.int_min, lo)
+                self.int_max = hi if self.int_max is None else max(self.int_max, hi)
+            if self.float32_exact:
+                self.float32_exact = np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True)
+
+    def final_dtype(self, force_float32=FORCE_FLOAT32):
+        """Kiểu của cột sau data_loader.downcast_column trên toàn bộ cột (đọc CSV 1 lần)."""
+        if 'object' in self.kinds:
+            return 'category'
+        if self.kinds == {'bool'}:
+            return 'bool'
+        if self.kinds == {'int'}:
+            return next(np.dtype(t).name for t in INT_TYPES
+                        if np.iinfo(t).min <= self.int_min and self.int_max <= np.iinfo(t).max)
+        return 'float32' if force_float32 or self.float32_exact else 'float64'
+
+def _fingerprint(csv_path, missing_threshold):
+    stat = os.stat(csv_path)
+    return {
+        "source": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "version": PREP_VERSION,
+        "force_float32": FORCE_FLOAT32,
+        "missing_threshold": missing_threshold,
+    }
+
+def _chunks(csv_path, chunk_rows, dtype=None, usecols=None):
+    return pd.read_csv(csv_path, chunksize=chunk_rows, dtype=dtype, usecols=usecols)
+
+def _cast(series, dtype):
+    """Ép 1 chunk của cột về kiểu cuối cùng (category xử lý riêng)."""
+    if dtype in ('float32', 'float64'):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan).astype(dtype)
+    return series.to_numpy().astype(dtype)
+
+def _chunk_ratios(chunk, dtypes):
+    """4 cột tỷ lệ của 1 chunk, tính từ cột đã ép kiểu như add_ratio_features trên DataFrame đã thu nhỏ."""
+    inputs = [_cast(chunk[c], dtypes[c]).astype(np.float64) for c in RATIO_INPUTS]
+    return ratio_features(*inputs)
+
+def scan_source(csv_path=DATA_PATH, chunk_rows=PREP_CHUNK_ROWS):
+    """Lượt 1: thống kê từng cột (kể cả cột tỷ lệ). Trả về (số dòng, {cột: ColumnStats}) theo thứ tự cột."""
+    stats = None
+    rows = 0
+    for chunk in _chunks(csv_path, chunk_rows):
+        if stats is None:
+            stats = {col: ColumnStats() for col in chunk.columns}
+        for col in chunk.columns:
+            stats[col].update(chunk[col])
+        rows += len(chunk)
+
+    # Cột tỷ lệ cần kiểu cuối cùng của cột đầu vào (DATA_CACHE_FLOAT32=1 làm thay đổi giá trị) -> đọc thêm 1 lượt
+    # chỉ với 5 cột đầu vào
+    if all(c in stats for c in RATIO_INPUTS):
+        dtypes = {c: stats[c].final_dtype() for c in RATIO_INPUTS}
+        for name in RATIO_FEATURES:
+            stats[name] = ColumnStats()
+        for chunk in _chunks(csv_path, chunk_rows, usecols=list(RATIO_INPUTS)):
+            for name, values in _chunk_ratios(chunk, dtypes).items():
+                stats[name].update(pd.Series(values))
+    return rows, stats
+
+class PreparedData:
+    """Kết quả của prepare_dataset(): các cột .npy (memory-map) + manifest.json."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.rows = self.manifest['rows']
+        self.columns = [c['name'] for c in self.manifest['columns']]
+        self.cat_features = self.manifest['cat_features']
+        self.categories = self.manifest['categories']
+        self._files = {c['name']: c['file'] for c in self.manifest['columns']}
+        self._dtypes = {c['name']: c['dtype'] for c in self.manifest['columns']}
+
+    @property
+    def features(self):
+        return [c for c in self.columns if c not in ID_COLUMNS]
+
+    def column(self, name, mmap=True):
+        """Mảng của 1 cột, mặc định qua memory-map (category: mã category, thiếu = -1)."""
+        return np.load(os.path.join(self.path, self._files[name]), mmap_mode='r' if mmap else None)
+
+    def series(self, name):
+        """pd.Series của 1 cột, dùng thẳng memory-map (không copy vào RAM, chỉ đọc)."""
+        values = self.column(name)
+        if self._dtypes[name] == 'category':
+            return pd.Series(pd.Categorical.from_codes(values, categories=self.categories[name]), name=name, copy=False)
+        return pd.Series(values, name=name, copy=False)
+
+    def to_frame(self, columns=None):
+        """
+        DataFrame giống hệt train_advanced.load_and_preprocess_data (mặc định: tất cả cột).
+        Mỗi cột là memory-map chỉ đọc của file .npy (không copy vào RAM) -> RAM bị chặn từ đầu tới cuối:
+        chuẩn bị theo chunk, DataFrame trên memory-map (bỏ cột bằng drop_columns, không copy), CV ghi ma trận
+        train thẳng ra file .npy memory-map; hệ điều hành nạp/bỏ các trang theo nhu cầu.
+        Ngoại lệ: khi train lại model cuối trên toàn bộ dữ liệu (FINALIZE_MODE retrain/full), LightGBM tự đổi
+        DataFrame sang ma trận trong RAM lúc dựng Dataset; FINALIZE_MODE=ensemble không có bước này.
+        """
+        columns = self.columns if columns is None else columns
+        # copy=False: mỗi cột giữ nguyên memory-map, không gộp block (gộp block = copy thêm cả DataFrame)
+        return pd.DataFrame({name: self.series(name) for name in columns}, copy=False)
+
+def _open_column(path, dtype, rows):
+    """Mở file .npy (header với số dòng đã biết) để ghi nối tiếp dữ liệu từng chunk."""
+    f = open(path, 'wb')
+    np.lib.format.write_array_header_1_0(
+        f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (rows,)}
+    )
+    return f
+
+def prepare_dataset(csv_path=DATA_PATH, out_dir=None, chunk_rows=PREP_CHUNK_ROWS,
+                    missing_threshold=MISSING_THRESHOLD, force=False):
+    """
+    Chuẩn bị dữ liệu cho train_advanced.py theo 2 lượt đọc CSV, RAM cố định.
+    Trả về PreparedData (dùng lại kết quả cũ nếu CSV và cấu hình không đổi, trừ khi force=True).
+    """
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    out_dir = out_dir or os.path.join(PREP_DIR, name)
+    fingerprint = _fingerprint(csv_path, missing_threshold)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                print(f"[prep] dùng lại dữ liệu đã chuẩn bị: {out_dir}")
+                return PreparedData(out_dir)
+
+    start = time.perf_counter()
+    rows, stats = scan_source(csv_path, chunk_rows)
+    scan_seconds = time.perf_counter() - start
+
+    # Giống df.columns[df.isnull().mean() > 0.5] trên DataFrame đã thêm cột tỷ lệ
+    dtypes = {col: s.final_dtype() for col, s in stats.items()}
+    # Cột tỷ lệ được tính lại từ chunk (ghi đè cột trùng tên trong CSV như add_ratio_features), luôn là float64
+    with_ratios = all(c in stats for c in RATIO_INPUTS)
+    if with_ratios:
+        dtypes.update(dict.fromkeys(RATIO_FEATURES, 'float64'))
+    dropped = [col for col, s in stats.items() if rows and (rows - s.non_null) / rows > missing_threshold]
+    kept = [col for col in stats if col not in dropped]
+    categories = {col: sorted(stats[col].values) for col in kept if dtypes[col] == 'category'}
+    code_dtypes = {col: pd.Categorical([], categories=cats).codes.dtype.name for col, cats in categories.items()}
+    names = {col: clean_name(col) for col in kept}
+
+    # Ghi vào thư mục tạm rồi đổi tên: lần chạy song song / bị ngắt giữa chừng không để lại kết quả dở
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    files = {col: f"{j:04d}_{names[col]}.npy" for j, col in enumerate(kept)}
+    outputs = {col: _open_column(os.path.join(tmp_dir, files[col]), code_dtypes.get(col, dtypes[col]), rows)
+               for col in kept}
+    ratio_cols = [c for c in kept if with_ratios and c in RATIO_FEATURES]
+    source_cols = [c for c in kept if c not in ratio_cols]
+    # Cột category đọc dạng chuỗi ở mọi chunk (chunk toàn giá trị thiếu không bị đọc thành float)
+    read_dtypes = {c: object for c in source_cols if dtypes[c] == 'category'}
+    try:
+        for chunk in _chunks(csv_path, chunk_rows, dtype=read_dtypes):
+            for col in source_cols:
+                if col in categories:
+                    values = pd.Categorical(chunk[col], categories=categories[col]).codes
+                else:
+                    values = _cast(chunk[col], dtypes[col])
+                outputs[col].write(np.ascontiguousarray(values).tobytes())
+            if ratio_cols:
+                ratios = _chunk_ratios(chunk, dtypes)
+                for col in ratio_cols:
+                    outputs[col].write(np.ascontiguousarray(ratios[col], dtype=np.float64).tobytes())
+    finally:
+        for f in outputs.values():
+            f.close()
+
+    manifest = {
+        'fingerprint': fingerprint,
+        'rows': rows,
+        'columns': [{'name': names[col], 'source': col, 'dtype': dtypes[col], 'file': files[col],
+                     'missing_rate': (rows - stats[col].non_null) / rows if rows else 0.0} for col in kept],
+        'cat_features': [col for col in kept if col in categories],
+        'categories': {names[col]: cats for col, cats in categories.items()},
+        'dropped': dropped,
+        'seconds': {'scan': scan_seconds, 'total': time.perf_counter() - start},
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+    print(f"[prep] {rows} dòng, giữ {len(kept)}/{len(stats)} cột (bỏ {len(dropped)} cột thiếu > "
+          f"{missing_threshold:.0%}) trong {manifest['seconds']['total']:.2f}s, RAM đỉnh {peak_rss_mb():.0f} MB "
+          f"-> {out_dir}")
+    return PreparedData(out_dir)
+
+# SO SÁNH VỚI CÁCH CŨ (TRONG RAM)
+# Mỗi cách chạy trong 1 tiến trình riêng để RAM đỉnh không bị cộng dồn.
+def _current_rss_mb():
+    """RAM hiện tại (không phải đỉnh): import thư viện có thể tạo đỉnh tạm thời che mất phần tăng do xử lý dữ liệu."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+def _measure(args):
+    mode, csv_path = args
+    import train_advanced
+    train_advanced.DATA_PATH = csv_path
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    if mode == "memory":
+        df, cat_feats = train_advanced.load_and_preprocess_data(streaming=False)
+    else:
+        prepared = prepare_dataset(csv_path, force=True)
+        df, cat_feats = prepared.to_frame(), prepared.cat_features
+    return time.perf_counter() - start, peak_rss_mb() - rss_before, df, cat_feats
+
+def compare(csv_path=DATA_PATH):
+    """Chạy cả 2 cách, kiểm tra kết quả giống hệt nhau. Trả về list dict {mode, seconds, ram_mb}."""
+    import multiprocessing
+    ctx = multiprocessing.get_context('spawn')
+    rows, results = [], {}
+    for mode in ("memory", "streaming"):
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            seconds, ram_mb, df, cat_feats = pool.map(_measure, [(mode, csv_path)])[0]
+        results[mode] = (df, cat_feats)
+        rows.append({'mode': mode, 'seconds': seconds, 'ram_mb': ram_mb})
+    (expected, expected_cats), (actual, actual_cats) = results['memory'], results['streaming']
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual_cats == expected_cats, (actual_cats, expected_cats)
+    return rows
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+    rows = compare(csv_path)
+    print(f"\n{'Cách xử lý':<12}{'Thời gian (s)':>15}{'RAM tăng (MB)':>15}")
+    for row in rows:
+        print(f"{row['mode']:<12}{row['seconds']:>15.2f}{row['ram_mb']:>15.0f}")
+    print("Kết quả giống hệt cách cũ: OK")
@@ -5,23 +5,30 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import roc_auc_score, classification_report
 import joblib
 import gc
+from processing import add_ratio_features
+from data_loader import load_application_data, categorical_columns
 
 DATA_PATH = '../data/application_train.csv'
 MODEL_PATH = 'lgbm_credit_model.pkl'
 
+# Cấu hình LightGBM (train_all.py dùng lại cho model "full")
+FULL_PARAMS = dict(
+    n_estimators=1000,      # số cây tối đa.
+    learning_rate=0.05,     # Tốc độ học. Thấp (0.01-0.05) thường tốt hơn nhưng chạy lâu hơn.
+    num_leaves=31,          # Số lượng lá tối đa trên 1 cây. Đây là tham số quan trọng nhất để chỉnh độ phức tạp.
+                            # Với LightGBM, num_leaves quan trọng hơn max_depth.
+    objective='binary',     # Bài toán nhị phân (0: Trả tốt, 1: Nợ xấu).
+    class_weight='balanced',# Cực quan trọng cho Credit Scoring: Cân bằng lại mẫu nợ xấu/tốt.
+    random_state=42,        # Để kết quả chạy lại y hệt lần trước.
+    n_jobs=-1               # Dùng tất cả nhân CPU để chạy cho nhanh.
+)
+
 def load_and_preprocess_data():
     print("Đang tải dữ liệu...")
-    df = pd.read_csv(DATA_PATH)
+    df = load_application_data(csv_path=DATA_PATH)
     
-    # FEATURE ENGINEERING (TẠO ĐẶC TRƯNG MỚI)
-    # Tỷ lệ: Tống số tiền vay / Thu nhập hàng năm (Vay nhiều quá mức lương?)
-    df['CREDIT_INCOME_PERCENT'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
-    # Tỷ lệ: Tiền trả hàng tháng / Thu nhập hàng tháng (Gánh nặng hàng tháng)
-    df['ANNUITY_INCOME_PERCENT'] = df['AMT_ANNUITY'] / (df['AMT_INCOME_TOTAL'] / 12)
-    # Tỷ lệ: Thời hạn vay (tháng)
-    df['CREDIT_TERM'] = df['AMT_CREDIT'] / df['AMT_ANNUITY']
-    # Tỷ lệ: Số ngày đi làm / Số ngày tuổi (Mức độ ổn định công việc)
-    df['DAYS_EMPLOYED_PERCENT'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
+    # FEATURE ENGINEERING (TẠO ĐẶC TRƯNG MỚI) - dùng chung với backend (processing.py)
+    df = add_ratio_features(df)
     
     # XỬ LÝ DỮ LIỆU THIẾU & DƯ THỪA
     # Loại bỏ các cột thiếu > 50% dữ liệu 
@@ -31,7 +38,7 @@ def load_and_preprocess_data():
     
     # Xử lý biến Categorical (One-Hot Encoding đơn giản)
     # Chỉ lấy các biến số (Numeric) và biến Categorical ít giá trị để demo nhanh
-    categorical_cols = [col for col in df.columns if df[col].dtype == 'object']
+    categorical_cols = categorical_columns(df)
     df = pd.get_dummies(df, columns=categorical_cols, dummy_na=True)
     
     # Điền dữ liệu thiếu còn lại bằng Median (cho an toàn)
@@ -55,16 +62,7 @@ def train_model(df):
     print(f"Bắt đầu train model với {X_train.shape[1]} features...")
     
     # Cấu hình LightGBM
-    model = lgb.LGBMClassifier(
-        n_estimators=1000,      # số cây tối đa.
-        learning_rate=0.05,     # Tốc độ học. Thấp (0.01-0.05) thường tốt hơn nhưng chạy lâu hơn.
-        num_leaves=31,          # Số lượng lá tối đa trên 1 cây. Đây là tham số quan trọng nhất để chỉnh độ phức tạp.
-                                # Với LightGBM, num_leaves quan trọng hơn max_depth.
-        objective='binary',     # Bài toán nhị phân (0: Trả tốt, 1: Nợ xấu).
-        class_weight='balanced',# Cực quan trọng cho Credit Scoring: Cân bằng lại mẫu nợ xấu/tốt.
-        random_state=42,        # Để kết quả chạy lại y hệt lần trước.
-        n_jobs=-1               # Dùng tất cả nhân CPU để chạy cho nhanh.
-)
+    model = lgb.LGBMClassifier(**FULL_PARAMS)
     
     # Training
     model.fit(
@@ -1,31 +1,50 @@
 import pandas as pd
 import numpy as np
 import lightgbm as lgb
-from sklearn.model_selection import StratifiedKFold
 from sklearn.metrics import roc_auc_score, f1_score, precision_recall_curve
 import joblib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import re
 import gc
+from processing import add_ratio_features, category_vocabulary
+from data_loader import load_application_data, categorical_columns
+from cv_runner import run_cv, finalize_model
+from artifact import export_artifact, artifact_path
+from streaming_prep import STREAMING_PREP_ENABLED, drop_columns, prepare_dataset
 
 DATA_PATH = '../data/application_train.csv'
 MODEL_PATH = 'lgbm_credit_model_final.pkl'
+META_PATH = 'model_metadata_final.pkl'
 N_FOLDS = 5
 
-def load_and_preprocess_data():
+# Cấu hình LightGBM tối ưu cho Imbalanced Data
+# (hpo.py dùng làm cấu hình gốc và trần n_estimators khi tìm kiếm)
+ADVANCED_PARAMS = dict(
+    n_estimators=2000,
+    learning_rate=0.03,      # Giảm LR để học kỹ hơn
+    num_leaves=31,
+    max_depth=8,             # Tránh overfitting
+    objective='binary',
+    class_weight='balanced', # Quan trọng để xử lý mất cân bằng
+    random_state=42,
+    verbose=-1
+)
+
+def load_and_preprocess_data(streaming=STREAMING_PREP_ENABLED):
+    """
+    streaming=True: chuẩn bị theo từng chunk, RAM không phụ thuộc số dòng (streaming_prep.py),
+    kết quả giống hệt cách xử lý trong RAM bên dưới (STREAMING_PREP=0).
+    """
     print("Đang tải và xử lý dữ liệu nâng cao...")
-    df = pd.read_csv(DATA_PATH)
+    if streaming:
+        prepared = prepare_dataset(DATA_PATH)
+        return prepared.to_frame(), prepared.cat_features
+
+    df = load_application_data(csv_path=DATA_PATH)
     
-    # FEATURE ENGINEERING (TẠO ĐẶC TRƯNG MỚI)
-    # Tỷ lệ: Tống số tiền vay / Thu nhập hàng năm (Vay nhiều quá mức lương?)
-    df['CREDIT_INCOME_PERCENT'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
-    # Tỷ lệ: Tiền trả hàng tháng / Thu nhập hàng tháng (Gánh nặng hàng tháng)
-    df['ANNUITY_INCOME_PERCENT'] = df['AMT_ANNUITY'] / (df['AMT_INCOME_TOTAL'] / 12)
-    # Tỷ lệ: Thời hạn vay (tháng)
-    df['CREDIT_TERM'] = df['AMT_CREDIT'] / df['AMT_ANNUITY']
-    # Tỷ lệ: Số ngày đi làm / Số ngày tuổi (Mức độ ổn định công việc)
-    df['DAYS_EMPLOYED_PERCENT'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
+    # FEATURE ENGINEERING (TẠO ĐẶC TRƯNG MỚI) - dùng chung với backend (processing.py)
+    df = add_ratio_features(df)
     
     # XỬ LÝ DỮ LIỆU THIẾU
     missing_cols = df.columns[df.isnull().mean() > 0.5]
@@ -33,7 +52,7 @@ def load_and_preprocess_data():
     
     # NATIVE CATEGORICAL HANDLING 
     # Thay vì One-Hot, chuyển về dạng 'category' để LightGBM tự xử lý tối ưu
-    categorical_cols = [col for col in df.columns if df[col].dtype == 'object']
+    categorical_cols = categorical_columns(df)
     for col in categorical_cols:
         df[col] = df[col].astype('category')
         
@@ -42,6 +61,11 @@ def load_and_preprocess_data():
     
     return df, categorical_cols
 
+def load_advanced_data():
+    """Dữ liệu đầu vào cho CV (dùng bởi hpo.py). Trả về (X, y, cột category)."""
+    df, cat_feats = load_and_preprocess_data()
+    return drop_columns(df, ['TARGET', 'SK_ID_CURR']), df['TARGET'], cat_feats
+
 def find_optimal_threshold(y_true, y_pred_proba):
     """Tìm ngưỡng (threshold) để F1-Score cao nhất"""
     precision, recall, thresholds = precision_recall_curve(y_true, y_pred_proba)
@@ -51,72 +75,42 @@ def find_optimal_threshold(y_true, y_pred_proba):
     print(f'Ngưỡng tối ưu (Best Threshold): {best_thresh:.4f}, F1-Score: {fscore[ix]:.4f}')
     return best_thresh
 
-def train_kfold_model(df, cat_feats):
-    X = df.drop(columns=['TARGET', 'SK_ID_CURR'])
+def train_kfold_model(df, cat_feats, params=None, hpo=None):
+    """
+    params: ghi đè ADVANCED_PARAMS (VD cấu hình tốt nhất từ hpo.py).
+    hpo: kết quả tìm kiếm siêu tham số (hpo.search) để lưu kèm metadata.
+    """
+    # Không copy: với STREAMING_PREP, các cột vẫn là memory-map của dữ liệu đã chuẩn bị
+    X = drop_columns(df, ['TARGET', 'SK_ID_CURR'])
     y = df['TARGET']
     feature_names = X.columns.tolist()
     
-    # Stratified K-Fold: Đảm bảo tỷ lệ nợ xấu ở mỗi fold là như nhau (8%)
-    folds = StratifiedKFold(n_splits=N_FOLDS, shuffle=True, random_state=42)
-    
-    oof_preds = np.zeros(X.shape[0]) # Lưu dự đoán Out-of-Fold
-    models = []
-    
     print(f"Bắt đầu training {N_FOLDS}-Fold Cross Validation...")
     
-    for n_fold, (train_idx, valid_idx) in enumerate(folds.split(X, y)):
-        X_train, y_train = X.iloc[train_idx], y.iloc[train_idx]
-        X_valid, y_valid = X.iloc[valid_idx], y.iloc[valid_idx]
-        
-        # Cấu hình LightGBM tối ưu cho Imbalanced Data
-        clf = lgb.LGBMClassifier(
-            n_estimators=2000,
-            learning_rate=0.03,      # Giảm LR để học kỹ hơn
-            num_leaves=31,
-            max_depth=8,             # Tránh overfitting
-            objective='binary', 
-            class_weight='balanced', # Quan trọng để xử lý mất cân bằng
-            random_state=42,
-            n_jobs=-1,
-            verbose=-1
-        )
-        
-        clf.fit(
-            X_train, y_train, 
-            eval_set=[(X_valid, y_valid)], 
-            eval_metric='auc',
-            categorical_feature=cat_feats, # Chỉ định cột category
-            callbacks=[lgb.early_stopping(stopping_rounds=100), lgb.log_evaluation(0)] # Tắt log rác
-        )
-        
-        y_pred_valid = clf.predict_proba(X_valid)[:, 1]
-        oof_preds[valid_idx] = y_pred_valid
-        
-        score = roc_auc_score(y_valid, y_pred_valid)
-        print(f"   Fold {n_fold+1} | AUC: {score:.5f}")
-        
-        models.append(clf)
-        
-        # Clean RAM
-        del X_train, y_train, X_valid, y_valid
-        gc.collect()
+    # Stratified K-Fold: Đảm bảo tỷ lệ nợ xấu ở mỗi fold là như nhau (8%)
+    # Các fold chạy lần lượt hoặc song song tùy N_PARALLEL_FOLDS / THREADS_PER_FOLD (cv_runner.py)
+    params = dict(ADVANCED_PARAMS, **(params or {}))
+    cv = run_cv(
+        X, y, params,
+        n_splits=N_FOLDS, random_state=42,
+        cat_features=cat_feats, # Chỉ định cột category
+        eval_metric='auc',
+        early_stopping_rounds=100
+    )
+    oof_preds = cv['oof_preds'] # Dự đoán Out-of-Fold
+    gc.collect()
 
     # Đánh giá tổng thể
-    total_auc = roc_auc_score(y, oof_preds)
+    total_auc = cv['oof_auc']
     print(f"\nFINAL AVG AUC: {total_auc:.5f}")
     
     # Tìm ngưỡng tối ưu
     best_threshold = find_optimal_threshold(y, oof_preds)
 
-    # Retrain Full Model để Deploy (Ở đây lưu model tốt nhất trong các fold hoặc train lại)
-    # Để đơn giản và hiệu quả, lưu model của Fold có AUC cao nhất hoặc retrain toàn bộ
-    # Ở đây chọn cách Retrain toàn bộ với số rounds trung bình của các folds
-    print("Đang retrain model trên toàn bộ dữ liệu để deploy...")
-    final_model = lgb.LGBMClassifier(
-        n_estimators=1500, learning_rate=0.03, num_leaves=31, max_depth=8,
-        objective='binary', class_weight='balanced', random_state=42
-    )
-    final_model.fit(X, y, categorical_feature=cat_feats)
+    # Model để Deploy, dùng lại kết quả CV thay vì retrain mù với số cây cố định
+    # FINALIZE_MODE: "retrain" (retrain toàn bộ với số rounds trung bình của các folds)
+    #                hoặc "ensemble" (không retrain, gộp các model fold thành 1 model trung bình)
+    final_model, training = finalize_model(cv, X, y, params, cat_features=cat_feats)
     
     # Lưu Model & Metadata
     joblib.dump(final_model, MODEL_PATH)
@@ -125,16 +119,24 @@ def train_kfold_model(df, cat_feats):
     metadata = {
         'features': feature_names,
         'threshold': best_threshold,
-        'cat_features': cat_feats
+        'cat_features': cat_feats,
+        'categories': category_vocabulary(X, cat_feats),
+        'preprocessing': {'replace_inf': False, 'fill_na': None},
+        'training': dict(training, params=params)
     }
-    joblib.dump(metadata, 'model_metadata.pkl')
+    if hpo is not None:
+        metadata['hpo'] = hpo
+    joblib.dump(metadata, META_PATH)
+    # Artifact native cho backend (tải nhanh, không cần sklearn): lgbm_credit_model_final.artifact
+    export_artifact(final_model, metadata, artifact_path('.', 'final'))
     print(f"Đã lưu model và metadata. Sẵn sàng deploy.")
     
     return final_model, feature_names
 
 def plot_feature_importance(model, feature_names):
     # Vẽ biểu đồ Feature Importance
-    importance = model.feature_importances_
+    # LGBMClassifier (retrain) hoặc lgb.Booster (ensemble)
+    importance = getattr(model, 'booster_', model).feature_importance()
     feature_imp = pd.DataFrame(sorted(zip(importance, feature_names)), columns=['Value','Feature'])
     
     plt.figure(figsize=(10, 8))
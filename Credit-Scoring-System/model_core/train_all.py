@@ -0,0 +1,350 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from processing import RATIO_FEATURES, add_ratio_features, category_vocabulary
+from data_loader import DATA_PATH, categorical_columns, load_application_data, peak_rss_mb
+from cv_runner import (FINALIZE_MODE, FINALIZE_MODES, N_PARALLEL_FOLDS, THREADS_PER_FOLD, collect_cv,
+                       finalize_model, fit_fold, fold_splits, prepare_cv, print_fold, resolve_parallelism)
+from artifact import export_artifact, artifact_path, version_suffix
+from streaming_prep import ID_COLUMNS, MISSING_THRESHOLD, RATIO_INPUTS, clean_name
+from train import FULL_PARAMS
+from train_advanced import ADVANCED_PARAMS, N_FOLDS
+from train_v3 import V3_CAT_FEATURES, V3_INPUT_COLS, V3_MEDIAN_FILL, V3_PARAMS, best_f1_threshold
+from train_focused import FOCUSED_INPUT_COLS, FOCUSED_PARAMS
+from train_incremental import artifact_paths
+
+# TRAIN NHIỀU MODEL TRONG 1 LẦN CHẠY (full, advanced, v3, focused)
+# Mỗi script train*.py tự đọc dữ liệu, tự tính 4 cột tỷ lệ và chạy CV riêng -> train đủ các model = 4 lần tải
+# + feature engineering và 4 lần CV nối tiếp nhau. Ở đây:
+# - Dữ liệu (hợp các cột mọi model cần) được đọc và tính cột tỷ lệ 1 lần.
+# - Mỗi spec (tập feature, cách xử lý category/giá trị thiếu, tham số, tên phiên bản ghi ra) lấy cột của nó dưới
+#   dạng view của khung chung (không copy). Chỉ cột bị biến đổi (điền thiếu, inf, one-hot) mới tạo mảng mới.
+# - Các fold StratifiedKFold chỉ phụ thuộc nhãn -> chia 1 lần, dùng chung cho mọi spec.
+# - Fold của mọi spec chạy chung 1 pool tiến trình (số fold song song x thread/fold theo số core như cv_runner).
+#   Spec nào xong hết fold thì tính ngưỡng, train model deploy và ghi file ngay trong tiến trình chính.
+# - Model + metadata + artifact ghi theo quy ước tên của registry, kèm file tổng hợp AUC, ngưỡng, thời gian.
+# Mỗi spec cho ra đúng model như script train tương ứng (cùng fold, tham số, early stopping, ngưỡng F1),
+# riêng "full" (train.py) được đánh giá bằng CV chung thay cho holdout 80/20 và train lại theo FINALIZE_MODE.
+#
+# Chạy (trong thư mục model_core):
+#   python train_all.py                                  # cả 4 model
+#   python train_all.py v3 focused --output-dir /tmp/models
+#   python train_all.py --specs my_specs.json            # VD {"v3_fast": {"base": "v3", "params": {"learning_rate": 0.05}}}
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_RUNS_DIR = os.path.join(MODEL_DIR, 'train_runs')
+
+DEFAULT_SPEC = dict(
+    columns=None,              # cột đọc từ dữ liệu (kèm TARGET), None = mọi cột; 4 cột tỷ lệ luôn được thêm
+    categorical='native',      # 'native' (pandas category cho LightGBM) hoặc 'onehot' (get_dummies, dummy_na)
+    cat_features=None,         # cột category, None = tự nhận các cột chuỗi/category
+    max_missing=None,          # bỏ cột có tỷ lệ thiếu > giá trị này
+    median_fill=(),            # cột điền thiếu bằng median ('all' = mọi cột số còn thiếu)
+    replace_inf=False,         # inf -> NaN
+    fill_na=None,              # điền NaN còn lại bằng giá trị này
+    params=None,               # tham số LGBMClassifier
+    eval_metric='auc',
+    early_stopping_rounds=100,
+    finalize=FINALIZE_MODE,    # cách tạo model deploy (cv_runner.finalize_model)
+    output=None,               # tên phiên bản ghi ra (lgbm_credit_model_<output>.pkl), mặc định = tên spec
+)
+
+SPECS = {
+    # train.py: mọi cột, one-hot, điền median
+    'full': dict(categorical='onehot', max_missing=MISSING_THRESHOLD, median_fill='all', params=FULL_PARAMS),
+    # train_advanced.py: mọi cột, category native (ghi ra "final" như artifact của script)
+    'advanced': dict(max_missing=MISSING_THRESHOLD, params=ADVANCED_PARAMS, output='final'),
+    'v3': dict(columns=V3_INPUT_COLS, cat_features=V3_CAT_FEATURES, median_fill=V3_MEDIAN_FILL, replace_inf=True,
+               params=V3_PARAMS),
+    'focused': dict(columns=FOCUSED_INPUT_COLS, replace_inf=True, fill_na=0, params=FOCUSED_PARAMS,
+                    eval_metric=None, early_stopping_rounds=50, finalize='full'),
+}
+
+def resolve_specs(names=None, specs_file=None):
+    """
+    Spec đầy đủ (DEFAULT_SPEC + SPECS + file JSON) của các model được chọn, theo thứ tự.
+    Spec trong file JSON kế thừa spec cùng tên (hoặc spec ghi ở khóa "base"); "params" được gộp với params gốc.
+    """
+    specs = {name: dict(DEFAULT_SPEC, **spec) for name, spec in SPECS.items()}
+    if specs_file:
+        with open(specs_file) as f:
+            custom = json.load(f)
+        for name, spec in custom.items():
+            parent = specs.get(spec.get('base', name), DEFAULT_SPEC)
+            merged = dict(parent, **{k: v for k, v in spec.items() if k != 'base'})
+            merged['params'] = dict(parent['params'] or {}, **spec.get('params', {}))
+            specs[name] = merged
+        names = names or list(custom)
+    names = names or list(SPECS)
+
+    selected = {}
+    for name in names:
+        if name not in specs:
+            raise ValueError(f"Không có spec '{name}' (có: {', '.join(specs)})")
+        spec = dict(specs[name], output=specs[name]['output'] or name)
+        if not spec['params']:
+            raise ValueError(f"Spec '{name}' thiếu params")
+        if spec['categorical'] not in ('native', 'onehot'):
+            raise ValueError(f"Spec '{name}': categorical phải là 'native' hoặc 'onehot'")
+        if spec['finalize'] not in FINALIZE_MODES:
+            raise ValueError(f"Spec '{name}': finalize phải là một trong {FINALIZE_MODES}")
+        version_suffix(spec['output'])
+        selected[name] = spec
+    outputs = [spec['output'] for spec in selected.values()]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError(f"Các spec ghi trùng phiên bản: {outputs}")
+    return selected
+
+def load_base(specs, csv_path=DATA_PATH):
+    """Đọc 1 lần hợp các cột mọi spec cần và tính 4 cột tỷ lệ -> khung dữ liệu chung."""
+    if any(spec['columns'] is None for spec in specs.values()):
+        columns = None
+    else:
+        columns = list(dict.fromkeys(
+            col for spec in specs.values() for col in ['TARGET', *spec['columns'], *RATIO_INPUTS]
+        ))
+    return add_ratio_features(load_application_data(columns, csv_path=csv_path))
+
+def _view(df, columns):
+    """DataFrame gồm các cột `columns` của df, dùng chung mảng dữ liệu (không copy)."""
+    return pd.DataFrame({col: df[col] for col in columns}, copy=False)
+
+def build_features(base, spec):
+    """
+    Khung feature của 1 spec từ khung chung `base` (đã có 4 cột tỷ lệ), cùng cách xử lý với script train.
+    Trả về (X, cột category, {cột: median đã điền}). Cột không bị biến đổi là view của base.
+    """
+    if spec['columns'] is None:
+        columns = list(base.columns)
+    else:
+        columns = [col for col in spec['columns'] if col in base.columns]
+        columns += [col for col in RATIO_FEATURES if col not in columns]
+    if spec['max_missing'] is not None:
+        columns = [col for col in columns if base[col].isnull().mean() <= spec['max_missing']]
+    df = _view(base, columns)
+
+    cat_features = categorical_columns(df) if spec['cat_features'] is None else spec['cat_features']
+    cat_features = [col for col in cat_features if col in df.columns]
+    if spec['categorical'] == 'onehot':
+        # Cùng thứ tự cột với pd.get_dummies(df, columns=cat_features): cột giữ nguyên trước, cột dummy sau
+        dummies = pd.get_dummies(_view(df, cat_features), dummy_na=True)
+        df = pd.DataFrame(
+            {**{col: df[col] for col in df.columns if col not in cat_features}, **dict(dummies.items())},
+            copy=False,
+        )
+        cat_features = []
+    else:
+        for col in cat_features:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+
+    # Gán lại cả cột (df[col] = ...) -> mảng mới, không ghi vào khung chung
+    numeric = [col for col in df.columns if col not in cat_features]
+    fill_values = {}
+    if spec['median_fill'] == 'all':
+        median_cols = [col for col in numeric if df[col].hasnans]
+    else:
+        median_cols = list(spec['median_fill'])
+    for col in median_cols:
+        fill_values[col] = float(df[col].median())
+        if df[col].hasnans:
+            df[col] = df[col].fillna(fill_values[col])
+    if spec['replace_inf']:
+        for col in numeric:
+            if pd.api.types.is_float_dtype(df[col].dtype) and np.isinf(df[col].to_numpy()).any():
+                df[col] = df[col].replace([np.inf, -np.inf], np.nan)
+    if spec['fill_na'] is not None:
+        for col in numeric:
+            if df[col].hasnans:
+                df[col] = df[col].fillna(spec['fill_na'])
+
+    # Sửa tên cột (giống bước rename của train.py / train_advanced.py)
+    df.columns = [clean_name(col) for col in df.columns]
+    cat_features = [clean_name(col) for col in cat_features]
+    X = _view(df, [col for col in df.columns if col not in ID_COLUMNS])
+    return X, cat_features, fill_values
+
+def save_model(model, metadata, output_dir, version):
+    """Ghi model + metadata (joblib) và artifact native theo quy ước tên của registry."""
+    os.makedirs(output_dir, exist_ok=True)
+    model_path, meta_path = artifact_paths(output_dir, version)
+    # Ghi ra file tạm rồi đổi tên: registry (hot reload) không bao giờ đọc phải file ghi dở
+    for obj, path in ((model, model_path), (metadata, meta_path)):
+        joblib.dump(obj, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    export_artifact(model, metadata, artifact_path(output_dir, version))
+    return model_path, meta_path
+
+def _finish(name, job, output_dir, n_parallel, n_jobs, cv_seconds, finalize_jobs):
+    """Gộp fold, tính ngưỡng, train model deploy và ghi file của 1 spec. Trả về 1 dòng của bảng tổng hợp."""
+    spec, X, cat_features = job['spec'], job['X'], job['cat_features']
+    y = job['tasks'][0][4]
+    cv = collect_cv(job['tasks'], job['results'], n_parallel, n_jobs, cv_seconds)
+    threshold = best_f1_threshold(y, cv['oof_preds'])
+    print(f"[{name}] OOF AUC: {cv['oof_auc']:.5f} | Ngưỡng tối ưu: {threshold:.4f}")
+    model, training = finalize_model(
+        cv, X, y, spec['params'], cat_features, mode=spec['finalize'], n_jobs=finalize_jobs
+    )
+
+    metadata = {
+        'features': X.columns.tolist(),
+        'threshold': threshold,
+        'cat_features': cat_features,
+        'categories': category_vocabulary(X, cat_features),
+        'preprocessing': {'replace_inf': spec['replace_inf'], 'fill_na': spec['fill_na']},
+        'training': dict(training, params=spec['params'], spec=name),
+    }
+    if job['fill_values']:
+        # Median lúc train (backend không điền giá trị thiếu; train_incremental.py dùng lại)
+        metadata['median_fill'] = job['fill_values']
+    model_path, _ = save_model(model, metadata, output_dir, spec['output'])
+    print(f"[{name}] Đã lưu {model_path}")
+    return {
+        'spec': name,
+        'output': spec['output'],
+        'features': X.shape[1],
+        'oof_auc': float(cv['oof_auc']),
+        'fold_auc': [float(a) for a in cv['fold_auc']],
+        'threshold': float(threshold),
+        'n_estimators': training['n_estimators'],
+        'finalize_mode': training['finalize_mode'],
+        'prep_seconds': job['prep_seconds'],
+        'cv_seconds': cv_seconds,
+        'finalize_seconds': training['finalize_seconds'],
+        'model_path': model_path,
+    }
+
+def train_all(specs, output_dir=MODEL_DIR, n_splits=N_FOLDS, random_state=42, n_parallel=N_PARALLEL_FOLDS,
+              threads_per_fold=THREADS_PER_FOLD, csv_path=DATA_PATH):
+    """
+    Train các spec (resolve_specs) trên 1 lần tải dữ liệu, fold dùng chung, fold của mọi spec chạy chung 1 pool.
+    Trả về bảng tổng hợp (dict) gồm AUC, ngưỡng, thời gian của từng model.
+    """
+    start = time.perf_counter()
+    base = load_base(specs, csv_path)
+    y = base['TARGET'].to_numpy()
+    splits = fold_splits(y, n_splits, random_state)
+    load_seconds = time.perf_counter() - start
+    print(f"Đã tải dữ liệu + cột tỷ lệ 1 lần cho {len(specs)} model: {base.shape[0]} dòng x {base.shape[1]} cột "
+          f"trong {load_seconds:.1f}s")
+
+    # Số fold song song tính trên tổng số fold của mọi spec
+    n_parallel, n_jobs = resolve_parallelism(n_splits * len(specs), n_parallel, threads_per_fold)
+    tmp_dir = tempfile.mkdtemp(prefix='train_all_')
+    rows = {}
+    try:
+        jobs = {}
+        for name, spec in specs.items():
+            prep_start = time.perf_counter()
+            X, cat_features, fill_values = build_features(base, spec)
+            tasks = prepare_cv(
+                X, y, dict(spec['params'], n_jobs=n_jobs), splits, os.path.join(tmp_dir, name), cat_features,
+                spec['eval_metric'], spec['early_stopping_rounds'], verbose=n_parallel == 1,
+            )
+            jobs[name] = dict(spec=spec, X=X, cat_features=cat_features, fill_values=fill_values, tasks=tasks,
+                              results=[], prep_seconds=time.perf_counter() - prep_start)
+            print(f"[{name}] {X.shape[1]} feature ({len(cat_features)} category), "
+                  f"chuẩn bị {jobs[name]['prep_seconds']:.1f}s")
+        del base
+
+        print(f"CV {len(specs)} model x {n_splits} fold: {n_parallel} fold song song x {n_jobs} thread/fold")
+        if n_parallel == 1:
+            for name, job in jobs.items():
+                cv_start = time.perf_counter()
+                for task in job['tasks']:
+                    result = fit_fold(task)
+                    print_fold(result, f"[{name}] ")
+                    job['results'].append(result)
+                rows[name] = _finish(name, job, output_dir, n_parallel, n_jobs, time.perf_counter() - cv_start, -1)
+                jobs[name] = None
+        else:
+            cv_start = time.perf_counter()
+            # spawn: tránh fork tiến trình đã khởi tạo OpenMP của LightGBM
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_parallel, mp_context=ctx) as pool:
+                # Spec nhiều feature (chạy lâu) được xếp trước để các core không bị rảnh ở cuối
+                order = sorted(jobs, key=lambda name: jobs[name]['X'].shape[1], reverse=True)
+                futures = {pool.submit(fit_fold, task): name for name in order for task in jobs[name]['tasks']}
+                pending = {name: len(jobs[name]['tasks']) for name in jobs}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    result = future.result()
+                    print_fold(result, f"[{name}] ")
+                    jobs[name]['results'].append(result)
+                    pending[name] -= 1
+                    if pending[name] == 0:
+                        # Còn fold của spec khác đang chạy -> train lại chỉ dùng số thread của 1 fold
+                        finalize_jobs = n_jobs if any(pending.values()) else -1
+                        rows[name] = _finish(name, jobs[name], output_dir, n_parallel, n_jobs,
+                                             time.perf_counter() - cv_start, finalize_jobs)
+                        jobs[name] = None
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    models = []
+    for name in specs:
+        row = rows[name]
+        row['total_seconds'] = row['prep_seconds'] + row['cv_seconds'] + row['finalize_seconds']
+        models.append(row)
+    return {
+        'rows': int(len(y)),
+        'load_seconds': load_seconds,
+        'n_splits': n_splits,
+        'random_state': random_state,
+        'n_parallel': n_parallel,
+        'threads_per_fold': n_jobs,
+        'peak_rss_mb': peak_rss_mb(),
+        'wall_seconds': time.perf_counter() - start,
+        'models': models,
+    }
+
+def save_summary(summary, path=None):
+    if path is None:
+        os.makedirs(TRAIN_RUNS_DIR, exist_ok=True)
+        path = os.path.join(TRAIN_RUNS_DIR, f"train_all-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+def print_summary(summary):
+    print(f"\n{'Model':<12}{'Phiên bản':<12}{'Feature':>8}{'OOF AUC':>10}{'Ngưỡng':>9}{'Cây':>7}"
+          f"{'Chuẩn bị':>10}{'CV':>9}{'Finalize':>10}{'Tổng (s)':>10}")
+    for row in summary['models']:
+        print(f"{row['spec']:<12}{row['output']:<12}{row['features']:>8}{row['oof_auc']:>10.5f}{row['threshold']:>9.4f}"
+              f"{row['n_estimators']:>7}{row['prep_seconds']:>10.1f}{row['cv_seconds']:>9.1f}"
+              f"{row['finalize_seconds']:>10.1f}{row['total_seconds']:>10.1f}")
+    print(f"Tải dữ liệu: {summary['load_seconds']:.1f}s | Tổng thời gian: {summary['wall_seconds']:.1f}s | "
+          f"RAM đỉnh: {summary['peak_rss_mb']:.0f} MB")
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Train nhiều model trên 1 lần tải dữ liệu + feature engineering.")
+    parser.add_argument('models', nargs='*', help=f"Tên spec (mặc định: {', '.join(SPECS)} hoặc mọi spec trong --specs)")
+    parser.add_argument('--specs', help="File JSON {tên: spec} bổ sung/ghi đè SPECS")
+    parser.add_argument('--output-dir', default=MODEL_DIR)
+    parser.add_argument('--data', default=DATA_PATH, help="File CSV dữ liệu train")
+    parser.add_argument('--folds', type=int, default=N_FOLDS)
+    parser.add_argument('--n-parallel', default=N_PARALLEL_FOLDS, help="Số fold chạy cùng lúc (auto = theo số core)")
+    parser.add_argument('--threads-per-fold', default=THREADS_PER_FOLD)
+    parser.add_argument('--summary', help="File JSON tổng hợp (mặc định train_runs/train_all-<thời điểm>.json)")
+    args = parser.parse_args(argv)
+
+    specs = resolve_specs(args.models, args.specs)
+    summary = train_all(specs, args.output_dir, args.folds, n_parallel=args.n_parallel,
+                        threads_per_fold=args.threads_per_fold, csv_path=args.data)
+    print_summary(summary)
+    print(f"Đã lưu bảng tổng hợp: {save_summary(summary, args.summary)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
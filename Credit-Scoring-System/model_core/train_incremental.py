@@ -0,0 +1,213 @@
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+from processing import FeaturePipeline
+from cv_runner import frame_to_matrix
+from dataset_cache import balanced_weights, native_params
+from artifact import export_artifact, artifact_path, version_suffix
+from train_v3 import V3_INPUT_COLS, V3_CAT_FEATURES, V3_PARAMS, best_f1_threshold, prepare_v3_frame
+
+# TRAIN TIẾP (WARM START) MODEL V3 TỪ DỮ LIỆU CÓ NHÃN MỚI
+# Thay vì chạy lại toàn bộ CV + retrain trên application_train.csv, nạp model V3 đang deploy và boost thêm cây
+# chỉ trên các hồ sơ mới có kết quả trả nợ (init_model của LightGBM) -> thời gian chỉ phụ thuộc số hồ sơ mới.
+# 1. Tách holdout (phân tầng) từ dữ liệu mới, chỉ dùng để so model cũ và model mới.
+# 2. K-Fold trên phần còn lại, mỗi fold boost tiếp từ model cũ + early stopping -> OOF mới, số cây thêm vào.
+#    Ngưỡng quyết định được tính lại (F1 tốt nhất) từ OOF này.
+# 3. Boost tiếp trên toàn bộ phần còn lại với số cây = trung bình best_iteration của các fold.
+# 4. Chỉ ghi model/metadata khi AUC holdout của model mới không kém model cũ quá MAX_AUC_DROP.
+#
+# VD: python train_incremental.py ../data/outcomes_2024_06.csv
+#     python train_incremental.py outcomes.parquet --output-version v3_inc --dry-run
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HOLDOUT_FRAC = 0.2
+N_SPLITS = 5
+# Số cây thêm tối đa mỗi lần train tiếp (early stopping dừng sớm hơn)
+MAX_NEW_ROUNDS = 500
+EARLY_STOPPING_ROUNDS = 50
+# AUC holdout của model mới được phép thấp hơn model cũ tối đa bao nhiêu
+MAX_AUC_DROP = float(os.getenv("INCREMENTAL_MAX_AUC_DROP", 0.0))
+
+def read_new_data(path):
+    """Đọc file CSV/Parquet hồ sơ mới (chỉ các cột V3 cần)."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        available = set(pq.ParquetFile(path).schema_arrow.names)
+        return pd.read_parquet(path, columns=[c for c in V3_INPUT_COLS if c in available])
+    return pd.read_csv(path, usecols=lambda c: c in V3_INPUT_COLS)
+
+def artifact_paths(model_dir, version):
+    """Đường dẫn (model, metadata) theo quy ước tên của registry (backend/registry.py)."""
+    suffix = version_suffix(version)
+    return (
+        os.path.join(model_dir, f"lgbm_credit_model{suffix}.pkl"),
+        os.path.join(model_dir, f"model_metadata{suffix}.pkl"),
+    )
+
+def _dataset(X, y, weighted, feature_names, cat_features):
+    return lgb.Dataset(
+        X, y, weight=balanced_weights(y) if weighted else None, feature_name=feature_names,
+        categorical_feature=cat_features or 'auto', free_raw_data=False,
+    )
+
+def continue_boosting(base, params, X, y, rounds, weighted, feature_names, cat_features, valid=None):
+    """Boost thêm tối đa `rounds` cây từ booster `base`; valid=(X, y) -> early stopping."""
+    train_set = _dataset(X, y, weighted, feature_names, cat_features)
+    valid_sets, callbacks = [], []
+    if valid is not None:
+        valid_sets = [lgb.Dataset(valid[0], valid[1], reference=train_set, free_raw_data=False)]
+        callbacks = [lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)]
+    return lgb.train(params, train_set, rounds, init_model=base, valid_sets=valid_sets, callbacks=callbacks)
+
+def incremental_cv(base, params, X, y, weighted, feature_names, cat_features, n_splits=N_SPLITS,
+                   max_rounds=MAX_NEW_ROUNDS, random_state=42):
+    """K-Fold trên dữ liệu mới, mỗi fold boost tiếp từ `base`. Trả về OOF, AUC từng fold, số cây thêm."""
+    base_trees = base.current_iteration()
+    oof = np.zeros(len(y))
+    fold_auc, added = [], []
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for n_fold, (train_idx, valid_idx) in enumerate(folds.split(X, y)):
+        booster = continue_boosting(
+            base, params, X[train_idx], y[train_idx], max_rounds, weighted, feature_names, cat_features,
+            valid=(X[valid_idx], y[valid_idx]),
+        )
+        # best_iteration tính cả cây của model gốc
+        best = booster.best_iteration or booster.current_iteration()
+        oof[valid_idx] = booster.predict(X[valid_idx], num_iteration=best)
+        fold_auc.append(roc_auc_score(y[valid_idx], oof[valid_idx]))
+        added.append(best - base_trees)
+        print(f"   Fold {n_fold+1} | AUC: {fold_auc[-1]:.5f} | +{added[-1]} cây")
+    return {'oof_preds': oof, 'oof_auc': roc_auc_score(y, oof), 'fold_auc': fold_auc, 'added_trees': added}
+
+def train_incremental(new_path, base_version="v3", output_version=None, model_dir=MODEL_DIR,
+                      holdout_frac=HOLDOUT_FRAC, n_splits=N_SPLITS, max_rounds=MAX_NEW_ROUNDS,
+                      learning_rate=None, max_auc_drop=MAX_AUC_DROP, dry_run=False):
+    """
+    Train tiếp phiên bản base_version (trong model_dir) trên dữ liệu mới (new_path), ghi ra output_version
+    (mặc định ghi đè chính base_version).
+    Trả về dict kết quả; 'accepted' = False khi model mới kém hơn trên holdout (không ghi file).
+    """
+    start = time.perf_counter()
+    model_path, meta_path = artifact_paths(model_dir, base_version)
+    model = joblib.load(model_path)
+    metadata = joblib.load(meta_path)
+    base = getattr(model, 'booster_', model)
+    base_trees = base.current_iteration()
+    # Từ điển category lúc train (metadata cũ chưa lưu -> lấy từ booster), để mã category khớp model gốc
+    categories = FeaturePipeline.from_metadata(metadata, model).categories
+    fill_values = metadata.get('median_fill')
+    if fill_values is None:
+        print("⚠️ Metadata chưa lưu Median lúc train, điền giá trị thiếu bằng Median của dữ liệu mới.")
+
+    df = read_new_data(new_path)
+    X, y, fill_values = prepare_v3_frame(df, fill_values, categories)
+    missing = [f for f in metadata['features'] if f not in X.columns]
+    if missing:
+        raise ValueError(f"Dữ liệu mới thiếu feature của model: {missing}")
+    # Đúng thứ tự feature của model gốc (thứ tự cột trong file có thể khác)
+    feature_names = list(metadata['features'])
+    X = X[feature_names]
+    cat_features = [c for c in feature_names if c in set(V3_CAT_FEATURES)]
+    matrix = frame_to_matrix(X, cat_features)
+    y = np.asarray(y).astype(np.int64)
+    print(f"Train tiếp từ {model_path} ({base_trees} cây) trên {len(y)} hồ sơ mới")
+
+    # Tham số lúc train model gốc (metadata mới lưu 'params'), learning_rate có thể giảm khi train tiếp
+    params = dict(V3_PARAMS, **metadata.get('training', {}).get('params', {}))
+    if learning_rate is not None:
+        params['learning_rate'] = learning_rate
+    weighted = params.get('class_weight') == 'balanced'
+    native = native_params(params, os.cpu_count() or 1)
+
+    train_idx, holdout_idx = train_test_split(
+        np.arange(len(y)), test_size=holdout_frac, stratify=y, random_state=42
+    )
+    X_train, y_train = matrix[train_idx], y[train_idx]
+    X_hold, y_hold = matrix[holdout_idx], y[holdout_idx]
+
+    cv = incremental_cv(base, native, X_train, y_train, weighted, feature_names, cat_features, n_splits, max_rounds)
+    n_new = max(1, int(round(np.mean(cv['added_trees']))))
+    print(f"OOF AUC (dữ liệu mới): {cv['oof_auc']:.5f} | boost thêm {n_new} cây trên {len(y_train)} hồ sơ")
+    updated = continue_boosting(base, native, X_train, y_train, n_new, weighted, feature_names, cat_features)
+
+    current_auc = roc_auc_score(y_hold, base.predict(X_hold))
+    updated_auc = roc_auc_score(y_hold, updated.predict(X_hold))
+    accepted = updated_auc >= current_auc - max_auc_drop
+    print(f"Holdout ({len(y_hold)} hồ sơ) AUC: model cũ {current_auc:.5f} -> model mới {updated_auc:.5f}")
+
+    threshold = float(best_f1_threshold(y_train, cv['oof_preds']))
+    training = {
+        'mode': 'incremental',
+        'data': os.path.abspath(new_path),
+        'base_model': os.path.abspath(model_path),
+        'base_trees': int(base_trees),
+        'added_trees': int(n_new),
+        'new_rows': int(len(y)),
+        'holdout_rows': int(len(y_hold)),
+        'holdout_auc': {'current': float(current_auc), 'updated': float(updated_auc)},
+        'oof_auc': float(cv['oof_auc']),
+        'fold_auc': [float(a) for a in cv['fold_auc']],
+        'fold_added_trees': [int(n) for n in cv['added_trees']],
+        'params': params,
+        'total_seconds': time.perf_counter() - start,
+        # Thông tin lần train trước (train đầy đủ hoặc train tiếp)
+        'previous': metadata.get('training'),
+    }
+    result = {'accepted': bool(accepted), 'threshold': threshold, 'training': training}
+
+    if not accepted:
+        print(f"❌ Model mới kém hơn model cũ trên holdout (quá {max_auc_drop}), không ghi artifact.")
+        return result
+    if dry_run:
+        print(f"Dry run: bỏ qua ghi artifact (ngưỡng mới {threshold:.4f}).")
+        return result
+
+    new_metadata = dict(
+        metadata,
+        categories=categories,
+        median_fill=fill_values,
+        threshold=threshold,
+        training=training,
+    )
+    out_model, out_meta = artifact_paths(model_dir, output_version or base_version)
+    # Ghi ra file tạm rồi đổi tên: registry (hot reload) không bao giờ đọc phải file ghi dở
+    for obj, path in ((updated, out_model), (new_metadata, out_meta)):
+        joblib.dump(obj, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    export_artifact(updated, new_metadata, artifact_path(model_dir, output_version or base_version))
+    print(f"Đã lưu model train tiếp: {out_model} ({updated.current_iteration()} cây, ngưỡng {threshold:.4f}) "
+          f"sau {training['total_seconds']:.1f}s")
+    return result
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Train tiếp model V3 (warm start) trên dữ liệu có nhãn mới.")
+    parser.add_argument('data', help="File CSV/Parquet hồ sơ mới (cùng cột với application_train.csv, có TARGET)")
+    parser.add_argument('--base-version', default='v3', help="Phiên bản model gốc (mặc định v3)")
+    parser.add_argument('--output-version',
+                        help="Tên phiên bản ghi ra (mặc định = --base-version, tức ghi đè model đang deploy)")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--holdout-frac', type=float, default=HOLDOUT_FRAC)
+    parser.add_argument('--folds', type=int, default=N_SPLITS)
+    parser.add_argument('--max-rounds', type=int, default=MAX_NEW_ROUNDS, help="Số cây thêm tối đa")
+    parser.add_argument('--learning-rate', type=float, help="Mặc định = learning_rate của model gốc")
+    parser.add_argument('--max-auc-drop', type=float, default=MAX_AUC_DROP)
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ đánh giá, không ghi artifact")
+    args = parser.parse_args(argv)
+
+    result = train_incremental(
+        args.data, args.base_version, args.output_version, args.model_dir, args.holdout_frac, args.folds,
+        args.max_rounds, args.learning_rate, args.max_auc_drop, args.dry_run,
+    )
+    return 0 if result['accepted'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
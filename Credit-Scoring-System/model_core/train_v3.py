@@ -1,11 +1,14 @@
 import pandas as pd
 import numpy as np
 import lightgbm as lgb
-from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import roc_auc_score, precision_recall_curve
+from sklearn.metrics import precision_recall_curve
 import joblib
 import gc
 import os
+from processing import add_ratio_features, category_vocabulary
+from data_loader import load_application_data
+from cv_runner import run_cv, finalize_model
+from artifact import export_artifact, artifact_path
 
 # CẤU HÌNH ĐƯỜNG DẪN
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -13,120 +16,140 @@ DATA_PATH = os.path.join(BASE_DIR, 'data', 'application_train.csv')
 MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lgbm_credit_model_v3.pkl')
 META_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_metadata_v3.pkl')
 
-def train_v3_kfold_model():
-    print("Đang tải dữ liệu V3 (K-Fold)...")
-    df = pd.read_csv(DATA_PATH)
-    
-    # CHỌN FEATURE CHUẨN NGHIỆP VỤ
-    # Kết hợp Tài chính + Hành vi + Lịch sử tín dụng
-    input_cols = [
-        'TARGET',
-        'AMT_INCOME_TOTAL',
-        'AMT_CREDIT', 
-        'AMT_ANNUITY',
-        'DAYS_BIRTH',
-        'DAYS_EMPLOYED',
-        'NAME_HOUSING_TYPE',       # Quan trọng: Nhà thuê hay nhà riêng
-        'NAME_FAMILY_STATUS',      # Quan trọng: Ổn định gia đình
-        'EXT_SOURCE_2',            # QUAN TRỌNG NHẤT: Điểm tín dụng CIC
-        'EXT_SOURCE_3'             # Điểm phụ
-    ]
-    
-    # Lọc lấy các cột tồn tại
-    existing_cols = [c for c in input_cols if c in df.columns]
-    df = df[existing_cols]
+# Tham số LightGBM mặc định (hpo.py dùng làm cấu hình gốc và trần n_estimators khi tìm kiếm)
+V3_PARAMS = dict(
+    n_estimators=2000,
+    learning_rate=0.02,
+    num_leaves=31,
+    max_depth=8,
+    objective='binary',
+    class_weight='balanced',
+    random_state=42,
+    verbose=-1
+)
+V3_CAT_FEATURES = ['NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS']
 
+# CHỌN FEATURE CHUẨN NGHIỆP VỤ
+# Kết hợp Tài chính + Hành vi + Lịch sử tín dụng
+V3_INPUT_COLS = [
+    'TARGET',
+    'AMT_INCOME_TOTAL',
+    'AMT_CREDIT', 
+    'AMT_ANNUITY',
+    'DAYS_BIRTH',
+    'DAYS_EMPLOYED',
+    'NAME_HOUSING_TYPE',       # Quan trọng: Nhà thuê hay nhà riêng
+    'NAME_FAMILY_STATUS',      # Quan trọng: Ổn định gia đình
+    'EXT_SOURCE_2',            # QUAN TRỌNG NHẤT: Điểm tín dụng CIC
+    'EXT_SOURCE_3'             # Điểm phụ
+]
+# Cột điền giá trị thiếu bằng Median (lưu vào metadata để train tiếp dùng lại đúng giá trị)
+V3_MEDIAN_FILL = ['EXT_SOURCE_2', 'EXT_SOURCE_3']
+
+def prepare_v3_frame(df, fill_values=None, categories=None):
+    """
+    Xử lý dữ liệu thô (các cột V3_INPUT_COLS) -> (X, y, fill_values).
+    fill_values / categories: Median và từ điển category lúc train model gốc (train_incremental.py);
+    None = tính từ chính df như khi train từ đầu.
+    """
     # 2. XỬ LÝ DỮ LIỆU
     # Điền dữ liệu thiếu cho EXT_SOURCE bằng Median
-    df['EXT_SOURCE_2'] = df['EXT_SOURCE_2'].fillna(df['EXT_SOURCE_2'].median())
-    df['EXT_SOURCE_3'] = df['EXT_SOURCE_3'].fillna(df['EXT_SOURCE_3'].median())
+    if fill_values is None:
+        fill_values = {col: float(df[col].median()) for col in V3_MEDIAN_FILL}
+    for col in V3_MEDIAN_FILL:
+        df[col] = df[col].fillna(fill_values[col])
     
-    # Xử lý biến Category
-    categorical_feats = ['NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS']
-    for col in categorical_feats:
+    # Xử lý biến Category (category lạ với từ điển lúc train -> NaN, giống backend)
+    for col in V3_CAT_FEATURES:
         if col in df.columns:
-            df[col] = df[col].astype('category')
+            if categories and col in categories:
+                df[col] = pd.Categorical(df[col], categories=categories[col])
+            else:
+                df[col] = df[col].astype('category')
             
-    # Feature Engineering
-    # Tỷ lệ vay / thu nhập
-    df['CREDIT_INCOME_PERCENT'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
-    # Tỷ lệ trả hàng tháng / thu nhập
-    df['ANNUITY_INCOME_PERCENT'] = df['AMT_ANNUITY'] / (df['AMT_INCOME_TOTAL'] / 12)
-    # Thời hạn vay
-    df['CREDIT_TERM'] = df['AMT_CREDIT'] / df['AMT_ANNUITY']
-    # Thâm niên / Tuổi
-    df['DAYS_EMPLOYED_PERCENT'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
+    # Feature Engineering - dùng chung với backend (processing.py)
+    df = add_ratio_features(df)
 
     # Xử lý vô cực
     df.replace([np.inf, -np.inf], np.nan, inplace=True)
     
-    print(f"Bắt đầu train V3 với {df.shape[1]} features sử dụng 5-Fold CV...")
-
     X = df.drop(columns=['TARGET'])
     y = df['TARGET']
+    return X, y, fill_values
+
+def best_f1_threshold(y, preds):
+    """Ngưỡng cho F1 cao nhất trên dự đoán OOF."""
+    precision, recall, thresholds = precision_recall_curve(y, preds)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fscore = (2 * precision * recall) / (precision + recall)
+    # Xử lý trường hợp chia cho 0 nếu có
+    fscore = np.nan_to_num(fscore)
+    return thresholds[np.argmax(fscore)]
+
+def _load_v3_frame():
+    print("Đang tải dữ liệu V3 (K-Fold)...")
     
+    # Chỉ đọc các cột cần từ cache Parquet (data_loader.py), cột không tồn tại được bỏ qua
+    df = load_application_data(V3_INPUT_COLS, csv_path=DATA_PATH)
+    return prepare_v3_frame(df)
+
+def load_v3_data():
+    """Đọc + xử lý dữ liệu cho V3. Trả về (X, y, cột category)."""
+    X, y, _ = _load_v3_frame()
+    return X, y, V3_CAT_FEATURES
+
+def train_v3_kfold_model(params=None, hpo=None):
+    """
+    params: ghi đè V3_PARAMS (VD cấu hình tốt nhất từ hpo.py).
+    hpo: kết quả tìm kiếm siêu tham số (hpo.search) để lưu kèm metadata.
+    """
+    X, y, fill_values = _load_v3_frame()
+    categorical_feats = V3_CAT_FEATURES
+    print(f"Bắt đầu train V3 với {X.shape[1]} features sử dụng 5-Fold CV...")
+
     # 3. TRAINING VỚI STRATIFIED K-FOLD 
-    folds = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-    oof_preds = np.zeros(X.shape[0])
-    
-    for n_fold, (train_idx, valid_idx) in enumerate(folds.split(X, y)):
-        X_train, y_train = X.iloc[train_idx], y.iloc[train_idx]
-        X_valid, y_valid = X.iloc[valid_idx], y.iloc[valid_idx]
-        
-        clf = lgb.LGBMClassifier(
-            n_estimators=2000,
-            learning_rate=0.02,
-            num_leaves=31,
-            max_depth=8,
-            objective='binary', 
-            class_weight='balanced', 
-            random_state=42,
-            n_jobs=-1,
-            verbose=-1
-        )
-        
-        clf.fit(
-            X_train, y_train, 
-            eval_set=[(X_valid, y_valid)], 
-            eval_metric='auc',
-            callbacks=[lgb.early_stopping(100)]
-        )
-        
-        # Dự đoán trên tập validation
-        oof_preds[valid_idx] = clf.predict_proba(X_valid)[:, 1]
-        
-        fold_auc = roc_auc_score(y_valid, oof_preds[valid_idx])
-        print(f"Fold {n_fold+1} AUC: {fold_auc:.5f}")
+    # Các fold chạy lần lượt hoặc song song tùy N_PARALLEL_FOLDS / THREADS_PER_FOLD (cv_runner.py)
+    params = dict(V3_PARAMS, **(params or {}))
+    cv = run_cv(
+        X, y, params,
+        n_splits=5, random_state=42,
+        cat_features=categorical_feats,
+        eval_metric='auc',
+        early_stopping_rounds=100
+    )
+    oof_preds = cv['oof_preds']
 
     # Đánh giá tổng thể
-    total_auc = roc_auc_score(y, oof_preds)
+    total_auc = cv['oof_auc']
     print(f"\nFINAL V3 AUC: {total_auc:.5f}")
     
     # Tìm ngưỡng tối ưu (Best Threshold)
-    precision, recall, thresholds = precision_recall_curve(y, oof_preds)
-    fscore = (2 * precision * recall) / (precision + recall)
-    # Xử lý trường hợp chia cho 0 nếu có
-    fscore = np.nan_to_num(fscore)
-    best_thresh = thresholds[np.argmax(fscore)]
+    best_thresh = best_f1_threshold(y, oof_preds)
     print(f"Ngưỡng tối ưu (Best Threshold): {best_thresh:.4f}")
 
-    # 4. RETRAIN FULL MODEL & SAVE 
-    print("Đang retrain model trên toàn bộ dữ liệu...")
-    final_model = lgb.LGBMClassifier(
-        n_estimators=2000, learning_rate=0.02, num_leaves=31, max_depth=8,
-        objective='binary', class_weight='balanced', random_state=42
-    )
-    final_model.fit(X, y)
+    # 4. MODEL DEPLOY & SAVE 
+    # FINALIZE_MODE: "retrain" (train lại với số cây = trung bình best_iteration) hoặc "ensemble" (gộp các model fold)
+    final_model, training = finalize_model(cv, X, y, params, cat_features=categorical_feats)
     
     # Lưu Model
     joblib.dump(final_model, MODEL_PATH)
     
     # Lưu Metadata (Gồm cả tên các cột category để xử lý ở backend)
-    joblib.dump({
+    metadata = {
         'features': X.columns.tolist(),
         'cat_features': categorical_feats,
-        'threshold': best_thresh
-    }, META_PATH)
+        'categories': category_vocabulary(X, categorical_feats),
+        'preprocessing': {'replace_inf': True, 'fill_na': None},
+        # Median lúc train (backend không điền giá trị thiếu; train_incremental.py dùng lại)
+        'median_fill': fill_values,
+        'threshold': best_thresh,
+        'training': dict(training, params=params)
+    }
+    if hpo is not None:
+        metadata['hpo'] = hpo
+    joblib.dump(metadata, META_PATH)
+    # Artifact native cho backend (tải nhanh, không cần sklearn): lgbm_credit_model_v3.artifact
+    export_artifact(final_model, metadata, artifact_path(os.path.dirname(MODEL_PATH), 'v3'))
     
     print("Đã lưu Model V3 chuẩn K-Fold.")
 
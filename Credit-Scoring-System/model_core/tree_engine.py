@@ -0,0 +1,353 @@
+import numpy as np
+import math
+import os
+import time
+
+# Engine suy luận thuần NumPy cho model LightGBM (binary)
+# Cây được "làm phẳng" từ booster_.dump_model() thành các mảng liên tục,
+# sau đó duyệt song song toàn bộ cây cho 1 dòng hoặc cả batch.
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lgbm_credit_model_v3.pkl')
+
+# Kiểu xử lý giá trị thiếu của LightGBM (missing_type trong dump_model)
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# LightGBM coi |x| <= kZeroThreshold là 0
+ZERO_THRESHOLD = 1e-35
+
+class CompiledTreeEnsemble:
+    """
+    Ensemble cây đã biên dịch sang mảng NumPy.
+
+    Mọi node (node trong + lá) nằm chung một bảng đánh số toàn cục:
+    - split_feature, threshold: điều kiện rẽ PHẢI là x[split_feature] > threshold
+    - children: mảng phẳng [trái, phải] của từng node; lá tự trỏ về chính nó
+      nên có thể duyệt tất cả cây đúng max_depth bước mà không cần lọc node đang hoạt động
+    - nan_right / zero_right: hướng đi khi giá trị thiếu (theo missing_type, default_left)
+    - split categorical được chuyển thành "feature ảo" 0/1: bảng cat_right (bitset) được tra
+      một lần cho mỗi dòng, node tương ứng so sánh feature ảo với ngưỡng 0.5
+    - leaf_value: giá trị lá (đánh số từ n_internal); roots: node gốc của từng cây
+    """
+
+    def __init__(self, dump, cat_features=None):
+        if not dump['objective'].startswith('binary') or dump.get('num_tree_per_iteration', 1) != 1:
+            raise ValueError(f"Chỉ hỗ trợ model binary, nhận được: {dump['objective']}")
+
+        self.feature_names = dump['feature_names']
+        self.n_features = len(self.feature_names)
+        self.sigmoid = 1.0
+        for token in dump['objective'].split()[1:]:
+            if token.startswith('sigmoid:'):
+                self.sigmoid = float(token.split(':')[1])
+        self.average_output = dump.get('average_output', False)
+
+        # Các cột categorical (theo thứ tự feature) và từ điển category lúc train
+        categories = dump.get('pandas_categorical') or []
+        cat_features = set(cat_features or [])
+        cat_cols = [f for f in self.feature_names if f in cat_features]
+        self.categories = dict(zip(cat_cols, categories))
+
+        self._compile([tree['tree_structure'] for tree in dump['tree_info']])
+
+    @classmethod
+    def from_model(cls, model, cat_features=None):
+        """Tạo engine từ LGBMClassifier (hoặc lgb.Booster) đã train."""
+        booster = getattr(model, 'booster_', model)
+        return cls(booster.dump_model(), cat_features)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH, cat_features=None):
+        import joblib
+        return cls.from_model(joblib.load(path), cat_features)
+
+    def _compile(self, trees):
+        internal, leaves, cat_splits = [], [], []
+
+        def visit(node, depth):
+            if 'leaf_value' in node:
+                leaves.append(node['leaf_value'])
+                return ('leaf', len(leaves) - 1), depth
+            node_id = len(internal)
+            internal.append(None)
+            left, left_depth = visit(node['left_child'], depth + 1)
+            right, right_depth = visit(node['right_child'], depth + 1)
+            internal[node_id] = (node, left, right)
+            return ('node', node_id), max(left_depth, right_depth)
+
+        roots, depths = [], []
+        for tree in trees:
+            root, depth = visit(tree, 0)
+            roots.append(root)
+            depths.append(depth)
+
+        n_internal = len(internal)
+        n_nodes = n_internal + len(leaves)
+        gid = lambda ref: ref[1] if ref[0] == 'node' else n_internal + ref[1]
+
+        split_feature = np.zeros(n_nodes, dtype=np.intp)
+        threshold = np.full(n_nodes, np.inf)
+        children = np.repeat(np.arange(n_nodes, dtype=np.intp), 2)
+        nan_right = np.zeros(n_nodes, dtype=bool)
+        zero_right = np.zeros(n_nodes, dtype=bool)
+        is_zero_missing = np.zeros(n_nodes, dtype=bool)
+
+        for i, (node, left, right) in enumerate(internal):
+            children[2 * i] = gid(left)
+            children[2 * i + 1] = gid(right)
+            if node['decision_type'] == '==':
+                # Split categorical: threshold dạng "0||3||5" = các category đi sang trái
+                split_feature[i] = self.n_features + len(cat_splits)
+                threshold[i] = 0.5
+                cat_splits.append((node['split_feature'], [int(c) for c in str(node['threshold']).split('||')]))
+                continue
+            split_feature[i] = node['split_feature']
+            threshold[i] = float(node['threshold'])
+            missing = MISSING_TYPES[node['missing_type']]
+            if missing == MISSING_NONE:
+                # NaN được coi là 0
+                nan_right[i] = 0.0 > threshold[i]
+            else:
+                nan_right[i] = not node['default_left']
+            if missing == MISSING_ZERO:
+                is_zero_missing[i] = True
+                zero_right[i] = not node['default_left']
+
+        # Bảng tra categorical theo từng feature: cat_tables[j][v, k] = True nếu giá trị v
+        # rẽ phải tại split categorical thứ k của feature j. Dòng cuối dành cho NaN,
+        # giá trị âm hoặc category lạ (luôn rẽ phải).
+        n_values = max((max(cats) for _, cats in cat_splits), default=0) + 1
+        self.cat_groups = []
+        order = []
+        for feat in sorted({f for f, _ in cat_splits}):
+            members = [k for k, (f, _) in enumerate(cat_splits) if f == feat]
+            table = np.ones((n_values + 1, len(members)), dtype=np.float64)
+            for col, k in enumerate(members):
+                table[cat_splits[k][1], col] = 0.0
+            self.cat_groups.append((feat, table))
+            order.extend(members)
+        # Đánh số lại feature ảo theo thứ tự nhóm
+        position = {k: pos for pos, k in enumerate(order)}
+        for i in range(n_internal):
+            if split_feature[i] >= self.n_features:
+                split_feature[i] = self.n_features + position[split_feature[i] - self.n_features]
+        # Bitset uint32 tương đương (định dạng của LightGBM) để lưu/đối chiếu
+        self.cat_bitsets = np.zeros((len(cat_splits), (n_values + 31) // 32), dtype=np.uint32)
+        for pos, k in enumerate(order):
+            for c in cat_splits[k][1]:
+                self.cat_bitsets[pos, c // 32] |= np.uint32(1 << (c % 32))
+
+        self._set_tables(n_internal, split_feature, threshold, children, nan_right, zero_right, is_zero_missing,
+                         np.asarray(leaves, dtype=np.float64), np.asarray([gid(r) for r in roots], dtype=np.intp),
+                         max(depths, default=0))
+
+    def _set_tables(self, n_internal, split_feature, threshold, children, nan_right, zero_right, is_zero_missing,
+                    leaves, roots, max_depth):
+        # Node được lưu dưới dạng chỉ số nhân đôi (2 * id) để bước duyệt chỉ còn
+        # node = child[node + go_right]; các mảng theo node được nhân đôi tương ứng.
+        self.n_internal = n_internal
+        self.split_feature = np.repeat(split_feature, 2)
+        self.threshold = np.repeat(threshold, 2)
+        self.child = (2 * children).astype(np.intp)
+        self.nan_right = np.repeat(nan_right, 2)
+        self.zero_right = np.repeat(zero_right, 2)
+        self.is_zero_missing = np.repeat(is_zero_missing, 2)
+        self.has_zero_missing = bool(is_zero_missing.any())
+        self.leaf_value = np.concatenate([np.zeros(n_internal), leaves]).repeat(2)
+        self.roots = 2 * roots
+        self.max_depth = max_depth
+
+    def to_arrays(self):
+        """
+        Bảng cây dạng gọn để lưu (artifact.py): chỉ node trong, không nhân đôi, kiểu số hẹp nhất đủ dùng.
+        Trả về (info JSON được, {tên: mảng}); from_arrays() dựng lại engine y hệt mà không cần dump_model.
+        """
+        internal = slice(0, 2 * self.n_internal, 2)
+        info = {
+            'feature_names': list(self.feature_names),
+            'sigmoid': self.sigmoid,
+            'average_output': bool(self.average_output),
+            'categories': {col: list(cats) for col, cats in self.categories.items()},
+            'n_internal': int(self.n_internal),
+            'max_depth': int(self.max_depth),
+            'cat_group_features': [int(feat) for feat, _ in self.cat_groups],
+        }
+        arrays = {
+            'split_feature': self.split_feature[internal].astype(np.int32),
+            'threshold': self.threshold[internal],
+            'children': (self.child[:2 * self.n_internal] // 2).astype(np.int32),
+            # bit 0: nan_right, bit 1: zero_right, bit 2: is_zero_missing
+            'missing_flags': (self.nan_right[internal] | (self.zero_right[internal] << 1)
+                              | (self.is_zero_missing[internal] << 2)).astype(np.uint8),
+            'leaf_value': self.leaf_value[2 * self.n_internal::2],
+            'roots': (self.roots // 2).astype(np.int32),
+            'cat_bitsets': self.cat_bitsets,
+        }
+        for k, (_, table) in enumerate(self.cat_groups):
+            arrays[f'cat_table_{k}'] = table.astype(np.uint8)
+        return info, arrays
+
+    @classmethod
+    def from_arrays(cls, info, arrays):
+        """Dựng engine từ to_arrays() (mảng có thể là view trên memory-map, chỉ được đọc)."""
+        engine = cls.__new__(cls)
+        engine.feature_names = list(info['feature_names'])
+        engine.n_features = len(engine.feature_names)
+        engine.sigmoid = float(info['sigmoid'])
+        engine.average_output = info['average_output']
+        engine.categories = {col: list(cats) for col, cats in info['categories'].items()}
+        engine.cat_groups = [
+            (feat, np.asarray(arrays[f'cat_table_{k}'], dtype=np.float64))
+            for k, feat in enumerate(info['cat_group_features'])
+        ]
+        engine.cat_bitsets = np.array(arrays['cat_bitsets'])
+
+        n_internal = info['n_internal']
+        leaves = np.asarray(arrays['leaf_value'], dtype=np.float64)
+        n_nodes = n_internal + len(leaves)
+        split_feature = np.zeros(n_nodes, dtype=np.intp)
+        split_feature[:n_internal] = arrays['split_feature']
+        threshold = np.full(n_nodes, np.inf)
+        threshold[:n_internal] = arrays['threshold']
+        children = np.repeat(np.arange(n_nodes, dtype=np.intp), 2)
+        children[:2 * n_internal] = arrays['children']
+        flags = np.zeros(n_nodes, dtype=np.uint8)
+        flags[:n_internal] = arrays['missing_flags']
+        engine._set_tables(
+            n_internal, split_feature, threshold, children, (flags & 1).astype(bool), (flags & 2).astype(bool),
+            (flags & 4).astype(bool), leaves, np.asarray(arrays['roots'], dtype=np.intp), info['max_depth'],
+        )
+        return engine
+
+    def _expand(self, X):
+        """Ghép thêm các feature ảo 0/1 (1 = rẽ phải) cho từng split categorical."""
+        if not self.cat_groups:
+            return X
+        parts = [X]
+        for feat, table in self.cat_groups:
+            # Giống static_cast<int> của LightGBM: NaN/âm/ngoài bảng -> dòng cuối (rẽ phải)
+            values = X[:, feat]
+            invalid = len(table) - 1
+            codes = np.where((values > -1) & (values < invalid), values, invalid).astype(np.intp)
+            parts.append(table[codes])
+        return np.hstack(parts)
+
+    def predict_raw(self, X):
+        """Raw score (log-odds) cho ma trận số X shape (n_rows, n_features) hoặc 1 dòng (n_features,)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        has_nan = np.isnan(X).any()
+        Xe = self._expand(X)
+        n_rows, n_cols = Xe.shape
+        if n_rows == 1:
+            flat, node = Xe[0], self.roots.copy()
+            feature = self.split_feature
+        else:
+            flat, node = Xe.ravel(), np.repeat(self.roots[None, :], n_rows, axis=0)
+            # Cộng offset của dòng trực tiếp vào chỉ số feature
+            row_offset = (np.arange(n_rows, dtype=np.intp) * n_cols)[:, None]
+
+        for _ in range(self.max_depth):
+            if n_rows == 1:
+                fval = flat[feature[node]]
+            else:
+                fval = flat[row_offset + self.split_feature[node]]
+            go_right = fval > self.threshold[node]
+            if has_nan:
+                nan_mask = np.isnan(fval)
+                go_right[nan_mask] = self.nan_right[node[nan_mask]]
+            if self.has_zero_missing:
+                zero_mask = self.is_zero_missing[node] & (np.abs(fval) <= ZERO_THRESHOLD)
+                go_right[zero_mask] = self.zero_right[node[zero_mask]]
+            node = self.child[node + go_right]
+
+        # Cộng dồn tuần tự theo thứ tự cây (như LightGBM) để khớp từng bit, thay vì sum() kiểu pairwise
+        raw = np.cumsum(self.leaf_value[node], axis=-1)[..., -1].reshape(n_rows)
+        if self.average_output:
+            raw /= len(self.roots)
+        return raw
+
+    def encode(self, df):
+        """Chuyển DataFrame (cột category dạng chuỗi) sang ma trận float theo mã category lúc train."""
+        X = np.empty((len(df), self.n_features), dtype=np.float64)
+        for j, col in enumerate(self.feature_names):
+            if col in self.categories:
+                # Category lạ/thiếu -> NaN (giống cách LightGBM căn chỉnh category của pandas)
+                mapping = self._category_codes(col)
+                X[:, j] = [mapping.get(v, np.nan) for v in df[col]]
+            else:
+                X[:, j] = df[col].to_numpy(dtype=np.float64)
+        return X
+
+    def _category_codes(self, col):
+        if not hasattr(self, '_code_maps'):
+            self._code_maps = {c: {v: i for i, v in enumerate(cats)} for c, cats in self.categories.items()}
+        return self._code_maps[col]
+
+    def predict_proba(self, X):
+        """Giống LGBMClassifier.predict_proba: trả về mảng (n_rows, 2). X là ma trận số hoặc DataFrame."""
+        if hasattr(X, 'columns'):
+            X = self.encode(X)
+        # math.exp (libm, giống std::exp của LightGBM) thay cho np.exp (SIMD) để khớp từng bit
+        margin = -self.sigmoid * self.predict_raw(X)
+        prob = 1.0 / (1.0 + np.fromiter(map(math.exp, margin), dtype=np.float64, count=len(margin)))
+        return np.column_stack([1.0 - prob, prob])
+
+def random_sample(engine, n_rows=2000, seed=42):
+    """
+    Sinh tập mẫu để kiểm tra parity: giá trị số lấy quanh các ngưỡng split (kể cả NaN),
+    giá trị categorical gồm cả category lạ và thiếu.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.empty((n_rows, len(engine.feature_names)), dtype=np.float64)
+    for j in range(len(engine.feature_names)):
+        internal = slice(0, 2 * engine.n_internal, 2)
+        thr = engine.threshold[internal][engine.split_feature[internal] == j]
+        if engine.feature_names[j] in engine.categories:
+            X[:, j] = rng.integers(-1, len(engine.categories[engine.feature_names[j]]) + 2, n_rows)
+        elif len(thr):
+            X[:, j] = rng.choice(thr, n_rows) + rng.choice([-1e-9, 0.0, 1e-9], n_rows) * np.abs(rng.choice(thr, n_rows))
+        else:
+            X[:, j] = rng.normal(size=n_rows)
+        X[rng.random(n_rows) < 0.05, j] = np.nan
+        X[rng.random(n_rows) < 0.02, j] = 0.0
+    return X
+
+def check_parity(model, engine, X, atol=0.0):
+    """So sánh xác suất của engine với model.predict_proba trên tập mẫu X (ma trận đã mã hóa)."""
+    booster = getattr(model, 'booster_', model)
+    expected = booster.predict(X)
+    actual = engine.predict_proba(X)[:, 1]
+    max_diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    return {'rows': len(X), 'max_abs_diff': max_diff, 'passed': max_diff <= atol}
+
+if __name__ == "__main__":
+    import joblib
+    model = joblib.load(MODEL_PATH)
+    meta_path = os.path.join(os.path.dirname(MODEL_PATH), 'model_metadata_v3.pkl')
+    cat_feats = joblib.load(meta_path).get('cat_features', []) if os.path.exists(meta_path) else []
+
+    engine = CompiledTreeEnsemble.from_model(model, cat_feats)
+    print(f"Đã biên dịch {len(engine.roots)} cây, {engine.n_internal} node, độ sâu tối đa {engine.max_depth}")
+
+    X = random_sample(engine)
+    result = check_parity(model, engine, X)
+    print(f"Parity với predict_proba trên {result['rows']} dòng: max |diff| = {result['max_abs_diff']:.2e} -> {'OK' if result['passed'] else 'FAIL'}")
+
+    # Đo độ trễ chấm 1 dòng: engine NumPy, booster trên ma trận và đường phục vụ hiện tại (DataFrame)
+    import pandas as pd
+    row = np.nan_to_num(X[:1], nan=0.0).astype(np.float32)
+    df = pd.DataFrame(row.astype(np.float64), columns=engine.feature_names)
+    for col, cats in engine.categories.items():
+        df[col] = pd.Categorical.from_codes([int(row[0, engine.feature_names.index(col)]) % len(cats)], categories=cats)
+    for name, fn in [('numpy engine (float32)', lambda: engine.predict_proba(row)),
+                     ('lightgbm booster (float32)', lambda: model.booster_.predict(row)),
+                     ('LGBMClassifier.predict_proba (DataFrame)', lambda: model.predict_proba(df))]:
+        fn()
+        start = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{name}: {(time.perf_counter() - start) / 200 * 1e6:.1f} µs / dòng")
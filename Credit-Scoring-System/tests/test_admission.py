@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from admission import AdmissionMiddleware, ComputeExecutor, Overloaded  # noqa: E402
+
+def test_cancelled_awaits_release_queue_slots():
+    executor = ComputeExecutor(max_workers=1, max_queue=3)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        waiters = [asyncio.ensure_future(executor.run(lambda: None)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert executor.queued() == 3
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert executor.queued() == 0
+        release.set()
+        await blocker
+        # Hàng đợi không còn "đầy ảo": nhận tác vụ mới bình thường
+        assert await executor.run(lambda: 42) == 42
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+    assert executor.queued() == 0 and executor.running() == 0
+
+def test_full_queue_is_rejected_with_429():
+    executor = ComputeExecutor(max_workers=1, max_queue=2)
+    release = threading.Event()
+    try:
+        futures = [executor.submit(release.wait)]
+        time.sleep(0.05)
+        futures += [executor.submit(lambda: None) for _ in range(2)]
+        with pytest.raises(Overloaded) as exc:
+            executor.submit(lambda: None)
+        assert exc.value.reason == "queue_full" and exc.value.status_code == 429 and exc.value.retry_after >= 1
+        # Tác vụ nội bộ (micro-batch) không bị giới hạn
+        futures.append(executor.submit(lambda: None, bounded=False))
+    finally:
+        release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert executor.stats()["rejected"] == {"queue_full": 1, "deadline": 0}
+
+def test_expired_deadline_is_rejected_with_503_without_running():
+    executor = ComputeExecutor(max_workers=1)
+    calls = []
+    future = executor.submit(calls.append, 1, deadline=time.monotonic() - 1)
+
+    exc = future.exception(timeout=5)
+    assert isinstance(exc, Overloaded) and exc.reason == "deadline" and exc.status_code == 503
+    assert calls == [] and executor.stats()["rejected"]["deadline"] == 1
+
+def test_middleware_sheds_predict_posts_with_retry_after():
+    app = FastAPI()
+    overloaded = [Overloaded("queue_full", retry_after=7)]
+
+    @app.post("/predict")
+    async def predict(payload: dict):
+        return {"ok": True}
+
+    @app.get("/predict")
+    async def predict_info():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, check=lambda: overloaded[0], paths=("/predict",))
+    client = TestClient(app)
+
+    response = client.post("/predict", json={"AMT_INCOME_TOTAL": 1})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "7" and response.json()["reason"] == "queue_full"
+    # Chỉ POST vào đúng path bị chặn
+    assert client.get("/predict").status_code == 200
+
+    overloaded[0] = None
+    assert client.post("/predict", json={"AMT_INCOME_TOTAL": 1}).json() == {"ok": True}
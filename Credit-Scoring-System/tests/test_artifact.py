@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_CORE = os.path.join(ROOT, 'model_core')
+sys.path.insert(0, MODEL_CORE)
+
+from artifact import ArtifactError, export_artifact, load_artifact, read_artifact  # noqa: E402
+from tree_engine import check_parity, random_sample  # noqa: E402
+
+def _trained_model(seed=0, n=800):
+    """Booster nhỏ + metadata giống script train (feature, cột category, từ điển category, ngưỡng)."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'AMT_INCOME_TOTAL': rng.gamma(3.0, 3e7, n),
+        'NAME_FAMILY_STATUS': pd.Categorical(rng.choice(['Married', 'Single / not married', 'Widow'], n)),
+        'EXT_SOURCE_2': np.where(rng.random(n) < 0.1, np.nan, rng.random(n)),
+    })
+    y = (rng.random(n) < 0.3 * (1 - df['EXT_SOURCE_2'].fillna(0.5)) + 0.1 * (df['NAME_FAMILY_STATUS'] == 'Widow')).astype(int)
+    booster = lgb.train({'objective': 'binary', 'num_leaves': 7, 'verbose': -1, 'seed': seed}, lgb.Dataset(df, y), 25)
+    metadata = {
+        'features': list(df.columns),
+        'cat_features': ['NAME_FAMILY_STATUS'],
+        'categories': {'NAME_FAMILY_STATUS': list(df['NAME_FAMILY_STATUS'].cat.categories)},
+        'preprocessing': {'replace_inf': True, 'fill_na': None},
+        'threshold': 0.15,
+        'training': {'oof_auc': 0.7},
+    }
+    return booster, metadata
+
+def test_import_lightgbm_keeps_sklearn_integration_usable():
+    # Tiến trình mới: import_lightgbm chỉ tránh sklearn khi lightgbm chưa được import
+    script = textwrap.dedent("""
+        import sys
+        from artifact import import_lightgbm
+        lgb = import_lightgbm()
+        assert 'sklearn' not in sys.modules
+        lgb.Booster
+        import numpy as np
+        from sklearn.base import BaseEstimator
+        from lightgbm import LGBMClassifier
+        X = np.random.default_rng(0).random((200, 3))
+        y = (X[:, 0] > 0.5).astype(int)
+        clf = LGBMClassifier(n_estimators=3, verbose=-1).fit(X, y)
+        assert isinstance(clf, BaseEstimator) and clf.predict_proba(X).shape == (200, 2)
+        lgb.cv({'objective': 'binary', 'verbose': -1}, lgb.Dataset(X, y), num_boost_round=2, nfold=2, stratified=True)
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=MODEL_CORE, check=True, timeout=120)
+
+def test_artifact_round_trip_keeps_model_metadata_and_engine(tmp_path):
+    booster, metadata = _trained_model()
+    path = str(tmp_path / 'model.artifact')
+    export_artifact(booster, metadata, path)
+
+    loaded, loaded_metadata, engine = load_artifact(path, engine=True)
+
+    assert loaded.model_to_string() == booster.model_to_string()
+    for key, value in metadata.items():
+        assert loaded_metadata[key] == value
+    X = random_sample(engine, n_rows=500, seed=1)
+    assert np.array_equal(loaded.predict(X), booster.predict(X))
+    assert check_parity(booster, engine, X)['passed']
+
+def test_corrupted_artifact_is_rejected(tmp_path):
+    booster, metadata = _trained_model(seed=1)
+    path = str(tmp_path / 'model.artifact')
+    export_artifact(booster, metadata, path)
+    read_artifact(path)
+
+    # Lật 1 byte trong section cuối (bảng cây engine)
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    with pytest.raises(ArtifactError, match='SHA-256'):
+        load_artifact(path)
+
+def test_export_refuses_model_and_metadata_from_different_runs(tmp_path):
+    booster, metadata = _trained_model(seed=2)
+    path = tmp_path / 'model.artifact'
+    mismatched = dict(metadata, features=metadata['features'] + ['DAYS_BIRTH'])
+
+    with pytest.raises(ArtifactError):
+        export_artifact(booster, mismatched, str(path))
+    assert not path.exists() and list(tmp_path.iterdir()) == []
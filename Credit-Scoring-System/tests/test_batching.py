@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from admission import Overloaded  # noqa: E402
+from batching import MicroBatcher  # noqa: E402
+
+def _batch(n):
+    return [(i, Future(), time.monotonic(), None) for i in range(n)]
+
+def test_cancelled_future_does_not_block_rest_of_batch():
+    seen = []
+    batcher = MicroBatcher(lambda items: seen.append(items) or [item * 10 for item in items])
+    batch = _batch(3)
+    batch[0][1].cancel()
+
+    batcher._process(batch)
+
+    assert seen == [[1, 2]]
+    assert [f.result(timeout=1) for _, f, _, _ in batch[1:]] == [10, 20]
+
+def test_cancelled_future_does_not_block_batch_error():
+    def fail(items):
+        raise ValueError("boom")
+    batch = _batch(3)
+    batch[1][1].cancel()
+
+    MicroBatcher(fail)._process(batch)
+
+    for i in (0, 2):
+        assert isinstance(batch[i][1].exception(timeout=1), ValueError)
+
+def test_drop_expired_skips_cancelled_futures():
+    batcher = MicroBatcher(lambda items: items)
+    started = time.monotonic()
+    batch = [(i, Future(), started, started - 1) for i in range(3)]
+    batch[0][1].cancel()
+
+    assert batcher._drop_expired(batch, started) == []
+    for _, future, _, _ in batch[1:]:
+        assert isinstance(future.exception(timeout=1), Overloaded)
+
+def test_submit_resolves_after_cancelled_request():
+    batcher = MicroBatcher(lambda items: [item * 10 for item in items])
+    futures = [batcher.submit(i) for i in range(3)]
+    futures[0].cancel()
+    assert [f.result(timeout=5) for f in futures[1:]] == [10, 20]
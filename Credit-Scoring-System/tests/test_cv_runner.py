@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_core'))
+
+import dataset_cache  # noqa: E402
+from cv_runner import run_cv  # noqa: E402
+
+PARAMS = {'n_estimators': 80, 'learning_rate': 0.1, 'num_leaves': 15, 'min_child_samples': 10, 'verbose': -1, 'random_state': 0}
+
+def _training_frame(n=1500, seed=0):
+    """Dữ liệu train giả: 1 cột category, cột số có NaN, nhãn lệch như dữ liệu vỡ nợ."""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        'housing': pd.Categorical(rng.choice(['own', 'rent', 'parents'], n)),
+        'ext_source': rng.random(n),
+        'annuity_ratio': rng.gamma(2.0, 0.1, n),
+        'days_employed': rng.integers(-15000, 0, n).astype(float),
+    })
+    X.loc[rng.random(n) < 0.15, 'ext_source'] = np.nan
+    logit = -2.5 + 2 * (1 - X['ext_source'].fillna(0.5)) + 3 * X['annuity_ratio'] + (X['housing'] == 'rent')
+    y = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    return X, y
+
+@pytest.mark.parametrize('use_dataset_cache', [False, True])
+def test_cv_results_do_not_depend_on_thread_count(use_dataset_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, 'DATASET_CACHE_DIR', str(tmp_path))
+    X, y = _training_frame()
+
+    runs = [
+        run_cv(X, y, PARAMS, n_splits=3, cat_features=['housing'], early_stopping_rounds=10,
+               n_parallel=n_parallel, threads_per_fold=threads, use_dataset_cache=use_dataset_cache)
+        for n_parallel, threads in [(1, 1), (1, 4), (3, 2)]
+    ]
+
+    assert runs[0]['dataset_cache'] == use_dataset_cache and runs[2]['n_parallel'] == 3
+    for cv in runs[1:]:
+        assert np.array_equal(cv['oof_preds'], runs[0]['oof_preds'])
+        assert cv['best_iterations'] == runs[0]['best_iterations']
+        assert cv['fold_auc'] == runs[0]['fold_auc']
+    # Kết quả chỉ được đảm bảo khi fold train với deterministic + force_col_wise (CV_DETERMINISTIC)
+    model_str = runs[2]['models'][0].model_to_string()
+    assert '[deterministic: 1]' in model_str and '[force_col_wise: 1]' in model_str
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'model_core'))
+
+from registry import ModelRegistry  # noqa: E402
+
+def test_watcher_survives_invalid_version_name():
+    model_dir = tempfile.mkdtemp()
+    try:
+        registry = ModelRegistry(model_dir, ["base", "v3"])
+        reloaded = []
+
+        def reload(name):
+            reloaded.append(name)
+            future = Future()
+            future.set_result(None)
+            return future
+
+        registry.reload = reload
+        registry.watch(0.01)
+        # File của v3 xuất hiện sau khi "base" đã lỗi -> watcher vẫn phải thấy và nạp lại
+        time.sleep(0.05)
+        for prefix in ("lgbm_credit_model_v3", "model_metadata_v3"):
+            open(os.path.join(model_dir, f"{prefix}.pkl"), "wb").close()
+        deadline = time.monotonic() + 5
+        while not reloaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert registry._watcher.is_alive()
+        assert set(reloaded) == {"v3"}
+        assert registry.errors["base"]["error"].startswith("ValueError")
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from result_cache import ResultCache  # noqa: E402
+from scoring import INPUT_FIELDS, fallback_response  # noqa: E402
+
+def _application(income=9e7, **overrides):
+    values = dict.fromkeys(INPUT_FIELDS, 0.0)
+    values.update(AMT_INCOME_TOTAL=income, NAME_HOUSING_TYPE='Rented apartment', NAME_FAMILY_STATUS='Married')
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+def test_key_depends_on_fields_explain_mode_and_model():
+    cache = ResultCache()
+    key = cache.key(_application(), 'top3', 'v3')
+
+    assert cache.key(_application(), 'top3', 'v3') == key
+    assert cache.key(_application(income=9e7 + 1), 'top3', 'v3') != key
+    assert cache.key(_application(), 'full', 'v3') != key
+    assert cache.key(_application(), 'top3', 'focused') != key
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_size=2)
+    keys = [cache.key(_application(income=9e7 + i), 'top3') for i in range(3)]
+    cache.put(keys[0], {"status": "APPROVE"})
+    cache.put(keys[1], {"status": "REJECT"})
+    assert cache.get(keys[0]) == {"status": "APPROVE"}
+
+    cache.put(keys[2], {"status": "APPROVE"})
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats()["evictions"] == 1 and len(cache) == 2
+
+def test_entries_expire_after_ttl():
+    cache = ResultCache(max_size=10, ttl_seconds=0.05)
+    key = cache.key(_application(), 'top3')
+    cache.put(key, {"status": "APPROVE"})
+    assert cache.get(key) == {"status": "APPROVE"}
+
+    time.sleep(0.1)
+
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1 and stats["size"] == 0 and stats["hits"] == 1 and stats["misses"] == 1
+
+def test_new_version_clears_cache_and_changes_keys():
+    cache = ResultCache()
+    cache.set_version((1, 0.15))
+    key = cache.key(_application(), 'top3')
+    cache.put(key, {"status": "APPROVE"})
+
+    cache.set_version((1, 0.2))
+
+    assert len(cache) == 0 and cache.stats()["invalidations"] == 1
+    assert cache.key(_application(), 'top3') != key
+
+def test_fallback_and_disabled_cache_store_nothing():
+    cache = ResultCache()
+    key = cache.key(_application(), 'top3')
+    cache.put(key, fallback_response())
+    assert cache.get(key) is None
+
+    disabled = ResultCache(max_size=0)
+    disabled.put(key, {"status": "APPROVE"})
+    assert len(disabled) == 0 and not disabled.stats()["enabled"]
@@ -0,0 +1,118 @@
+import os
+import sys
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'model_core'))
+
+from processing import RATIO_FEATURES, FeaturePipeline, add_ratio_features, category_vocabulary  # noqa: E402
+from scoring import (  # noqa: E402
+    FINAL_THRESHOLD, INPUT_FIELDS, MAX_DTI, MAX_LOAN_TERM_MONTHS, MIN_INCOME, RULE_PASS,
+    BoosterPredictor, NativeExplainer, check_hard_rules, get_top_reasons, rule_rejection, score_applications,
+)
+
+CAT_FEATURES = ['NAME_HOUSING_TYPE', 'NAME_FAMILY_STATUS']
+FEATURES = INPUT_FIELDS + ['EXT_SOURCE_3'] + RATIO_FEATURES
+HOUSING = ['House / apartment', 'Rented apartment', 'With parents']
+FAMILY = ['Married', 'Single / not married', 'Widow']
+
+def _applications(n, seed):
+    """Hồ sơ ngẫu nhiên, thu nhập/khoản trả quanh các ngưỡng HARD RULES."""
+    rng = np.random.default_rng(seed)
+    income = rng.choice([MIN_INCOME * 12 - 1, MIN_INCOME * 12, 9e7, 2e8, 5e8], n)
+    annuity = np.round(income / 12 * rng.choice([-0.1, 0.0, 0.05, 0.2, MAX_DTI, 0.61], n))
+    credit = annuity * rng.choice([12, 100, MAX_LOAN_TERM_MONTHS, MAX_LOAN_TERM_MONTHS + 1], n)
+    return {
+        'AMT_INCOME_TOTAL': income.tolist(),
+        'AMT_CREDIT': credit.tolist(),
+        'AMT_ANNUITY': annuity.tolist(),
+        'DAYS_BIRTH': rng.integers(-25000, -7000, n).astype(float).tolist(),
+        'DAYS_EMPLOYED': rng.integers(-15000, 1, n).astype(float).tolist(),
+        # 'Office apartment' không có lúc train -> category lạ
+        'NAME_HOUSING_TYPE': rng.choice(HOUSING + ['Office apartment'], n).tolist(),
+        'NAME_FAMILY_STATUS': rng.choice(FAMILY, n).tolist(),
+        'EXT_SOURCE_2': rng.random(n).tolist(),
+    }
+
+def _frame(columns):
+    """DataFrame giống /predict cũ: EXT_SOURCE_3 = EXT_SOURCE_2, cột categorical và 4 cột tỷ lệ."""
+    df = pd.DataFrame(columns)
+    df['EXT_SOURCE_3'] = df['EXT_SOURCE_2']
+    return add_ratio_features(df)
+
+@pytest.fixture(scope='module')
+def scorer():
+    columns = _applications(2000, seed=0)
+    df = _frame(columns)
+    df['NAME_HOUSING_TYPE'] = pd.Categorical(df['NAME_HOUSING_TYPE'], categories=HOUSING)
+    df['NAME_FAMILY_STATUS'] = pd.Categorical(df['NAME_FAMILY_STATUS'], categories=FAMILY)
+    rng = np.random.default_rng(1)
+    y = (rng.random(len(df)) < 0.05 + 0.3 * (1 - df['EXT_SOURCE_2'])).astype(int)
+    params = {'objective': 'binary', 'num_leaves': 7, 'min_data_in_leaf': 20, 'verbose': -1, 'seed': 0}
+    booster = lgb.train(params, lgb.Dataset(df[FEATURES], y, categorical_feature=CAT_FEATURES), num_boost_round=20)
+    pipeline = FeaturePipeline(FEATURES, CAT_FEATURES, category_vocabulary(df, CAT_FEATURES))
+    return booster, pipeline
+
+def _predict_row(columns, i, booster):
+    """Bản chấm từng dòng theo /predict trước khi vector hóa (luật vô hướng + DataFrame 1 dòng)."""
+    income, credit, annuity = (columns[f][i] for f in ('AMT_INCOME_TOTAL', 'AMT_CREDIT', 'AMT_ANNUITY'))
+    if annuity <= 0:
+        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Số tiền trả hàng tháng không hợp lệ."}
+    term_months = credit / annuity
+    if term_months > MAX_LOAN_TERM_MONTHS:
+        return {"status": "REJECT", "probability": 1.0, "threshold": FINAL_THRESHOLD, "credit_score": 300, "message": f"Thời gian vay quá dài ({term_months/12:.1f} năm).", "reasons": ["Vi phạm chính sách thời hạn vay (Nhiều nhất 30 năm)"]}
+    if income < MIN_INCOME * 12:
+        return {"status": "REJECT", "probability": 1.0, "credit_score": 300, "message": "Thu nhập không đủ điều kiện.", "reasons": ["Thu nhập dưới chuẩn tối thiểu"]}
+    dti_ratio = annuity / (income / 12)
+    if dti_ratio > MAX_DTI:
+        return {"status": "REJECT", "probability": 0.9, "credit_score": 350, "message": f"Gánh nặng nợ quá lớn ({dti_ratio:.1%}).", "reasons": ["Tỷ lệ Trả nợ/Thu nhập vượt quá 60%"]}
+
+    df = _frame({f: [columns[f][i]] for f in INPUT_FIELDS})
+    for col in CAT_FEATURES:
+        df[col] = df[col].astype('category')
+    df = df[FEATURES]
+    prob_default = booster.predict(df)[0]
+    target_shap = booster.predict(df, pred_contrib=True)[0, :-1]
+    status = "REJECT" if prob_default >= FINAL_THRESHOLD else "APPROVE"
+    reasons = get_top_reasons(target_shap, FEATURES, is_reject=(status == "REJECT"))
+    if prob_default <= FINAL_THRESHOLD:
+        score = int(850 - (prob_default / FINAL_THRESHOLD) * 150)
+    else:
+        score = int(700 - ((prob_default - FINAL_THRESHOLD) / (1 - FINAL_THRESHOLD)) * 400)
+    msg = f"Hồ sơ Rất Tốt. Rủi ro: ({prob_default:.1%})" if status == "APPROVE" else f"Rủi ro cao ({prob_default:.1%})."
+    return {
+        "status": status, "probability": float(prob_default), "threshold": float(FINAL_THRESHOLD),
+        "credit_score": max(score, 300), "message": msg, "reasons": reasons,
+    }
+
+def test_hard_rules_match_per_row_checks():
+    columns = _applications(500, seed=2)
+    rule, term_months, dti_ratio = check_hard_rules(
+        columns['AMT_INCOME_TOTAL'], columns['AMT_CREDIT'], columns['AMT_ANNUITY']
+    )
+    assert set(rule.tolist()) == {0, 1, 2, 3, 4}
+    for i in np.flatnonzero(rule != RULE_PASS):
+        assert rule_rejection(rule[i], term_months[i], dti_ratio[i]) == _predict_row(columns, i, booster=None)
+
+def test_batch_scoring_matches_per_row_baseline(scorer):
+    booster, pipeline = scorer
+    columns = _applications(300, seed=3)
+    results = score_applications(columns, BoosterPredictor(booster), NativeExplainer(booster), pipeline)
+
+    assert any(r["status"] == "APPROVE" for r in results) and any("threshold" in r for r in results)
+    assert results == [_predict_row(columns, i, booster) for i in range(300)]
+
+def test_batch_scoring_matches_single_requests(scorer):
+    booster, pipeline = scorer
+    model, explainer = BoosterPredictor(booster), NativeExplainer(booster)
+    columns = _applications(100, seed=4)
+    single = [
+        score_applications({f: [columns[f][i]] for f in INPUT_FIELDS}, model, explainer, pipeline)[0]
+        for i in range(100)
+    ]
+    assert score_applications(columns, model, explainer, pipeline) == single
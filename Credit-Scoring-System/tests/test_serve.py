@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from serve import worker_compute_concurrency  # noqa: E402
+
+def test_compute_threads_are_split_across_workers():
+    assert worker_compute_concurrency(4, cpus=8) == 2
+    assert worker_compute_concurrency(3, cpus=8) == 2
+    # Nhiều worker hơn CPU: mỗi worker vẫn có 1 luồng tính
+    assert worker_compute_concurrency(4, cpus=2) == 1
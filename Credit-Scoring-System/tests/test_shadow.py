@@ -0,0 +1,49 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from admission import ComputeExecutor  # noqa: E402
+from shadow import ShadowScorer  # noqa: E402
+
+class RecordingShadow(ShadowScorer):
+    """Ghi lại mẫu thay vì chấm bằng model ứng viên."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scored = []
+
+    def score_batch(self, batch):
+        self.scored.extend(application for application, _, _ in batch)
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_shadow_sampling_resumes_after_cancelled_request():
+    compute = ComputeExecutor(max_workers=1, max_queue=8)
+    shadow = RecordingShadow(None, ["candidate"], sample_rate=1.0, max_wait_ms=1,
+                             busy=lambda: compute.queued() > 0)
+    release = threading.Event()
+    try:
+        blocker = compute.submit(release.wait)
+        assert _wait_for(lambda: compute.running() == 1)
+
+        waiting = compute.submit(lambda: None)
+        shadow.submit("busy", {}, "v3")
+        assert shadow.dropped["busy"] == 1
+
+        # Client bỏ đi trước khi tác vụ được tính
+        assert waiting.cancel()
+        assert compute.queued() == 0
+        shadow.submit("after-cancel", {}, "v3")
+        assert shadow.dropped["busy"] == 1
+        assert _wait_for(lambda: shadow.scored == ["after-cancel"])
+    finally:
+        release.set()
+    blocker.result(timeout=5)
+    assert compute.queued() == 0 and compute.running() == 0
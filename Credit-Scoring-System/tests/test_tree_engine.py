@@ -0,0 +1,63 @@
+import os
+import sys
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_core'))
+
+from tree_engine import CompiledTreeEnsemble, check_parity, random_sample  # noqa: E402
+
+COLORS = ['blue', 'green', 'red', 'white', 'black', 'grey']
+
+def _booster(zero_as_missing, n=3000, seed=0):
+    """Booster nhỏ có split categorical, cột có NaN và (tùy chọn) coi 0 là giá trị thiếu."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'color': pd.Categorical(rng.choice(COLORS, n), categories=COLORS),
+        'income': rng.normal(size=n),
+        'ratio': rng.choice([0.0, 0.5, 1.0, 2.0], n) + rng.random(n),
+    })
+    df.loc[rng.random(n) < 0.2, 'income'] = np.nan
+    df.loc[rng.random(n) < 0.1, 'ratio'] = 0.0
+    logit = df['color'].isin(['red', 'black']) * 1.5 + df['income'].fillna(2.0) - df['ratio']
+    y = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    params = {
+        'objective': 'binary', 'num_leaves': 15, 'min_data_in_leaf': 10, 'min_data_per_group': 5,
+        'cat_smooth': 1, 'zero_as_missing': zero_as_missing, 'verbose': -1, 'seed': seed,
+    }
+    return lgb.train(params, lgb.Dataset(df, y), num_boost_round=30), df
+
+@pytest.mark.parametrize('zero_as_missing', [False, True])
+def test_engine_matches_lightgbm_on_categorical_and_missing_splits(zero_as_missing):
+    booster, _ = _booster(zero_as_missing)
+    engine = CompiledTreeEnsemble.from_model(booster, cat_features=['color'])
+    dump = booster.dump_model()
+    decisions = {node['decision_type'] for node in _internal_nodes(dump)}
+    missing = {node['missing_type'] for node in _internal_nodes(dump)}
+    assert '==' in decisions and ('Zero' if zero_as_missing else 'NaN') in missing
+
+    # Mẫu sát ngưỡng split, có NaN, 0, mã category âm và ngoài từ điển
+    result = check_parity(booster, engine, random_sample(engine, n_rows=3000, seed=1))
+    assert result['passed'], result
+
+def test_engine_encodes_unseen_and_missing_categories_like_lightgbm():
+    booster, df = _booster(zero_as_missing=False)
+    engine = CompiledTreeEnsemble.from_model(booster, cat_features=['color'])
+    sample = df.head(200).copy()
+    sample['color'] = sample['color'].astype(object)
+    sample.loc[::7, 'color'] = 'purple'
+    sample.loc[::11, 'color'] = None
+
+    expected = booster.predict(sample.astype({'color': 'category'}))
+    assert np.array_equal(engine.predict_proba(sample)[:, 1], expected)
+
+def _internal_nodes(dump):
+    stack = [tree['tree_structure'] for tree in dump['tree_info']]
+    while stack:
+        node = stack.pop()
+        if 'split_feature' in node:
+            yield node
+            stack += [node['left_child'], node['right_child']]